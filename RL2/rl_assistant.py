@@ -1,139 +1,45 @@
 import streamlit as st
-from markitdown import MarkItDown
-import requests
-import io
-from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-import openai
-from typing import TypedDict, List, Dict, Any
-from langchain_core.messages import BaseMessage
 import json
 import os
-from langsmith import Client
 import uuid
 from datetime import datetime
-import time
+import sys
 
-class ChatState(TypedDict):
-    messages: List[BaseMessage]
-    support_analysis: str
+# 将仓库根目录加入导入路径，以便使用两个应用共用的 cvrl_core
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cvrl_core.parse_cache import get_parse_cache
+from cvrl_core.engine import available_models, pipeline_thread, setup_engine
+from cvrl_core.ingest import ingest_files
+from cvrl_core.dedup import DEFAULT_THRESHOLD, deduplicate
+from cvrl_core.streaming import format_timing
+from cvrl_core.routing import format_model_stats
+from cvrl_core.llm_clients import get_openai_client, pool_stats
+from cvrl_core.tracing import recent_runs
+from cvrl_core.prompt_budget import PromptTooLong
+from cvrl_core.retry import is_retryable
+from cvrl_core.prompt_registry import SessionPrompts
+from cvrl_core.map_reduce import DEFAULT_CHUNK_CHARS, DEFAULT_MAX_WORKERS
+from cvrl_core.pipeline import StageStore, continue_from, run_until
+from cvrl_core.rl_pipeline import STAGE_LABELS, build_rl_graph
+import time
 
 st.set_page_config(page_title="个人RL写作助手", layout="wide")
 
-# 读取API KEY
-api_key = st.secrets.get("OPENROUTER_API_KEY", "")
-
-# 读取LangSmith配置（从secrets或环境变量）
-langsmith_api_key = st.secrets.get("LANGSMITH_API_KEY", os.environ.get("LANGSMITH_API_KEY", ""))
-langsmith_project = st.secrets.get("LANGSMITH_PROJECT", os.environ.get("LANGSMITH_PROJECT", "cv-assistant"))
-
-# 设置LangSmith环境变量
-if langsmith_api_key:
-    os.environ["LANGCHAIN_TRACING_V2"] = "true"
-    os.environ["LANGCHAIN_API_KEY"] = langsmith_api_key
-    os.environ["LANGCHAIN_PROJECT"] = langsmith_project
-
-# 初始化LangSmith客户端（如果配置了API Key）
-langsmith_client = None
-if langsmith_api_key:
-    try:
-        langsmith_client = Client(api_key=langsmith_api_key)
-        # 创建项目（如果不存在）
-        projects = langsmith_client.list_projects()
-        project_names = [p.name for p in projects]
-        if langsmith_project not in project_names:
-            try:
-                langsmith_client.create_project(langsmith_project)
-            except Exception as e:
-                # 如果是409冲突（项目已存在），忽略这个错误
-                if "409" in str(e) or "Conflict" in str(e) or "already exists" in str(e):
-                    pass  # 项目已存在，不需要处理
-                else:
-                    st.warning(f"LangSmith项目创建失败: {str(e)}")
-    except Exception as e:
-        st.warning(f"LangSmith初始化失败: {str(e)}")
+# 按secrets配置连接池、上下文预算、LangSmith追踪和LLM响应缓存（均为进程级缓存，重跑脚本不会重复初始化）
+engine = setup_engine(st.secrets)
+if engine.langsmith_init_error:
+    st.warning(f"LangSmith初始化失败: {engine.langsmith_init_error}")
+api_key = engine.api_key
+langsmith_api_key = engine.langsmith_api_key
+langsmith_project = engine.langsmith_project
+langsmith_client = engine.langsmith_client
+tracer = engine.tracer
+response_cache = engine.response_cache
 
 # 初始化session state用于存储提示词和文件内容
-if "persona" not in st.session_state:
-    st.session_state.persona = """你是一位经验丰富的推荐信写作专家，专门为申请国外高校的中国学生撰写高质量的推荐信。请根据我提供的学生信息和推荐人信息，创作一篇真实、具体、有说服力的推荐信，突出学生的学术能力、个人品质和发展潜力。即使素材中包含了一些非积极的内容，你也会转换表述方式，确保全篇表述百分百积极肯定被推荐人，不暗示推荐人参与较少或与被推荐人互动不足或暗示被推荐人能力不足的内容。
-"""
-if "task" not in st.session_state:
-    st.session_state.task = """1.请首先阅读第一个agent生成的辅助文档分析报告（如有）
-2.重点深入理解和分析用户上传的素材表，融入辅助文档分析报告的细节进行创作
-3.在开始写作前，先对素材表内容进行有条理的整理与分类： 
-a.区分推荐人的基本信息、与被推荐人的关系、课程/项目经历以及对被推荐人的评价 
-b.将混乱的素材按推荐信四段结构所需内容重新分类组织 
-c.对于不完整或表述不清的信息，进行合理推断并标记为补充内容 
-d.提取每段所需的核心信息，确保信件逻辑连贯、重点突出
-4.素材表中可能包含多位推荐人信息，如用户未明确指定，默认使用第一位推荐人的信息和素材进行写作。请确保不要混淆不同推荐人的素材内容。
-5.用户如输入"请撰写第二位推荐人"的指令一般是指学术推荐人2
-6.推荐信必须以推荐人为第一人称进行写作
-7.推荐信分为两种类型： 
-a.学术推荐信：适用于推荐人是老师或学术导师的情况
-b.工作推荐信：适用于推荐人是工作单位领导或校内辅导员的情况（即使在校内，但互动主要非学术性质）
-8.两种推荐信结构一致，基本为四段： 
-a.第一段：介绍推荐人与被推荐人如何认识
-b.第二段和第三段：作为核心段落，从两个不同方面描述二人互动细节，点明被推荐人展示的能力、品质、性格特点
-c.第四段：表明明确的推荐意愿，对被推荐人未来发展进行预测，并添加客套语如"有疑问或需要更多信息，可与我联系"
-9.第一段介绍时，应遵循以下原则： 
-a.首先表达自己写这封推荐信是为了支持XXX的申请
-b.全面且准确地描述推荐人与被推荐人之间的所有关系（如既是任课老师又是毕业论文导师）
-c.主要关系应放在句首位置（如"作为XXX的[主要关系]，我也曾担任她的[次要关系]"） 
-d.重点描述与被推荐人的互动历程和熟悉程度，而非推荐人个人成就
-e.确保第一段内容简洁明了，为后续段落奠定基础
-10.两种推荐信在第二段和第三段的侧重点不同： 
-a.学术推荐信： 
-●第二段：描述课堂中的互动细节（包括但不限于课堂听讲，做笔记，问答互动，小组讨论，课后互动等） 
-●第三段：描述课外互动细节（包括但不限于推荐人监管下的科研项目经历）
-●注意第二段和第三段为核心段落，必须把描述重点放在被推荐人所担任的职责，采取的行动以及解决问题上，从而展示被推荐人的能力、品质、性格特点
-b.工作推荐信： 
-●第二段：描述工作过程中的互动细节（包括但不限于推荐人监管下的项目或工作内容） 
-●第三段：描述推荐人观察到的被推荐人与他人相处细节，展现性格特点和个人品质
-●注意第二段和第三段为核心段落，必须把描述重点放在被推荐人所担任的职责，采取的行动以及解决问题上，从而展示被推荐人的能力、品质、性格特点
-11.切忌出现不谈细节，只评论的情况：必须基于具体事件细节出发进行创作。
-12.确保第二段和第三段的经历选取不重复
-13.确保第二段和第三段描述的能力、品质或特点不重复，分别突出不同的优势
-14.每个段落必须遵循严格的逻辑结构和内容组织原则： 
-a.段落开头必须有明确的主题句，点明该段将要讨论的核心内容 
-b.段落内容必须按照逻辑顺序展开，可以是时间顺序、重要性顺序或因果关系 
-c.每个事例或论点必须完整展开后再转入下一个，避免跳跃式叙述 
-d.相关内容应集中在一起讨论，避免在段落中反复回到同一话题 
-e.每个补充内容必须直接关联其前文，增强而非打断原有叙述 
-f.段落结尾应有总结性句子，呼应主题句并为下一段做铺垫 
-g.禁止在段落结尾使用转折语或弱化前文内容的表述
-15.补充原则：绝大部分内容需基于素材表，缺失细节允许补充，但禁止补充任何数据和专业操作步骤
-例如：
-●允许补充：【补充：在讨论过程中，XXX在项目中通过深入分析数据进行了预测，展现出了敏锐的分析能力和清晰的逻辑思维】
-●禁止补充：【补充：XXX在项目中处理了5,378条数据，使用了R语言中的随机森林算法进行预测分析】
-16.推荐信中应避免提及被推荐人的不足之处，即使素材表中有相关信息
-17.正文最后一段无需提供邮箱和电话等联系信息
-18.正文最后一段的总结必须与前文所述的具体事例直接关联，确保整封信的连贯性和说服力
-19.推荐信语气应始终保持积极、肯定和自信
-
-重要提醒 
-1.【补充：】标记的使用是绝对强制性要求，所有非素材表中的内容（无论是事实性内容还是细节描述）必须使用【补充：具体内容】完整标记 
-2.用户需求始终是第一位的：若用户要求添加或编造内容，应立即执行
-3.在用户没有明确表示的情况下，必须基于素材表创作
-4.未正确标记补充内容将导致任务完全失败，这是最严重的错误，没有任何例外
-5.在写作前，必须先精确识别素材表中的每一项具体内容，凡是素材表未明确提供的内容，无论是细节还是上下文，都必须标记为补充
-6.在写作过程中，对每句话进行自查：问自己"这一内容是否直接出现在素材表中"，如有任何不确定，就必须使用【补充：】标记
-7.宁可过度标记也不可漏标：即使只是对素材表内容的轻微扩展或合理推断，也必须使用【补充：】标记 
-
-内容真实性标准
-1.用户授权优先：若用户明确要求添加或编造特定内容，应无条件执行
-2.默认状态下，所有段落中的事实内容应基于素材表
-3.【补充：具体内容】标记用于标记非素材表中的事实性内容，便于用户识别
-4.不需使用【补充：】标记的内容仅限于：逻辑连接词、对素材的分析反思、重新组织或表述已有信息
-5.在没有用户明确授权的情况下，避免编造关键事实：如具体项目/课程、研究方法/技术、具体成就/结果、任何类型的数据
-6.在素材有限的情况下，应适当添加与学生专业和申请方向相符的具体细节，以丰富推荐信内容，但所有补充内容必须与素材表提供的基本信息保持一致性
-7.在素材较多的情况下，应进行筛选，选择最贴合申请专业或者专业深度深（如未提供申请专业相关信息）的经历
-8.每个补充内容必须有明确的逻辑依据，不得凭空捏造或做出与素材表明显不符的联想
-"""
-if "output_format" not in st.session_state:
-    st.session_state.output_format = """请以中文输出一封完整的推荐信，直接从正文开始（无需包含信头如日期和收信人），以"尊敬的招生委员会："开头，以"此致 敬礼"结尾，并在最后只添加推荐人姓名，无需包含任何具体的职位和联系方式（包括但不限于联系电话及电子邮箱。
-在补充素材表没有的细节时必须使用【补充：XXXX】标记
-"""
+# 提示词只引用进程内共享的默认版本，修改过的条目才在会话中保存副本
+if "prompts" not in st.session_state:
+    st.session_state.prompts = SessionPrompts("rl")
 if "resume_content" not in st.session_state:
     st.session_state.rl_content = ""
 if "support_files_content" not in st.session_state:
@@ -158,78 +64,23 @@ if "recommendation_letter" not in st.session_state:
     st.session_state.recommendation_letter = ""
 if "recommendation_letter_generated" not in st.session_state:
     st.session_state.recommendation_letter_generated = False
-
-# 新增：支持文件分析agent的提示词
-if "support_analyst_persona" not in st.session_state:
-    st.session_state.support_analyst_persona = """您是一位专业的文档分析专家，擅长从各类文件中提取和整合信息。您的任务是分析用户上传的辅助文档（如项目海报、报告或作品集），并生成标准化报告，用于简历顾问后续处理。您具备敏锐的信息捕捉能力和系统化的分析方法，能够从复杂文档中提取关键经历信息。"""
-if "support_analyst_task" not in st.session_state:
-    st.session_state.support_analyst_task = """经历分类： 
-● 科研项目经历：包括课题研究、毕业论文、小组科研项目等学术性质的活动 
-● 实习工作经历：包括正式工作、实习、兼职等与就业相关的经历 
-● 课外活动经历：包括学生会、社团、志愿者、比赛等非学术非就业的活动经历
-文件分析工作流程：
-1.仔细阅读所有上传文档，不遗漏任何页面和部分内容
-2.识别文档中所有经历条目，无论是否完整
-3.将多个文档中的相关信息进行交叉比对和整合
-4.为每个经历创建独立条目，保留所有细节
-5.按照下方格式整理每类经历，并按时间倒序排列
-
-信息整合策略： 
-● 多文件整合：系统性关联所有辅助文档信息，确保全面捕捉关键细节 
-● 团队项目处理：对于团队项目，明确关注个人在团队中的具体职责和贡献，避免笼统描述团队成果 
-● 内容优先级：专业知识与能力 > 可量化成果 > 职责描述 > 个人感受 
-● 表达原则：简洁精准、专业导向、成果突显、能力凸显
-"""
-if "support_analyst_output_format" not in st.session_state:
-    st.session_state.support_analyst_output_format = """辅助文档分析报告
-【科研经历】 
-经历一： [项目名称]
-时间段：[时间] 
-组织：[组织名称] 
-角色：[岗位/角色]（如有缺失用[未知]标记） 
-核心信息：
-●[项目描述] 具体内容
-●[使用技术/方法] 具体内容
-●[个人职责] 具体内容
-●[项目成果] 具体内容 信息完整度评估：[完整/部分完整/不完整] 缺失信息：[列出缺失的关键信息]
-
-经历二： [按照相同格式列出]
-
-【实习工作经历】 
-经历一： 
-时间段：[时间] 
-组织：[组织名称] 
-角色：[岗位/角色]（如有缺失用[未知]标记） 
-核心信息：
-●[工作职责] 具体内容
-●[使用技术/工具] 具体内容
-●[解决问题] 具体内容
-●[工作成果] 具体内容 信息完整度评估：[完整/部分完整/不完整] 缺失信息：[列出缺失的关键信息]
-
-经历二： [按照相同格式列出]
-
-【课外活动经历】 
-经历一： 
-时间段：[时间] 
-组织：[组织名称] 
-角色：[岗位/角色]（如有缺失用[未知]标记） 
-核心信息：
-●[活动描述] 具体内容
-●[个人职责] 具体内容
-●[使用能力] 具体内容
-●[活动成果] 具体内容 信息完整度评估：[完整/部分完整/不完整] 缺失信息：[列出缺失的关键信息]
-
-经历二： [按照相同格式列出]
-注意：如果用户未上传任何辅助文档，请直接回复："未检测到辅助文档，无法生成文档分析报告。"
-"""
+if "agent_timings" not in st.session_state:
+    st.session_state.agent_timings = {}
+# 限流排队时按会话轮转，每个会话使用固定的标识
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+# 各阶段输出按其输入指纹保存，输入未变化的阶段直接复用
+if "stage_store" not in st.session_state:
+    st.session_state.stage_store = StageStore()
+if "reuse_stage_results" not in st.session_state:
+    st.session_state.reuse_stage_results = True
+# 支持文件较多或较大时，逐个文件（片段）并行分析后再合并
+if "support_map_reduce" not in st.session_state:
+    st.session_state.support_map_reduce = False
 
 # 获取模型列表（从secrets读取，逗号分隔）
 def get_model_list():
-    model_str = st.secrets.get("OPENROUTER_MODEL", "")
-    if model_str:
-        return [m.strip() for m in model_str.split(",") if m.strip()]
-    else:
-        return ["qwen/qwen-max", "deepseek/deepseek-chat-v3-0324:free", "qwen-turbo", "其它模型..."]
+    return available_models(st.secrets)
 
 # 保存提示词到Streamlit session state（立即生效）
 def save_prompts():
@@ -243,83 +94,80 @@ def load_prompts():
     # 这个函数保留用于未来扩展
     return True
 
-# 读取文件内容函数
-def read_file(file):
-    try:
-        file_bytes = file.read()
-        file_stream = io.BytesIO(file_bytes)
-        md = MarkItDown()
-        raw_content = md.convert(file_stream)
-        return raw_content
-    except Exception as e:
-        return f"[MarkItDown 解析失败: {e}]"
+# 读取文件内容函数：素材表和支持文件在进程池中并行解析，按上传顺序返回（解析出的文本保存在临时文件中）
+def read_files(files):
+    files = list(files)
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def on_file_done(done, total, name, status):
+        progress_bar.progress(int(done * 100 / total))
+        status_text.text(f"正在解析文档 ({done}/{total})：{name} - {status}")
+    
+    contents = ingest_files(
+        files,
+        max_workers=int(st.secrets.get("INGEST_MAX_WORKERS", 4)),
+        timeout=float(st.secrets.get("INGEST_TIMEOUT", 120)),
+        on_progress=on_file_done
+    )
+    status_text.text(f"文档解析完成，共 {len(files)} 个文件")
+    return contents
 
 # 生成推荐信的函数
-def generate_recommendation_letter(report):
-    """根据报告生成正式的推荐信"""
-    if "letter_generator_persona" not in st.session_state:
-        st.session_state.letter_generator_persona = """你是一位经验丰富的推荐信写作专家，专门负责从分析报告生成最终的推荐信。你擅长将详细的分析转化为专业、有力且符合学术惯例的推荐信。"""
-    if "letter_generator_task" not in st.session_state:
-        st.session_state.letter_generator_task = """请根据提供的推荐信报告内容，生成一封正式、专业的推荐信。你的任务是：
-1. 仔细阅读报告中的所有内容，特别注意已经标记为【补充】的部分
-2. 保持原报告的核心内容和关键事例，但以更专业、更正式的语言重新表述
-3. 消除所有【补充：xxx】标记，将其内容无缝融入推荐信中
-4. 确保推荐信语气专业、积极，且符合学术推荐信的写作规范
-5. 维持推荐信的四段结构：介绍关系、学术/工作表现、个人品质、总结推荐
-6. 润色语言，使推荐信更加流畅、连贯、有说服力"""
-    if "letter_generator_output_format" not in st.session_state:
-        st.session_state.letter_generator_output_format = """请输出一封完整的推荐信，直接从正文开始（无需包含信头如日期和收信人），以"尊敬的招生委员会："开头，以"此致 敬礼"结尾，并在最后添加推荐人姓名。请不要包含任何【补充】标记。"""
+def generate_recommendation_letter(report, stream_to=None):
+    """根据报告生成正式的推荐信，stream_to 不为空时边生成边显示"""
     
     # 使用用户选择的模型
     if "selected_letter_generator_model" not in st.session_state:
         model_list = get_model_list()
         st.session_state.selected_letter_generator_model = model_list[0]
     
-    # 构建系统提示和用户提示
-    system_prompt = f"{st.session_state.letter_generator_persona}\n\n{st.session_state.letter_generator_task}\n\n{st.session_state.letter_generator_output_format}"
-    user_prompt = f"根据以下报告生成正式的推荐信：\n\n{report}"
-    
     # 调用API (使用run_agent以确保LangSmith追踪)
     start_time = time.time()
+    queue_status["area"] = stream_to
     with st.spinner("正在生成推荐信..."):
         try:
-            # 构建完整的提示词
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            
             # 生成主运行ID
             master_run_id = str(uuid.uuid4())
+            reused_stages = []
             
-            # 在LangSmith中记录主运行开始（如果启用）
-            if langsmith_client:
-                try:
-                    langsmith_client.create_run(
-                        name="推荐信生成",
-                        run_type="chain",
-                        inputs={"report": report[:500] + "..." if len(report) > 500 else report},
-                        project_name=langsmith_project,
-                        run_id=master_run_id,
-                        extra={"model": st.session_state.selected_letter_generator_model}
-                    )
-                except Exception as e:
-                    st.warning(f"LangSmith主运行创建失败: {str(e)}")
+            # 在LangSmith中记录主运行开始（如果启用，后台异步上报）
+            if tracer:
+                tracer.start_run(
+                    master_run_id,
+                    "推荐信生成",
+                    "chain",
+                    {"report": report[:500] + "..." if len(report) > 500 else report},
+                    extra={"model": st.session_state.selected_letter_generator_model}
+                )
             
-            result_content = run_agent(
-                "letter_generator", 
-                st.session_state.selected_letter_generator_model,
-                full_prompt,
-                master_run_id
+            # 从报告流水线暂停处继续执行推荐信生成节点；检查点不存在时以现有报告为起点
+            state = continue_from(
+                build_rl_graph(),
+                st.session_state.get("pipeline_thread_id") or str(uuid.uuid4()),
+                {
+                    "letter_generator_model": st.session_state.selected_letter_generator_model,
+                    "letter_generator_persona": st.session_state.prompts["letter_generator_persona"],
+                    "letter_generator_task": st.session_state.prompts["letter_generator_task"],
+                    "letter_generator_output_format": st.session_state.prompts["letter_generator_output_format"],
+                    "master_run_id": master_run_id
+                },
+                ui={"letter_area": stream_to, "on_stage_reused": reused_stages.append},
+                fallback_values={"run_id": master_run_id, "support_analysis": "", "report": report},
+                as_node="rl_assistant",
+                stage_store=current_stage_store(),
+                run_agent=run_agent,
+                gather_agents=gather_agents
             )
+            result_content = state["letter"]
+            st.session_state.letter_reused = bool(reused_stages)
             
-            # 在LangSmith中记录主运行结束（如果启用）
-            if langsmith_client:
-                try:
-                    langsmith_client.update_run(
-                        run_id=master_run_id,
-                        outputs={"recommendation_letter": result_content[:500] + "..." if len(result_content) > 500 else result_content},
-                        end_time=datetime.now()
-                    )
-                except Exception as e:
-                    st.warning(f"LangSmith主运行更新失败: {str(e)}")
+            # 在LangSmith中记录主运行结束（如果启用，后台异步上报）
+            if tracer:
+                tracer.end_run(
+                    master_run_id,
+                    outputs={"recommendation_letter": result_content[:500] + "..." if len(result_content) > 500 else result_content}
+                )
             
             end_time = time.time()
             generation_time = end_time - start_time
@@ -329,70 +177,69 @@ def generate_recommendation_letter(report):
             st.error(f"生成推荐信时出错: {str(e)}")
             return None, 0
 
+# 本次运行使用的阶段结果存储，关闭复用时返回 None 强制重新计算
+def current_stage_store():
+    return st.session_state.stage_store if st.session_state.get("reuse_stage_results", True) else None
+
 # 处理模型调用
 def process_with_model(support_analyst_model, rl_assistant_model, rl_content, support_files_content, 
                       persona, task, output_format, 
                       support_analyst_persona, support_analyst_task, support_analyst_output_format,
-                      writing_requirements=""):
-    # 主运行ID
-    master_run_id = str(uuid.uuid4())
+                      writing_requirements="", support_map_reduce=False):
+    inputs = {
+        "support_analyst_model": support_analyst_model,
+        "rl_assistant_model": rl_assistant_model,
+        "rl_content": rl_content,
+        "support_files_content": support_files_content,
+        "persona": persona,
+        "task": task,
+        "output_format": output_format,
+        "support_analyst_persona": support_analyst_persona,
+        "support_analyst_task": support_analyst_task,
+        "support_analyst_output_format": support_analyst_output_format,
+        "writing_requirements": writing_requirements,
+        "support_map_reduce": support_map_reduce,
+        "support_chunk_chars": int(st.secrets.get("SUPPORT_CHUNK_CHARS", DEFAULT_CHUNK_CHARS)),
+        "support_map_workers": int(st.secrets.get("SUPPORT_MAP_WORKERS", DEFAULT_MAX_WORKERS))
+    }
+    
+    # 输入不变时沿用上一次的thread，上次运行失败则从失败的阶段继续；输入变化时开启新的thread
+    st.session_state.pipeline_thread_id, st.session_state.pipeline_fingerprint = pipeline_thread(
+        inputs,
+        st.session_state.get("pipeline_thread_id"),
+        st.session_state.get("pipeline_fingerprint")
+    )
     
     # 显示处理进度
     progress_bar = st.progress(0)
     status_text = st.empty()
+    reused_stages = []
+    
+    def on_stage_reused(stage_name):
+        reused_stages.append(stage_name)
+        status_text.text(f"{STAGE_LABELS[stage_name]}的输入未变化，复用上次结果")
     
+    def on_prompt_truncated(stage_name, section_names):
+        st.warning(f"⚠️ {STAGE_LABELS[stage_name]}的输入超出模型上下文预算，已截断：{'、'.join(section_names)}")
+    
+    queue_status["area"] = status_text
     try:
         start_time = datetime.now()
         
-        # 步骤1: 处理支持文件
-        status_text.text("第一步：分析支持文件...")
-        progress_bar.progress(10)
-        
-        # 构建支持文件分析提示词
-        support_files_text = ""
-        for i, content in enumerate(support_files_content):
-            support_files_text += f"\n\n支持文件{i+1}:\n{content}"
-        
-        support_prompt = f"""人物设定：{support_analyst_persona}
-\n任务描述：{support_analyst_task}
-\n输出格式：{support_analyst_output_format}
-\n推荐信素材表内容：
-{rl_content}
-\n支持文件内容：
-{support_files_text}
-"""
-        
-        # 调用支持文件分析agent
-        support_analysis = run_agent(
-            "support_analyst", 
-            support_analyst_model,
-            support_prompt,
-            master_run_id
+        state = run_until(
+            build_rl_graph(),
+            st.session_state.pipeline_thread_id,
+            {"run_id": str(uuid.uuid4())},
+            inputs,
+            ui={"progress_bar": progress_bar, "status_text": status_text, "on_stage_reused": on_stage_reused,
+                "on_prompt_truncated": on_prompt_truncated},
+            stop_before="letter_generator",
+            stage_store=current_stage_store(),
+            run_agent=run_agent,
+            gather_agents=gather_agents
         )
-        st.session_state.support_analysis = support_analysis
-        
-        progress_bar.progress(40)
-        status_text.text("第二步：生成推荐信报告...")
-        
-        # 步骤2: 生成推荐信报告
-        rl_prompt = f"""人物设定：{persona}
-\n任务描述：{task}
-\n输出格式：{output_format}
-\n推荐信素材表内容：
-{rl_content}
-\n支持文件分析：
-{support_analysis}
-\n写作需求：
-{writing_requirements}
-"""
-        
-        report = run_agent(
-            "rl_assistant", 
-            rl_assistant_model,
-            rl_prompt,
-            master_run_id
-        )
-        st.session_state.report = report
+        st.session_state.support_analysis = state["support_analysis"]
+        report = state["report"]
         
         # 计算总耗时
         end_time = datetime.now()
@@ -408,10 +255,22 @@ def process_with_model(support_analyst_model, rl_assistant_model, rl_content, su
         
         # 显示处理结果
         st.success(f"报告生成成功！总耗时 {int(total_time)} 秒")
+        if reused_stages:
+            st.caption("复用了输入未变化的步骤：" + "、".join(STAGE_LABELS[name] for name in reused_stages))
+    
+    except PromptTooLong as e:
+        # 发送前即发现超出上下文窗口，无需查看调用栈
+        progress_bar.progress(100)
+        status_text.text("输入内容过长，未发送请求")
+        st.error(f"处理失败: {str(e)}。请减少素材内容或选择上下文更大的模型")
     
     except Exception as e:
         progress_bar.progress(100)
-        status_text.text("处理失败！")
+        status_text.text("处理失败！再次点击\"开始生成\"将从出错的步骤继续")
+        if is_retryable(e):
+            # 限流、服务端错误或超时，重试额度用完后仍未恢复，无需查看调用栈
+            st.error(f"模型服务暂时不可用，已多次重试仍失败: {str(e)}。已完成的步骤已保留，请稍后再试")
+            return
         st.error(f"处理失败: {str(e)}")
         st.error("详细错误信息：")
         import traceback
@@ -420,11 +279,8 @@ def process_with_model(support_analyst_model, rl_assistant_model, rl_content, su
 # 处理单个完成调用
 def get_completion(system_prompt, user_prompt, model, temperature=0.7):
     try:
-        # 使用openai库调用OpenRouter API (新版本语法)
-        client = openai.OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1"
-        )
+        # 使用openai库调用OpenRouter API，复用进程内共享的客户端
+        client = get_openai_client(api_key)
         response = client.chat.completions.create(
             model=model,
             messages=[
@@ -437,57 +293,44 @@ def get_completion(system_prompt, user_prompt, model, temperature=0.7):
     except Exception as e:
         raise Exception(f"模型调用失败: {str(e)}")
 
+# 调用耗时记录到 session_state，在界面上显示
+def _record_timing(agent_name, timing):
+    st.session_state.agent_timings[agent_name] = timing
+
+# 等待限流额度时在当前的进度区域显示排队位置（area 由正在运行的步骤设置）
+queue_status = {"area": None}
+
+def _show_queue_position(agent_name, position):
+    area = queue_status["area"]
+    if area is None:
+        return
+    if position:
+        area.text(f"模型调用繁忙，正在排队：前面还有 {position - 1} 个请求")
+        queue_status["queued"] = True
+    elif queue_status.pop("queued", False):
+        area.text("已轮到本次请求，正在调用模型...")
+
+agent_runner = engine.agent_runner(
+    session_id=st.session_state.session_id,
+    on_queue=_show_queue_position,
+    on_timing=_record_timing,
+    trace_run_type="llm",
+    trace_unparented=True,
+    trace_max_chars=1000
+)
+
 # 运行单个Agent的函数
-def run_agent(agent_name, model, prompt, parent_run_id=None):
-    # 创建agent运行ID
-    agent_run_id = str(uuid.uuid4())
-    # 在LangSmith中记录agent运行开始（如果启用）
-    if langsmith_client:
-        try:
-            metadata = {
-                "model": model,
-                "agent": agent_name,
-                "timestamp": datetime.now().isoformat()
-            }
-            # 记录agent运行
-            create_run_params = {
-                "name": f"{agent_name}",
-                "run_type": "llm",
-                "inputs": {"prompt": prompt[:1000] + "..." if len(prompt) > 1000 else prompt},
-                "project_name": langsmith_project,
-                "run_id": agent_run_id,
-                "extra": metadata
-            }
-            if parent_run_id:
-                create_run_params["parent_run_id"] = parent_run_id
-            
-            langsmith_client.create_run(**create_run_params)
-        except Exception as e:
-            st.warning(f"LangSmith运行创建失败: {str(e)}")
-    # 创建 LLM 实例
-    llm = ChatOpenAI(
-        api_key=api_key,
-        base_url="https://openrouter.ai/api/v1",
-        model=model,
-        temperature=0.7,
-        # 确保LangSmith追踪配置正确传递
-        model_name=model,  # 明确指定模型名称用于追踪
-    )
-    # 使用 langchain 的 ChatOpenAI 处理信息
-    messages = [HumanMessage(content=prompt)]
-    result = llm.invoke(messages)
-    # 在LangSmith中记录LLM调用结果（如果启用）
-    if langsmith_client:
-        try:
-            # 更新agent运行结果
-            langsmith_client.update_run(
-                run_id=agent_run_id,
-                outputs={"response": result.content[:1000] + "..." if len(result.content) > 1000 else result.content},
-                end_time=datetime.now()
-            )
-        except Exception as e:
-            st.warning(f"LangSmith更新运行结果失败: {str(e)}")
-    return result.content
+# stream_to 为 Streamlit 占位元素时，以流式方式边生成边写入该元素
+# use_cache=False 时本次调用不读写响应缓存
+def run_agent(agent_name, model, prompt, parent_run_id=None, stream_to=None, use_cache=True):
+    # 关闭"复用未变化阶段的结果"时视为强制重新生成，同样跳过响应缓存
+    use_cache = use_cache and st.session_state.get("reuse_stage_results", True)
+    return agent_runner(agent_name, model, prompt, parent_run_id, stream_to=stream_to, use_cache=use_cache)
+
+# 并发执行多个互不依赖的调用（如分块分析支持文件），按顺序返回结果
+def gather_agents(calls, on_done=None):
+    use_cache = st.session_state.get("reuse_stage_results", True)
+    return agent_runner.gather(calls, on_done=on_done, use_cache=use_cache)
 
 # Tab布局 - 增加TAB2用于提示词调试
 TAB1, TAB2, TAB3 = st.tabs(["文件上传与分析", "提示词调试", "系统状态"])
@@ -599,6 +442,15 @@ with TAB1:
                                       height=120)
     st.session_state.writing_requirements = writing_requirements
     
+    st.checkbox(
+        "复用未变化步骤的结果（只重新运行输入或提示词有变化的步骤）",
+        key="reuse_stage_results"
+    )
+    st.checkbox(
+        "逐个分析支持文件后再合并（文件较多或较大时更快，也不会超出模型上下文）",
+        key="support_map_reduce"
+    )
+    
     # 添加按钮区域
     if st.session_state.get("processing_complete", False):
         col1, col2 = st.columns(2)
@@ -630,16 +482,20 @@ with TAB1:
             support_analyst_model = st.session_state.get("selected_support_analyst_model", get_model_list()[0])
             rl_assistant_model = st.session_state.get("selected_rl_assistant_model", get_model_list()[0])
             
-            # 读取文件内容
-            rl_content = read_file(rl_file)
-            st.session_state.rl_content = rl_content
-            
-            support_files_content = []
-            if support_files:
-                for f in support_files:
-                    content = read_file(f)
-                    support_files_content.append(content)
-            st.session_state.support_files_content = support_files_content
+            # 读取文件内容（素材表与支持文件一起并行解析）
+            uploads = [rl_file] + list(support_files or [])
+            all_contents = read_files(uploads)
+            # 跳过与素材表或前面的支持文件重复的支持文件（完全相同或内容高度相似）
+            support_contents, duplicates = deduplicate(
+                all_contents, [f.name for f in uploads], float(st.secrets.get("DEDUP_NEAR_THRESHOLD", DEFAULT_THRESHOLD))
+            )
+            if duplicates:
+                st.info("以下支持文件与其他上传文件重复，已跳过：\n" + "\n".join(
+                    f"- {d.name}：{d.reason}" for d in duplicates
+                ))
+            # 素材表全文都要放入提示词，读为字符串；支持文件保留为按页读取的文档
+            st.session_state.rl_content = str(all_contents[0])
+            st.session_state.support_files_content = support_contents
             
             # 处理并显示结果
             process_with_model(
@@ -647,13 +503,14 @@ with TAB1:
                 rl_assistant_model,
                 st.session_state.rl_content, 
                 st.session_state.support_files_content,
-                st.session_state.persona,
-                st.session_state.task,
-                st.session_state.output_format,
-                st.session_state.support_analyst_persona,
-                st.session_state.support_analyst_task,
-                st.session_state.support_analyst_output_format,
-                st.session_state.writing_requirements
+                st.session_state.prompts["persona"],
+                st.session_state.prompts["task"],
+                st.session_state.prompts["output_format"],
+                st.session_state.prompts["support_analyst_persona"],
+                st.session_state.prompts["support_analyst_task"],
+                st.session_state.prompts["support_analyst_output_format"],
+                st.session_state.writing_requirements,
+                support_map_reduce=st.session_state.support_map_reduce
             )
     
     # 显示已生成的报告（如果存在）
@@ -668,20 +525,29 @@ with TAB1:
         # 生成推荐信按钮
         col1, col2 = st.columns([1, 3])
         with col1:
-            if st.button("生成正式推荐信", key="generate_final_letter", use_container_width=True):
-                letter, letter_gen_time = generate_recommendation_letter(st.session_state.report)
-                if letter:
-                    st.session_state.recommendation_letter = letter
-                    st.session_state.recommendation_letter_generated = True
-                    st.session_state.letter_generation_time = letter_gen_time
-                    st.success(f"推荐信已生成，用时 {letter_gen_time:.2f} 秒")
-                    st.rerun()  # 刷新页面以显示新生成的推荐信
+            generate_letter_clicked = st.button("生成正式推荐信", key="generate_final_letter", use_container_width=True)
+        
+        if generate_letter_clicked:
+            # 推荐信在按钮下方整行区域内边生成边显示
+            st.markdown("---")
+            st.markdown("**最终推荐信：**")
+            letter_area = st.empty()
+            letter, letter_gen_time = generate_recommendation_letter(st.session_state.report, stream_to=letter_area)
+            if letter:
+                st.session_state.recommendation_letter = letter
+                st.session_state.recommendation_letter_generated = True
+                st.session_state.letter_generation_time = letter_gen_time
+                st.rerun()  # 刷新页面以显示新生成的推荐信
         
         # 显示已生成的推荐信（如果存在）
         if st.session_state.get("recommendation_letter_generated", False) and st.session_state.get("recommendation_letter", ""):
             st.markdown("---")
             st.markdown("**最终推荐信：**")
             st.markdown(st.session_state.recommendation_letter)
+            if st.session_state.get("letter_reused", False):
+                st.caption("报告与推荐信生成提示词均未变化，已复用上次生成的推荐信")
+            else:
+                st.caption(f"推荐信生成用时 {st.session_state.get('letter_generation_time', 0):.2f} 秒（{format_timing(st.session_state.agent_timings.get('letter_generator'))}）")
             
             # 添加下载按钮
             st.download_button(
@@ -715,7 +581,7 @@ with TAB2:
         # 人物设定
         st.text_area(
             "人物设定", 
-            value=st.session_state.support_analyst_persona, 
+            value=st.session_state.prompts["support_analyst_persona"], 
             height=150,
             key="support_analyst_persona_editor"
         )
@@ -723,7 +589,7 @@ with TAB2:
         # 任务描述
         st.text_area(
             "任务描述", 
-            value=st.session_state.support_analyst_task, 
+            value=st.session_state.prompts["support_analyst_task"], 
             height=300,
             key="support_analyst_task_editor"
         )
@@ -731,16 +597,16 @@ with TAB2:
         # 输出格式
         st.text_area(
             "输出格式", 
-            value=st.session_state.support_analyst_output_format, 
+            value=st.session_state.prompts["support_analyst_output_format"], 
             height=300,
             key="support_analyst_output_format_editor"
         )
         
         # 保存按钮
         if st.button("保存支持文件分析Agent设置", key="save_support_analyst"):
-            st.session_state.support_analyst_persona = st.session_state.support_analyst_persona_editor
-            st.session_state.support_analyst_task = st.session_state.support_analyst_task_editor
-            st.session_state.support_analyst_output_format = st.session_state.support_analyst_output_format_editor
+            st.session_state.prompts["support_analyst_persona"] = st.session_state.support_analyst_persona_editor
+            st.session_state.prompts["support_analyst_task"] = st.session_state.support_analyst_task_editor
+            st.session_state.prompts["support_analyst_output_format"] = st.session_state.support_analyst_output_format_editor
             st.success("✅ 支持文件分析Agent设置已保存并立即生效")
             st.info("💡 提示：修改将在下次运行时使用新的提示词")
     
@@ -760,7 +626,7 @@ with TAB2:
         # 人物设定
         st.text_area(
             "人物设定", 
-            value=st.session_state.persona, 
+            value=st.session_state.prompts["persona"], 
             height=150,
             key="persona_editor"
         )
@@ -768,7 +634,7 @@ with TAB2:
         # 任务描述
         st.text_area(
             "任务描述", 
-            value=st.session_state.task, 
+            value=st.session_state.prompts["task"], 
             height=300,
             key="task_editor"
         )
@@ -776,16 +642,16 @@ with TAB2:
         # 输出格式
         st.text_area(
             "输出格式", 
-            value=st.session_state.output_format, 
+            value=st.session_state.prompts["output_format"], 
             height=300,
             key="output_format_editor"
         )
         
         # 保存按钮
         if st.button("保存推荐信助手Agent设置", key="save_rl_assistant"):
-            st.session_state.persona = st.session_state.persona_editor
-            st.session_state.task = st.session_state.task_editor
-            st.session_state.output_format = st.session_state.output_format_editor
+            st.session_state.prompts["persona"] = st.session_state.persona_editor
+            st.session_state.prompts["task"] = st.session_state.task_editor
+            st.session_state.prompts["output_format"] = st.session_state.output_format_editor
             st.success("✅ 推荐信助手Agent设置已保存并立即生效")
             st.info("💡 提示：修改将在下次运行时使用新的提示词")
     
@@ -793,18 +659,6 @@ with TAB2:
         st.subheader("推荐信生成Agent提示词调试")
         
         # 确保letterGenerator相关的session_state变量已初始化
-        if "letter_generator_persona" not in st.session_state:
-            st.session_state.letter_generator_persona = """你是一位经验丰富的推荐信写作专家，专门负责从分析报告生成最终的推荐信。你擅长将详细的分析转化为专业、有力且符合学术惯例的推荐信。"""
-        if "letter_generator_task" not in st.session_state:
-            st.session_state.letter_generator_task = """请根据提供的推荐信报告内容，生成一封正式、专业的推荐信。你的任务是：
-1. 仔细阅读报告中的所有内容，特别注意已经标记为【补充】的部分
-2. 保持原报告的核心内容和关键事例，但以更专业、更正式的语言重新表述
-3. 消除所有【补充：xxx】标记，将其内容无缝融入推荐信中
-4. 确保推荐信语气专业、积极，且符合学术推荐信的写作规范
-5. 维持推荐信的四段结构：介绍关系、学术/工作表现、个人品质、总结推荐
-6. 润色语言，使推荐信更加流畅、连贯、有说服力"""
-        if "letter_generator_output_format" not in st.session_state:
-            st.session_state.letter_generator_output_format = """请输出一封完整的推荐信，直接从正文开始（无需包含信头如日期和收信人），以"尊敬的招生委员会："开头，以"此致 敬礼"结尾，并在最后添加推荐人姓名。请不要包含任何【补充】标记。"""
         if "selected_letter_generator_model" not in st.session_state:
             st.session_state.selected_letter_generator_model = get_model_list()[0]
         
@@ -821,7 +675,7 @@ with TAB2:
         # 人物设定
         st.text_area(
             "人物设定", 
-            value=st.session_state.letter_generator_persona, 
+            value=st.session_state.prompts["letter_generator_persona"], 
             height=150,
             key="letter_generator_persona_editor"
         )
@@ -829,7 +683,7 @@ with TAB2:
         # 任务描述
         st.text_area(
             "任务描述", 
-            value=st.session_state.letter_generator_task, 
+            value=st.session_state.prompts["letter_generator_task"], 
             height=300,
             key="letter_generator_task_editor"
         )
@@ -837,16 +691,16 @@ with TAB2:
         # 输出格式
         st.text_area(
             "输出格式", 
-            value=st.session_state.letter_generator_output_format, 
+            value=st.session_state.prompts["letter_generator_output_format"], 
             height=300,
             key="letter_generator_output_format_editor"
         )
         
         # 保存按钮
         if st.button("保存推荐信生成Agent设置", key="save_letter_generator"):
-            st.session_state.letter_generator_persona = st.session_state.letter_generator_persona_editor
-            st.session_state.letter_generator_task = st.session_state.letter_generator_task_editor
-            st.session_state.letter_generator_output_format = st.session_state.letter_generator_output_format_editor
+            st.session_state.prompts["letter_generator_persona"] = st.session_state.letter_generator_persona_editor
+            st.session_state.prompts["letter_generator_task"] = st.session_state.letter_generator_task_editor
+            st.session_state.prompts["letter_generator_output_format"] = st.session_state.letter_generator_output_format_editor
             st.success("✅ 推荐信生成Agent设置已保存并立即生效")
             st.info("💡 提示：修改将在下次运行时使用新的提示词")
 
@@ -863,6 +717,16 @@ with TAB3:
         st.success("OpenRouter API已配置")
     else:
         st.error("OpenRouter API未配置")
+    http_pool = pool_stats()
+    st.info(f"🔌 复用的模型客户端: {http_pool['chat_models']} 个，连接池上限: {http_pool['max_connections']}（keep-alive {http_pool['max_keepalive_connections']}）")
+    concurrency = engine.limits.stats()
+    st.info(f"⚡ 模型调用并发: 进行中 {concurrency['active']}，排队 {concurrency['waiting']}（全局上限 {concurrency['max_concurrency']}，每个模型 {concurrency['per_model']}）")
+    scheduling = engine.scheduler.stats()
+    if scheduling["per_key"] or scheduling["per_model"] or engine.scheduler.model_rates:
+        st.write(f"- 限流排队: 等待中 {scheduling['waiting']}（{scheduling['sessions']} 个会话），累计放行 {scheduling['granted']}，"
+                 f"曾排队 {scheduling['queued']}，最长等待 {scheduling['max_wait']:.1f} 秒{'（多进程共享额度）' if scheduling['shared'] else ''}")
+    for model_name, model_stats in engine.router.snapshot().items():
+        st.write(f"- {format_model_stats(model_name, model_stats)}")
     
     # 显示LangSmith连接状态
     st.subheader("LangSmith监控")
@@ -896,6 +760,10 @@ with TAB3:
     
     if langsmith_client:
         st.success("🔗 LangSmith客户端已连接")
+        if tracer:
+            st.write(f"📤 追踪事件: 已入队 {tracer.stats['enqueued']}，已发送 {tracer.stats['sent']}，待发送 {tracer.pending()}，丢弃 {tracer.stats['dropped']}，失败 {tracer.stats['failed']}")
+            if tracer.last_error:
+                st.warning(f"⚠️ 最近一次上报失败: {tracer.last_error}")
         
         # 测试连接
         if st.button("🧪 测试LangSmith连接", key="test_langsmith"):
@@ -909,10 +777,8 @@ with TAB3:
         
         # 获取最近的运行记录
         try:
-            runs = list(langsmith_client.list_runs(
-                project_name=langsmith_project,
-                limit=5
-            ))
+            # 运行记录缓存30秒，避免每次重跑页面都请求LangSmith
+            runs = recent_runs(langsmith_api_key, langsmith_project, limit=5)
             if runs:
                 st.write("**最近5次运行:**")
                 for run in runs:
@@ -925,3 +791,47 @@ with TAB3:
     else:
         st.error("❌ LangSmith客户端未初始化")
         st.info("💡 请确保在secrets.toml中正确配置LANGSMITH_API_KEY")
+
+    # 显示各阶段的用时、tokens 和费用（进程内所有会话合计）
+    st.subheader("运行指标")
+    agent_rows = engine.metrics.agent_summary()
+    if agent_rows:
+        st.dataframe(agent_rows, use_container_width=True)
+    else:
+        st.write("- 尚无模型调用记录")
+    for status, parsed in engine.metrics.parse_summary().items():
+        p95 = "超出统计范围" if parsed["p95"] is None else f"≤ {parsed['p95']} 秒"
+        st.write(f"- 文件解析（{status}）: {parsed['files']} 个，共 {parsed['seconds']:.1f} 秒，p95 {p95}")
+    st.download_button(
+        label="导出指标（Prometheus 格式）",
+        data=engine.metrics.to_prometheus(),
+        file_name="cvrl_metrics.prom",
+        mime="text/plain"
+    )
+    
+    # 显示文档解析缓存状态
+    st.subheader("文档解析缓存")
+    parse_cache = get_parse_cache()
+    cache_entries, cache_bytes = parse_cache.disk_usage()
+    st.write(f"- 内存命中: {parse_cache.stats['memory_hits']} 次，磁盘命中: {parse_cache.stats['disk_hits']} 次，未命中: {parse_cache.stats['misses']} 次")
+    st.write(f"- 磁盘缓存: {cache_entries} 个文件，{cache_bytes / 1024 / 1024:.1f} MB")
+    if st.button("清空解析缓存", key="clear_parse_cache"):
+        parse_cache.clear()
+        st.success("✅ 解析缓存已清空")
+    
+    # 显示LLM响应缓存状态
+    st.subheader("LLM响应缓存")
+    if response_cache:
+        response_entries, response_bytes = response_cache.usage()
+        st.write(f"- 命中: {response_cache.stats['hits']} 次，未命中: {response_cache.stats['misses']} 次，写入: {response_cache.stats['writes']} 次")
+        st.write(f"- 已缓存: {response_entries} 条响应，{response_bytes / 1024 / 1024:.1f} MB（有效期 {response_cache.ttl_seconds // 3600} 小时）")
+        if st.button("清空响应缓存", key="clear_response_cache"):
+            response_cache.clear()
+            st.success("✅ 响应缓存已清空")
+    else:
+        st.info("💡 未启用。在secrets.toml中设置 LLM_RESPONSE_CACHE = true 即可开启")
+    
+    # 显示阶段结果复用状态
+    st.subheader("阶段结果复用")
+    stage_store = st.session_state.stage_store
+    st.write(f"- 已保存的阶段结果: {len(stage_store)} 个（复用 {stage_store.stats['hits']} 次，重新计算 {stage_store.stats['misses']} 次）")
@@ -0,0 +1 @@
+"""CV2 / RL2 两个写作助手共用的基础模块（不依赖 Streamlit）。"""
@@ -0,0 +1,155 @@
+"""不依赖 Streamlit 的 Agent 调用。
+
+AgentRunner 的调用签名与两个应用中的 run_agent 相同，可以直接作为
+config["configurable"]["run_agent"] 传给流水线，用于批量处理等无界面场景。
+"""
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from .llm_clients import OPENROUTER_BASE_URL, get_chat_model
+from .prompt_budget import count_tokens
+from .retry import RetryPolicy, retry_details, stage_of
+from .streaming import stream_chat
+
+
+class RateLimiter:
+    """限制每分钟发起的模型调用次数：相邻两次调用的开始时间至少间隔 60 / per_minute 秒"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _clip(text, max_chars):
+    if max_chars and len(text) > max_chars:
+        return text[:max_chars] + "..."
+    return text
+
+
+class AgentRunner:
+    """按 run_agent 约定调用模型。
+
+    on_timing(agent_name, timing) 在每次调用后收到 {"ttft", "total", "prompt_tokens", "completion_tokens"}
+    （命中缓存时另有 "cached": True，重试过时另有 "retries"）；暂时性错误按 retry（retry.RetryPolicy）重试，同一运行中每个阶段共享重试额度；
+    stream_to 为界面元素时，生成过程中显示 text + cursor，结束后显示完整内容，
+    markdown_kwargs 原样传给 stream_to.markdown。
+    trace_unparented 为真时没有父运行的调用也上报追踪，trace_max_chars 限制上报的提示词和输出长度。
+    提供 metrics（metrics.MetricsRegistry）时每次调用的用时、tokens 和费用计入进程内指标。
+    """
+
+    def __init__(self, api_key, tracer=None, response_cache=None, rate_limiter=None,
+                 temperature=0.7, base_url=OPENROUTER_BASE_URL, on_timing=None, cursor="▌",
+                 markdown_kwargs=None, trace_run_type="chain", trace_unparented=False, trace_max_chars=None,
+                 retry=None, metrics=None):
+        self.api_key = api_key
+        self.tracer = tracer
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        self.temperature = temperature
+        self.base_url = base_url
+        self.on_timing = on_timing
+        self.cursor = cursor
+        self.markdown_kwargs = markdown_kwargs or {}
+        self.trace_run_type = trace_run_type
+        self.trace_unparented = trace_unparented
+        self.trace_max_chars = trace_max_chars
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.metrics = metrics
+
+    def _start_trace(self, agent_name, model, prompt, parent_run_id, cache_hit):
+        """开始追踪本次调用，返回 agent_run_id；不需要追踪时返回 None"""
+        if self.tracer is None or not (parent_run_id or self.trace_unparented):
+            return None
+        agent_run_id = str(uuid.uuid4())
+        self.tracer.start_run(
+            agent_run_id,
+            agent_name,
+            self.trace_run_type,
+            {"prompt": _clip(prompt, self.trace_max_chars)},
+            parent_run_id=parent_run_id,
+            extra={"model": model, "agent": agent_name, "response_cache_hit": cache_hit,
+                   "timestamp": datetime.now()}
+        )
+        return agent_run_id
+
+    def _end_trace(self, agent_run_id, content=None, error=None, details=None):
+        """结束追踪；details 中的字段（如实际使用的模型、重试次数）与输出一起上报"""
+        if agent_run_id is None:
+            return
+        if error is not None:
+            self.tracer.end_run(agent_run_id, outputs=details, error=str(error))
+        else:
+            self.tracer.end_run(agent_run_id, outputs={"response": _clip(content, self.trace_max_chars), **(details or {})})
+
+    def _count_tokens(self, timing, prompt, content):
+        """把服务端返回的 usage 换成 timing 中的 tokens 数，未返回 usage 时按 count_tokens 估算"""
+        usage = timing.pop("usage", None) or {}
+        timing["prompt_tokens"] = usage.get("input_tokens") or count_tokens(prompt)
+        timing["completion_tokens"] = usage.get("output_tokens") or count_tokens(content or "")
+
+    def _record_metrics(self, agent_name, model, timing, ok=True):
+        if self.metrics is not None:
+            self.metrics.record_call(agent_name, timing.get("model", model), timing, timing.get("prompt_tokens"),
+                                     timing.get("completion_tokens"), ok)
+
+    def __call__(self, agent_name, model, prompt, parent_run_id=None, stream_to=None, use_cache=True):
+        from langchain_core.messages import HumanMessage
+
+        start_time = time.perf_counter()
+        cache = self.response_cache if use_cache else None
+        content = cache.get(model, self.temperature, prompt) if cache else None
+        timing = {"ttft": None, "total": None}
+        if content is not None:
+            timing["cached"] = True
+        agent_run_id = self._start_trace(agent_name, model, prompt, parent_run_id, content is not None)
+        stage_key = (parent_run_id, stage_of(agent_name))
+
+        def attempt():
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            llm = get_chat_model(self.api_key, model, temperature=self.temperature, base_url=self.base_url)
+            messages = [HumanMessage(content=prompt)]
+            if stream_to is not None:
+                stream_result = stream_chat(
+                    llm,
+                    messages,
+                    on_text=lambda text: stream_to.markdown(text + self.cursor, **self.markdown_kwargs)
+                )
+                timing["ttft"] = stream_result.time_to_first_token
+                timing["usage"] = stream_result.usage
+                return stream_result.content
+            result = llm.invoke(messages)
+            timing["usage"] = getattr(result, "usage_metadata", None)
+            return result.content
+
+        try:
+            if content is None:
+                content = self.retry.call(attempt, stage_key, timing)
+                self._count_tokens(timing, prompt, content)
+                if cache and content:
+                    cache.put(model, self.temperature, prompt, content)
+            if stream_to is not None:
+                stream_to.markdown(content, **self.markdown_kwargs)
+        except Exception as e:
+            self.retry.reset(stage_key)
+            self._record_metrics(agent_name, model, timing, ok=False)
+            self._end_trace(agent_run_id, error=e, details=retry_details(timing))
+            raise
+
+        timing["total"] = time.perf_counter() - start_time
+        self._record_metrics(agent_name, model, timing)
+        if self.on_timing:
+            self.on_timing(agent_name, timing)
+        self._end_trace(agent_run_id, content, details=retry_details(timing))
+        return content
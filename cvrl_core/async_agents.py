@@ -0,0 +1,339 @@
+"""异步 Agent 调用：在后台事件循环中并发执行互不依赖的模型调用。
+
+所有异步调用都运行在一个进程内共享的后台事件循环线程中，Streamlit 脚本线程和批量处理的
+工作线程只是提交协程并等待结果，不会阻塞事件循环。并发受两级信号量限制：每个模型各自的上限，
+以及全进程共享的总上限，所有会话和批量任务共用同一组额度。
+
+AsyncAgentRunner 的同步调用签名与 AgentRunner 相同，可以直接作为 run_agent 使用；
+gather() 一次提交多个调用并按顺序返回结果，可作为 config["configurable"]["gather_agents"]
+供流水线节点并发执行（如分块分析支持文件）。界面更新和 on_timing 回调都在调用方线程中执行。
+"""
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import asynccontextmanager
+
+from .agents import AgentRunner
+from .llm_clients import get_chat_model
+from .retry import is_retryable, retry_details, stage_of
+from .streaming import astream_chat
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_PER_MODEL_CONCURRENCY = 4
+
+_loop = None
+_loop_lock = threading.Lock()
+_limits = None
+_limits_lock = threading.Lock()
+# 当前调用的排队位置回调，对冲和重试产生的子任务沿用同一个回调
+_on_queue = contextvars.ContextVar("on_queue", default=None)
+
+
+def get_event_loop():
+    """返回在后台守护线程中运行的事件循环（进程内共享，首次调用时启动）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="cvrl-async-agents", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """把协程提交到后台事件循环，返回可在任意同步线程中等待的 concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+class ConcurrencyLimits:
+    """每个模型的并发上限加上全局并发上限。信号量只在后台事件循环中使用"""
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, per_model=DEFAULT_PER_MODEL_CONCURRENCY,
+                 model_overrides=None):
+        self.max_concurrency = max_concurrency
+        self.per_model = per_model
+        self.model_overrides = dict(model_overrides or {})
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._models = {}
+        self.active = 0
+        self.waiting = 0
+
+    def limit_for(self, model):
+        return int(self.model_overrides.get(model, self.per_model))
+
+    @asynccontextmanager
+    async def slot(self, model):
+        semaphore = self._models.get(model)
+        if semaphore is None:
+            semaphore = self._models[model] = asyncio.Semaphore(self.limit_for(model))
+        self.waiting += 1
+        try:
+            # 先占模型额度再占全局额度，避免排队等某个繁忙模型时占着全局额度
+            await semaphore.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._global.release()
+            semaphore.release()
+
+    def stats(self):
+        return {"max_concurrency": self.max_concurrency, "per_model": self.per_model,
+                "active": self.active, "waiting": self.waiting}
+
+
+def get_concurrency_limits(max_concurrency=None, per_model=None, model_overrides=None):
+    """返回进程内共享的并发上限；参数与当前设置不同时按新上限重建（进行中的调用仍按旧上限完成）"""
+    global _limits
+    max_concurrency = int(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+    per_model = int(per_model or DEFAULT_PER_MODEL_CONCURRENCY)
+    model_overrides = dict(model_overrides or {})
+    with _limits_lock:
+        if (_limits is None or _limits.max_concurrency != max_concurrency or _limits.per_model != per_model
+                or _limits.model_overrides != model_overrides):
+            _limits = ConcurrencyLimits(max_concurrency, per_model, model_overrides)
+        return _limits
+
+
+class AsyncAgentRunner(AgentRunner):
+    """使用 ainvoke/astream 的 AgentRunner，参数与 AgentRunner 相同，另外接受 limits、router、scheduler 等。
+
+    提供 router（routing.ModelRouter）时按其候选顺序调用模型，失败后改用下一个后备模型，
+    非流式调用可在超过对冲等待时间后向下一个候选模型发送重复请求。
+    每个候选模型先按 retry 策略重试暂时性错误，仍失败时才改用下一个后备模型。
+    提供 scheduler（scheduler.RequestScheduler）时每次请求先取得限流额度，同一 session_id 的请求
+    在排队时按会话轮转；on_queue(agent_name, 位置) 在调用方线程中回调排队位置，放行时位置为 0。
+    """
+
+    def __init__(self, api_key, limits=None, router=None, scheduler=None, session_id=None, on_queue=None, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.limits = limits or get_concurrency_limits()
+        self.router = router
+        self.scheduler = scheduler
+        self.session_id = session_id or id(self)
+        self.on_queue = on_queue
+
+    async def _attempt(self, model, messages, on_text, timing):
+        """取得限流额度后在并发额度内调用一次指定模型，并把用时和成败记入路由统计"""
+        if self.scheduler:
+            waited = await self.scheduler.acquire(model, self.api_key, self.session_id, _on_queue.get())
+            timing["queued"] = timing.get("queued", 0) + waited
+        start_time = time.perf_counter()
+        try:
+            async with self.limits.slot(model):
+                if self.rate_limiter:
+                    await asyncio.to_thread(self.rate_limiter.acquire)
+                llm = get_chat_model(self.api_key, model, temperature=self.temperature, base_url=self.base_url)
+                if on_text is not None:
+                    stream_result = await astream_chat(llm, messages, on_text=on_text)
+                    timing["ttft"] = stream_result.time_to_first_token
+                    timing["usage"] = stream_result.usage
+                    content = stream_result.content
+                else:
+                    timeout = self.router.attempt_timeout if self.router else None
+                    result = await asyncio.wait_for(llm.ainvoke(messages), timeout)
+                    timing["usage"] = getattr(result, "usage_metadata", None)
+                    content = result.content
+        except Exception as e:
+            # 只有暂时性错误才说明模型不健康；请求本身有误（400/401/403 等）不计入路由统计
+            if self.router and is_retryable(e):
+                self.router.record(model, None, False)
+            raise
+        if self.router:
+            self.router.record(model, time.perf_counter() - start_time, True)
+        return content
+
+    async def _hedged(self, model, backup, delay, messages, timing):
+        """先调用 model，delay 秒后仍未返回则同时调用 backup，返回 (先成功的结果, 模型)。
+
+        两个请求各自记录用时，只把先成功的那个写入 timing；遇到不可重试的错误时立即抛出。
+        """
+        tasks = {}
+        attempts = {}
+
+        def start(candidate):
+            # 排队时间在之前的重试基础上累计
+            attempt_timing = {"queued": timing["queued"]} if "queued" in timing else {}
+            task = asyncio.ensure_future(self._attempt(candidate, messages, None, attempt_timing))
+            tasks[task] = candidate
+            attempts[task] = attempt_timing
+
+        start(model)
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            start(backup)
+            timing["hedged"] = True
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        timing.update(attempts[task])
+                        return task.result(), tasks[task]
+                    error = task.exception()
+                    if not is_retryable(error):
+                        raise error
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call_models(self, model, messages, on_text, timing, stage_key):
+        """按路由的候选顺序调用，返回 (内容, 实际使用的模型)；全部失败时抛出最后一个异常"""
+        if self.router is None:
+            content = await self.retry.acall(lambda: self._attempt(model, messages, on_text, timing), stage_key, timing)
+            return content, model
+        candidates = self.router.candidates(model)
+        tried = set()
+        error = None
+        for i, candidate in enumerate(candidates):
+            if candidate in tried:
+                continue
+            tried.add(candidate)
+            delay = self.router.hedge_delay(candidate) if on_text is None else None
+            backup = candidates[i + 1] if i + 1 < len(candidates) else candidate
+            try:
+                if delay is not None:
+                    return await self.retry.acall(
+                        lambda: self._hedged(candidate, backup, delay, messages, timing), stage_key, timing
+                    )
+                content = await self.retry.acall(
+                    lambda: self._attempt(candidate, messages, on_text, timing), stage_key, timing
+                )
+                return content, candidate
+            except Exception as e:
+                if not is_retryable(e):
+                    # 请求本身有误，换用其他模型也会同样失败
+                    raise
+                error = e
+                if timing.get("hedged"):
+                    # 对冲请求已经用过下一个候选模型
+                    tried.add(backup)
+        raise error
+
+    async def acall(self, agent_name, model, prompt, parent_run_id=None, on_text=None, use_cache=True, on_queue=None):
+        """异步调用模型，返回 (内容, 用时)；on_text(已生成的全部文本) 和 on_queue(排队位置) 在事件循环线程中回调。
+
+        用时中的 "model" 为实际给出结果的模型（改用后备模型时与 model 不同），"queued" 为排队等待限流额度的秒数。
+        """
+        from langchain_core.messages import HumanMessage
+
+        _on_queue.set(on_queue)
+        start_time = time.perf_counter()
+        cache = self.response_cache if use_cache else None
+        content = await asyncio.to_thread(cache.get, model, self.temperature, prompt) if cache else None
+        timing = {"ttft": None, "total": None, "model": model}
+        if content is not None:
+            timing["cached"] = True
+        agent_run_id = self._start_trace(agent_name, model, prompt, parent_run_id, content is not None)
+        stage_key = (parent_run_id, stage_of(agent_name))
+
+        try:
+            if content is None:
+                content, timing["model"] = await self._call_models(
+                    model, [HumanMessage(content=prompt)], on_text, timing, stage_key
+                )
+                timing["fallback"] = timing["model"] != model
+                self._count_tokens(timing, prompt, content)
+                if cache and content:
+                    await asyncio.to_thread(cache.put, timing["model"], self.temperature, prompt, content)
+        except Exception as e:
+            self.retry.reset(stage_key)
+            self._record_metrics(agent_name, model, timing, ok=False)
+            self._end_trace(agent_run_id, error=e, details=retry_details(timing))
+            raise
+
+        timing["total"] = time.perf_counter() - start_time
+        self._record_metrics(agent_name, model, timing)
+        details = retry_details(timing) or {}
+        if timing.get("fallback") or timing.get("hedged"):
+            details.update(model_used=timing["model"], hedged=timing.get("hedged", False))
+        self._end_trace(agent_run_id, content, details=details or None)
+        return content, timing
+
+    def _forward(self, events, stream_to=None):
+        """在调用方线程中处理事件循环线程发来的流式文本和排队位置，只显示最新的文本"""
+        latest = None
+        while True:
+            try:
+                kind, agent_name, value = events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "text":
+                latest = value
+            elif self.on_queue:
+                self.on_queue(agent_name, value)
+        if latest is not None and stream_to is not None:
+            stream_to.markdown(latest + self.cursor, **self.markdown_kwargs)
+
+    def __call__(self, agent_name, model, prompt, parent_run_id=None, stream_to=None, use_cache=True):
+        """同步调用（run_agent 约定）：在后台事件循环中执行，流式文本在调用方线程中写入 stream_to"""
+        events = queue.Queue()
+        future = submit(self.acall(
+            agent_name, model, prompt, parent_run_id,
+            on_text=(lambda text: events.put(("text", agent_name, text))) if stream_to is not None else None,
+            use_cache=use_cache,
+            on_queue=lambda position: events.put(("queue", agent_name, position))
+        ))
+        try:
+            while not future.done():
+                wait([future], timeout=0.05)
+                self._forward(events, stream_to)
+        except BaseException:
+            # Streamlit 停止或重跑脚本时在调用方线程中抛出异常，取消后台调用，不再继续计费和占用并发名额
+            future.cancel()
+            raise
+        content, timing = future.result()
+        if stream_to is not None:
+            stream_to.markdown(content, **self.markdown_kwargs)
+        if self.on_timing:
+            self.on_timing(agent_name, timing)
+        return content
+
+    def gather(self, calls, on_done=None, use_cache=True):
+        """并发执行多个调用，按 calls 的顺序返回内容。
+
+        calls 中每项为 (agent_name, model, prompt, parent_run_id)；on_done(已完成数, 总数)、on_timing 和
+        on_queue 在调用方线程中回调。任一调用失败时取消其余未完成的调用并抛出该异常。
+        """
+        events = queue.Queue()
+        futures = {
+            submit(self.acall(
+                agent_name, model, prompt, parent_run_id, use_cache=use_cache,
+                on_queue=lambda position, name=agent_name: events.put(("queue", name, position))
+            )): i
+            for i, (agent_name, model, prompt, parent_run_id) in enumerate(calls)
+        }
+        results = [None] * len(futures)
+        pending = set(futures)
+        finished = 0
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                self._forward(events)
+                for future in done:
+                    finished += 1
+                    content, timing = future.result()
+                    results[futures[future]] = content
+                    if self.on_timing:
+                        self.on_timing(calls[futures[future]][0], timing)
+                    if on_done:
+                        on_done(finished, len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return results
@@ -0,0 +1,403 @@
+"""批量处理：不启动 Streamlit，为整批学生生成简历（cv）或推荐信（rl）。
+
+用法：
+    python -m cvrl_core.batch cv 学生目录/ --prompts prompts/saved_prompts.json --out 输出目录/
+    python -m cvrl_core.batch rl 清单.csv --out 输出目录/ --workers 8 --rate 60
+
+输入可以是目录：每个子目录为一名学生，文件名匹配 --material-glob 的文件作为素材表，
+其余文件作为支持文件，可选的 写作需求.txt 作为推荐信的写作需求；也可以是清单 CSV，
+列为 student_id, material, support, writing_requirements（support 中多个文件用 ; 分隔，
+相对路径相对于清单所在目录）。
+
+每名学生的结果写入 <输出目录>/<student_id>/，全部阶段完成后写入 status.json。
+与素材表或其他支持文件重复的支持文件不参与分析，记录在 status.json 的 skipped_duplicates 中。
+再次运行同一命令时跳过输入未变化且已完成的学生，中断后直接重新运行即可继续；
+结束时汇总为 <输出目录>/summary.csv，各阶段的用时、tokens 和费用写入 <输出目录>/metrics.prom。
+配置从 .streamlit/secrets.toml 读取，环境变量优先。
+模型调用由所有学生共用的并发上限约束（LLM_MAX_CONCURRENCY / LLM_PER_MODEL_CONCURRENCY）。
+未指定 --prompts 时使用应用当前的默认提示词；提示词文件中未提供的条目同样使用默认值。
+"""
+import argparse
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from . import cv_pipeline, rl_pipeline
+from .agents import RateLimiter
+from .async_agents import AsyncAgentRunner
+from .dedup import DEFAULT_THRESHOLD, deduplicate
+from .engine import available_models, setup_engine
+from .ingest import ingest_files, is_parse_error
+from .map_reduce import DEFAULT_CHUNK_CHARS, DEFAULT_MAX_WORKERS
+from .pipeline import continue_from, discard_thread, input_fingerprint, run_until
+from .prompt_registry import current_prompts
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".doc", ".png", ".jpg", ".jpeg")
+WRITING_REQUIREMENTS_FILES = ("写作需求.txt", "writing_requirements.txt")
+SETTING_KEYS = (
+    "OPENROUTER_API_KEY", "OPENROUTER_MODEL", "LANGSMITH_API_KEY", "LANGSMITH_PROJECT",
+    "LLM_RESPONSE_CACHE", "LLM_RESPONSE_CACHE_TTL", "LLM_RESPONSE_CACHE_MAX_MB",
+    "INGEST_MAX_WORKERS", "INGEST_TIMEOUT", "SUPPORT_CHUNK_CHARS", "SUPPORT_MAP_WORKERS",
+    "PROMPT_RESERVE_TOKENS", "HTTP_MAX_CONNECTIONS", "HTTP_MAX_KEEPALIVE", "HTTP_KEEPALIVE_EXPIRY",
+    "LANGSMITH_PROJECT_TTL", "LLM_MAX_CONCURRENCY", "LLM_PER_MODEL_CONCURRENCY",
+    "MODEL_MAX_ERROR_RATE", "MODEL_MAX_P95", "MODEL_HEDGE_AFTER", "MODEL_ATTEMPT_TIMEOUT",
+    "LLM_RETRY_MAX_ATTEMPTS", "LLM_RETRY_BASE_DELAY", "LLM_RETRY_MAX_DELAY", "LLM_RETRY_STAGE_BUDGET",
+    "LLM_RATE_PER_KEY", "LLM_RATE_PER_MODEL", "LLM_RATE_BURST", "LLM_RATE_COORDINATOR",
+    "DEDUP_NEAR_THRESHOLD",
+)
+SUMMARY_FIELDS = ["student_id", "status", "seconds", "error", "outputs", "finished_at"]
+
+APPS = {
+    "cv": {
+        "label": "简历",
+        "build_graph": cv_pipeline.build_cv_graph,
+        "prompt_keys": cv_pipeline.PROMPT_KEYS,
+        "material_key": "resume_content",
+        "model_keys": ("support_analyst_model", "cv_assistant_model", "resume_generator_model"),
+        "final_stage": "resume_generator",
+        "outputs": {"support_analysis": "support_analysis.md", "report": "report.md", "resume": "resume.md"},
+        "pinned_models": cv_pipeline.PINNED_MODELS,
+        "langsmith_project": "cv-assistant",
+    },
+    "rl": {
+        "label": "推荐信",
+        "build_graph": rl_pipeline.build_rl_graph,
+        "prompt_keys": rl_pipeline.PROMPT_KEYS,
+        "material_key": "rl_content",
+        "model_keys": ("support_analyst_model", "rl_assistant_model", "letter_generator_model"),
+        "final_stage": "letter_generator",
+        "outputs": {"support_analysis": "support_analysis.md", "report": "report.md", "letter": "letter.md"},
+        "pinned_models": (),
+        "langsmith_project": "rl-assistant",
+    },
+}
+
+
+@dataclass
+class Student:
+    student_id: str
+    material: Optional[str]
+    support: List[str] = field(default_factory=list)
+    writing_requirements: str = ""
+
+
+@dataclass
+class BatchJob:
+    app: str
+    prompts: dict
+    models: dict
+    out_dir: str
+    run_agent: AsyncAgentRunner
+    settings: dict
+    map_reduce: bool = False
+    force: bool = False
+    tracer: object = None
+
+
+def load_settings(secrets_path):
+    """读取 secrets.toml（存在时），再用同名环境变量覆盖"""
+    settings = {}
+    if secrets_path and os.path.exists(secrets_path):
+        import tomllib
+
+        with open(secrets_path, "rb") as f:
+            settings.update(tomllib.load(f))
+    for key in SETTING_KEYS:
+        if key in os.environ:
+            settings[key] = os.environ[key]
+    return settings
+
+
+def _read_writing_requirements(folder):
+    for name in WRITING_REQUIREMENTS_FILES:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+    return ""
+
+
+def discover_students(input_path, material_glob="*素材*"):
+    if os.path.isfile(input_path):
+        return _read_manifest(input_path)
+
+    students = []
+    for entry in sorted(os.scandir(input_path), key=lambda e: e.name):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        names = sorted(
+            name for name in os.listdir(entry.path)
+            if not name.startswith(".") and name.lower().endswith(SUPPORTED_EXTENSIONS)
+        )
+        material = next((name for name in names if fnmatch.fnmatch(name, material_glob)), None)
+        students.append(Student(
+            student_id=entry.name,
+            material=os.path.join(entry.path, material) if material else None,
+            support=[os.path.join(entry.path, name) for name in names if name != material],
+            writing_requirements=_read_writing_requirements(entry.path)
+        ))
+    return students
+
+
+def _read_manifest(manifest_path):
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    students = []
+    with open(manifest_path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            support = [p.strip() for p in (row.get("support") or "").split(";") if p.strip()]
+            students.append(Student(
+                student_id=row["student_id"].strip(),
+                material=os.path.join(base, row["material"].strip()) if (row.get("material") or "").strip() else None,
+                support=[os.path.join(base, p) for p in support],
+                writing_requirements=(row.get("writing_requirements") or "").strip()
+            ))
+    return students
+
+
+def _safe_name(student_id):
+    return re.sub(r'[\\/:*?"<>|]', "_", student_id).strip(". ") or "_"
+
+
+def _write_atomic(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_status(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def process_student(student, job):
+    """处理一名学生，返回写入 status.json 的记录（额外带有 skipped 标记）"""
+    app = APPS[job.app]
+    out_dir = os.path.join(job.out_dir, _safe_name(student.student_id))
+    os.makedirs(out_dir, exist_ok=True)
+    status_path = os.path.join(out_dir, "status.json")
+    start = time.perf_counter()
+    record = {"student_id": student.student_id}
+
+    try:
+        if not student.material:
+            raise ValueError("未找到素材表文件")
+        paths = [student.material] + student.support
+        digests = []
+        for path in paths:
+            with open(path, "rb") as f:
+                digests.append(hashlib.file_digest(f, "sha256").hexdigest())
+        fingerprint = input_fingerprint(
+            job.app,
+            json.dumps([job.prompts.get(key) for key in app["prompt_keys"]], ensure_ascii=False),
+            json.dumps(job.models, sort_keys=True),
+            job.map_reduce,
+            student.writing_requirements,
+            *digests
+        )
+    except Exception as e:
+        record.update({"status": "failed", "error": str(e), "seconds": 0.0, "outputs": "",
+                       "finished_at": datetime.now().isoformat(timespec="seconds")})
+        _write_atomic(status_path, json.dumps(record, ensure_ascii=False, indent=2))
+        return record
+
+    previous = _read_status(status_path)
+    if not job.force and previous and previous.get("status") == "done" and previous.get("fingerprint") == fingerprint:
+        return {**previous, "skipped": True}
+
+    run_id = str(uuid.uuid4())
+    thread_id = str(uuid.uuid4())
+    if job.tracer:
+        job.tracer.start_run(run_id, f"批量{app['label']}生成", "chain", {"student_id": student.student_id})
+    try:
+        # 解析进程直接读取学生目录中的文件
+        contents = ingest_files(
+            paths,
+            max_workers=int(job.settings.get("INGEST_MAX_WORKERS", 4)),
+            timeout=float(job.settings.get("INGEST_TIMEOUT", 120))
+        )
+        if is_parse_error(contents[0]):
+            raise ValueError(f"素材表解析失败: {contents[0]}")
+        support_contents, duplicates = deduplicate(
+            contents, [os.path.basename(path) for path in paths],
+            float(job.settings.get("DEDUP_NEAR_THRESHOLD", DEFAULT_THRESHOLD))
+        )
+        record["skipped_duplicates"] = [f"{d.name}：{d.reason}" for d in duplicates]
+
+        inputs = {
+            app["material_key"]: str(contents[0]),
+            "support_files_content": support_contents,
+            "writing_requirements": student.writing_requirements,
+            "support_map_reduce": job.map_reduce,
+            "support_chunk_chars": int(job.settings.get("SUPPORT_CHUNK_CHARS", DEFAULT_CHUNK_CHARS)),
+            "support_map_workers": int(job.settings.get("SUPPORT_MAP_WORKERS", DEFAULT_MAX_WORKERS)),
+            "master_run_id": run_id,
+            **{key: job.prompts[key] for key in app["prompt_keys"]},
+            **job.models
+        }
+        graph = app["build_graph"]()
+        run_until(graph, thread_id, {"run_id": run_id}, inputs, stop_before=app["final_stage"],
+                  run_agent=job.run_agent, gather_agents=job.run_agent.gather)
+        state = continue_from(graph, thread_id, inputs, run_agent=job.run_agent, gather_agents=job.run_agent.gather)
+
+        for key, filename in app["outputs"].items():
+            _write_atomic(os.path.join(out_dir, filename), state.get(key) or "")
+        record.update({"status": "done", "error": "", "outputs": ";".join(app["outputs"].values())})
+        if job.tracer:
+            job.tracer.end_run(run_id, outputs={"outputs": record["outputs"]})
+    except Exception as e:
+        record.update({"status": "failed", "error": str(e), "outputs": ""})
+        if job.tracer:
+            job.tracer.end_run(run_id, error=str(e))
+    finally:
+        discard_thread(thread_id)
+
+    record.update({
+        "seconds": round(time.perf_counter() - start, 1),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "fingerprint": fingerprint
+    })
+    _write_atomic(status_path, json.dumps(record, ensure_ascii=False, indent=2))
+    return record
+
+
+def write_summary(students, out_dir):
+    """根据各学生的 status.json 生成 summary.csv（尚未处理的学生记为 pending）"""
+    rows = []
+    for student in students:
+        record = _read_status(os.path.join(out_dir, _safe_name(student.student_id), "status.json"))
+        record = record or {"student_id": student.student_id, "status": "pending"}
+        rows.append({name: record.get(name, "") for name in SUMMARY_FIELDS})
+    buffer = io.StringIO()
+    # utf-8-sig 让 Excel 正确识别中文
+    buffer.write("\ufeff")
+    writer = csv.DictWriter(buffer, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    summary_path = os.path.join(out_dir, "summary.csv")
+    _write_atomic(summary_path, buffer.getvalue())
+    return summary_path, rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cvrl_core.batch",
+        description="批量为学生生成简历（cv）或推荐信（rl），中断后重新运行同一命令即可继续。"
+    )
+    parser.add_argument("app", choices=sorted(APPS), help="cv：简历助手流水线；rl：推荐信助手流水线")
+    parser.add_argument("input", help="学生目录（每个子目录一名学生）或清单 CSV")
+    parser.add_argument("--prompts",
+                        help="提示词 JSON 文件，键名与应用中的提示词相同（简历助手保存设置时写入 prompts/saved_prompts.json），"
+                             "未提供的条目使用默认提示词")
+    parser.add_argument("--out", required=True, help="输出目录")
+    parser.add_argument("--workers", type=int, default=4, help="同时处理的学生数（默认 4）")
+    parser.add_argument("--rate", type=float, default=0, help="每分钟最多发起的模型调用次数，0 表示不限制")
+    parser.add_argument("--model", help="所有阶段默认使用的模型（默认取 OPENROUTER_MODEL 中的第一个）")
+    parser.add_argument("--support-model", help="支持文件分析阶段的模型")
+    parser.add_argument("--report-model", help="报告阶段的模型")
+    parser.add_argument("--final-model", help="简历/推荐信生成阶段的模型")
+    parser.add_argument("--material-glob", default="*素材*", help="目录模式下识别素材表的文件名模式（默认 *素材*）")
+    parser.add_argument("--map-reduce", action="store_true", help="逐个分析支持文件后再合并")
+    parser.add_argument("--force", action="store_true", help="忽略已完成的结果，全部重新处理")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"), help="secrets.toml 路径")
+    return parser, parser.parse_args(argv)
+
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+    app = APPS[args.app]
+    settings = load_settings(args.secrets)
+
+    api_key = settings.get("OPENROUTER_API_KEY", "")
+    if not api_key:
+        parser.error("请在环境变量或 secrets.toml 中配置 OPENROUTER_API_KEY")
+    prompts = dict(current_prompts(args.app).prompts)
+    if args.prompts:
+        with open(args.prompts, "r", encoding="utf-8") as f:
+            prompts.update(json.load(f))
+    missing = [key for key in app["prompt_keys"] if not prompts.get(key)]
+    if missing:
+        parser.error(f"提示词为空: {', '.join(missing)}")
+
+    # 与应用中模型下拉框的默认选项相同
+    default_model = args.model or available_models(settings, pinned=app["pinned_models"])[0]
+    support_key, report_key, final_key = app["model_keys"]
+    models = {
+        support_key: args.support_model or default_model,
+        report_key: args.report_model or default_model,
+        final_key: args.final_model or default_model,
+    }
+
+    students = discover_students(args.input, args.material_glob)
+    if not students:
+        parser.error(f"{args.input} 中没有找到学生")
+    ids = [_safe_name(s.student_id) for s in students]
+    if len(set(ids)) != len(ids):
+        parser.error("学生编号重复")
+    os.makedirs(args.out, exist_ok=True)
+
+    engine = setup_engine(settings, default_project=app["langsmith_project"])
+    if engine.langsmith_init_error:
+        print(f"LangSmith初始化失败: {engine.langsmith_init_error}", file=sys.stderr)
+    tracer = engine.tracer
+    job = BatchJob(
+        app=args.app,
+        prompts=prompts,
+        models=models,
+        out_dir=args.out,
+        run_agent=engine.agent_runner(rate_limiter=RateLimiter(args.rate) if args.rate > 0 else None),
+        settings=settings,
+        map_reduce=args.map_reduce,
+        force=args.force,
+        tracer=tracer
+    )
+
+    print(f"共 {len(students)} 名学生，{args.workers} 个并发，输出到 {args.out}")
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = [executor.submit(process_student, student, job) for student in students]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            status = "跳过（已完成）" if record.get("skipped") else record["status"]
+            detail = f" - {record['error']}" if record.get("error") else ""
+            print(f"[{done}/{len(students)}] {record['student_id']}: {status} {record.get('seconds', 0)}s{detail}",
+                  flush=True)
+    except KeyboardInterrupt:
+        print("已中断，等待进行中的学生处理完毕；重新运行同一命令即可继续", file=sys.stderr)
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        if tracer:
+            tracer.flush()
+        summary_path, rows = write_summary(students, args.out)
+        print(f"汇总已写入 {summary_path}")
+        # 本次运行各阶段的用时、tokens 和费用（Prometheus 文本格式）
+        metrics_path = os.path.join(args.out, "metrics.prom")
+        engine.metrics.write_textfile(metrics_path)
+        print(f"运行指标已写入 {metrics_path}")
+
+    return 1 if any(row["status"] != "done" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""简历助手流水线：support_analyst → cv_assistant → resume_generator。
+
+节点不依赖 Streamlit：模型通过 config["configurable"]["run_agent"] 调用，
+进度条、流式输出区域等界面元素都从 ui 中按需读取，未提供时跳过。
+"""
+from typing import Any, List, TypedDict
+
+from .documents import files_tokens, join_files
+from .map_reduce import analyze_support_chunks, build_map_prompt, count_chunks, iter_chunks
+from .pipeline import build_pipeline, reuse_unchanged, show_progress
+from .prompt_budget import (PRIORITY_ANALYSIS, PRIORITY_MATERIAL, PRIORITY_SUPPORT, Section, assemble_prompt,
+                            chunk_chars_for, fits, prompt_budget)
+
+PROMPT_KEYS = [
+    "persona", "task", "output_format",
+    "support_analyst_persona", "support_analyst_task", "support_analyst_output_format",
+    "resume_generator_persona", "resume_generator_task", "resume_generator_output_format",
+]
+
+# 模型列表中固定排在最前的模型
+PINNED_MODELS = ["google/gemini-2.5-flash-preview-05-20:thinking", "google/gemini-2.5-flash-preview-05-20"]
+
+STAGE_LABELS = {
+    "support_analyst": "支持文件分析",
+    "cv_assistant": "经历整理报告",
+    "resume_generator": "简历生成"
+}
+
+
+class ChatState(TypedDict, total=False):
+    messages: List[Any]
+    run_id: str
+    support_analysis: str
+    report: str
+    resume: str
+
+
+FILE_PREFIX = "--- 文件 {index} ---\n"
+FILE_SUFFIX = "\n\n"
+
+
+# 1. 如果有支持文件，先用支持文件分析agent处理
+def support_analyst_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+    support_files_content = inputs["support_files_content"]
+
+    if not support_files_content:
+        show_progress(ui, 50, "未提供支持文件，跳过第一阶段分析")
+        return {"support_analysis": ""}
+
+    show_progress(ui, text="第一阶段：正在分析支持文件...")
+
+    # 支持分析agent提示词的固定部分，支持文件内容确定不分块后才读入
+    support_prompt_header = f"""人物设定：{inputs["support_analyst_persona"]}
+
+任务描述：{inputs["support_analyst_task"]}
+
+输出格式：{inputs["support_analyst_output_format"]}
+
+支持文件内容：
+"""
+
+    # 开启了分块分析，或整份提示词超出模型的上下文预算时，改为逐块分析后合并
+    if inputs["support_map_reduce"] or not fits(
+        inputs["support_analyst_model"], support_prompt_header + "\n",
+        files_tokens(support_files_content, FILE_PREFIX, FILE_SUFFIX)
+    ):
+        chunk_chars = chunk_chars_for(
+            inputs["support_analyst_model"],
+            build_map_prompt(
+                inputs["support_analyst_persona"],
+                inputs["support_analyst_task"],
+                inputs["support_analyst_output_format"],
+                "文件 99 第 99/99 部分",
+                ""
+            ),
+            inputs["support_chunk_chars"] if inputs["support_map_reduce"] else None
+        )
+        chunk_count = count_chunks(support_files_content, chunk_chars)
+        if chunk_count > 1:
+            support_analysis_result = analyze_support_chunks(
+                iter_chunks(support_files_content, chunk_chars), config, state["run_id"], chunk_chars,
+                "supporting_doc_analyst", total=chunk_count
+            )
+            show_progress(ui, 50, f"第一阶段完成：已分块分析 {chunk_count} 个文件片段")
+            return {"support_analysis": support_analysis_result}
+
+    support_prompt = f"{support_prompt_header}{join_files(support_files_content, FILE_PREFIX, FILE_SUFFIX)}\n"
+
+    # 调用支持文件分析agent
+    support_analysis_result = run_agent(
+        "supporting_doc_analyst",
+        inputs["support_analyst_model"],
+        support_prompt,
+        state["run_id"]
+    )
+
+    show_progress(ui, 50, "第一阶段完成：支持文件分析完毕")
+    return {"support_analysis": support_analysis_result}
+
+
+# 2. 结合素材表和支持文件分析结果生成经历整理报告
+def cv_assistant_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+    support_files_content = inputs["support_files_content"]
+    has_support_files = len(support_files_content) > 0
+    support_analysis_result = state.get("support_analysis", "")
+
+    show_progress(ui, 50, "第二阶段：正在生成简历...")
+
+    # 准备简历素材内容（必需，不会被截断）
+    sections = [
+        Section("简历素材", inputs["resume_content"], prefix="简历素材内容:\n", suffix="\n\n",
+                priority=PRIORITY_MATERIAL, required=True)
+    ]
+
+    # 如果有支持文件分析结果，添加到提示中
+    if has_support_files and support_analysis_result:
+        sections.append(Section("支持文件分析结果", support_analysis_result, prefix="支持文件分析结果:\n",
+                                suffix="\n\n", priority=PRIORITY_ANALYSIS))
+
+    # 或者直接添加原始支持文件内容（如果没有分析结果但有支持文件）
+    elif has_support_files:
+        # 超出预算的部分反正会被截断，最多读入预算对应的最大字符数（每个 token 至少 1 个字符，至多约 3 个）
+        support_files_text = join_files(support_files_content, FILE_PREFIX, FILE_SUFFIX,
+                                        max_chars=3 * prompt_budget(inputs["cv_assistant_model"]))
+        sections.append(Section("原始支持文件", support_files_text, prefix="支持文件内容:\n",
+                                priority=PRIORITY_SUPPORT))
+
+    # 构建最终的简历助手提示词，超出模型上下文预算时按优先级截断，素材表仍放不下则直接报错
+    cv_prompt, truncated = assemble_prompt(
+        inputs["cv_assistant_model"],
+        f"""人物设定：{inputs["persona"]}
+
+任务描述：{inputs["task"]}
+
+输出格式：{inputs["output_format"]}
+
+文件内容：
+""",
+        sections,
+        footer="\n"
+    )
+    if truncated and ui.get("on_prompt_truncated"):
+        ui["on_prompt_truncated"]("cv_assistant", truncated)
+
+    # 调用简历助手agent，结果边生成边显示
+    final_result = run_agent(
+        "cv_assistant",
+        inputs["cv_assistant_model"],
+        cv_prompt,
+        state["run_id"],
+        stream_to=ui.get("result_area")
+    )
+    return {"report": final_result}
+
+
+# 3. 根据经历整理报告生成正式简历（流水线在此节点前暂停，确认报告后继续执行）
+def resume_generator_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+
+    # 构建简历生成提示词
+    resume_prompt = f"""人物设定：{inputs["resume_generator_persona"]}
+
+任务描述：{inputs["resume_generator_task"]}
+
+输出格式：{inputs["resume_generator_output_format"]}
+
+经历整理报告：
+{state["report"]}
+"""
+
+    # 调用简历生成agent，结果边生成边显示
+    final_resume = run_agent(
+        "resume_generator",
+        inputs["resume_generator_model"],
+        resume_prompt,
+        state["run_id"],
+        stream_to=ui.get("resume_area")
+    )
+    return {"resume": final_resume}
+
+
+# 构建 support_analyst → cv_assistant → resume_generator 流水线，在简历生成前暂停
+# 每个阶段声明自己依赖的输入和上游结果，依赖未变化时复用上一次的输出
+def build_cv_graph():
+    return build_pipeline(
+        ChatState,
+        [
+            ("support_analyst", reuse_unchanged(
+                support_analyst_node, "support_analyst",
+                input_keys=["support_analyst_model", "support_analyst_persona", "support_analyst_task",
+                            "support_analyst_output_format", "support_files_content",
+                            "support_map_reduce", "support_chunk_chars"]
+            )),
+            ("cv_assistant", reuse_unchanged(
+                cv_assistant_node, "cv_assistant",
+                input_keys=["cv_assistant_model", "persona", "task", "output_format",
+                            "resume_content", "support_files_content"],
+                state_keys=["support_analysis"]
+            )),
+            ("resume_generator", reuse_unchanged(
+                resume_generator_node, "resume_generator",
+                input_keys=["resume_generator_model", "resume_generator_persona",
+                            "resume_generator_task", "resume_generator_output_format"],
+                state_keys=["report"]
+            ))
+        ],
+        interrupt_before=["resume_generator"]
+    )
@@ -0,0 +1,114 @@
+"""上传文件去重：素材表和支持文件中内容相同或高度相似的支持文件只保留第一份。
+
+完全相同的上传文件在解析时已只解析一次（ingest_files 按文件内容的 SHA-256 合并）；
+这里在解析出的文本上继续比较：去掉空白并转为小写后逐字取 5 字符的片段（shingle），
+用 bottom-k MinHash 估算两份文本的 Jaccard 相似度，达到阈值即视为重复。
+同一份材料导出的 PDF 和 DOCX、重新扫描的版本、与素材表重复上传的支持文件都能识别。
+素材表始终保留；解析失败的文件不参与比较。
+
+签名使用 Python 内置的字符串哈希，只在同一进程内可比较，不应持久化。
+"""
+import hashlib
+import heapq
+from dataclasses import dataclass
+
+from .documents import iter_sections
+from .ingest import is_parse_error
+
+DEFAULT_THRESHOLD = 0.9
+SHINGLE_CHARS = 5
+SIGNATURE_SIZE = 128
+_HASH_MASK = (1 << 61) - 1
+
+
+@dataclass
+class Duplicate:
+    name: str
+    duplicate_of: str
+    similarity: float
+    exact: bool = False
+
+    @property
+    def reason(self):
+        if self.exact:
+            return f"与「{self.duplicate_of}」内容相同"
+        return f"与「{self.duplicate_of}」内容相似（约 {self.similarity:.0%}）"
+
+
+def fingerprint(content):
+    """逐节读取内容，返回 (规范化文本的 SHA-256, MinHash 签名)。签名为最小的 SIGNATURE_SIZE 个片段哈希；
+    内容为空（如没有文本层的扫描件）时返回 (None, 空签名)"""
+    digest = hashlib.sha256()
+    size = 0
+    # 最大堆（取负值）保存当前最小的 SIGNATURE_SIZE 个哈希
+    heap = []
+    kept = set()
+    tail = ""
+    for section in iter_sections(content):
+        normalized = "".join(section.split()).lower()
+        digest.update(normalized.encode("utf-8"))
+        size += len(normalized)
+        text = tail + normalized
+        for i in range(len(text) - SHINGLE_CHARS + 1):
+            h = hash(text[i:i + SHINGLE_CHARS]) & _HASH_MASK
+            if h in kept:
+                continue
+            if len(heap) < SIGNATURE_SIZE:
+                heapq.heappush(heap, -h)
+                kept.add(h)
+            elif h < -heap[0]:
+                kept.discard(-heapq.heapreplace(heap, -h))
+                kept.add(h)
+        # 保留末尾不足一个片段的字符，与下一节拼接，跨页的片段不会丢失
+        tail = text[-(SHINGLE_CHARS - 1):]
+    return (digest.hexdigest() if size else None), frozenset(kept)
+
+
+def similarity(a, b):
+    """两个签名估算的 Jaccard 相似度（bottom-k 估计）；任一为空时返回 0"""
+    k = min(len(a), len(b))
+    if not k:
+        return 0.0
+    union_smallest = heapq.nsmallest(k, a | b)
+    return sum(1 for h in union_smallest if h in a and h in b) / k
+
+
+def deduplicate(contents, names, threshold=DEFAULT_THRESHOLD):
+    """contents[0] 为素材表，其余为支持文件（与 ingest_files 的结果顺序相同）。
+
+    返回 (保留的支持文件内容列表, [Duplicate, ...])。每个支持文件与素材表和排在它前面的已保留文件比较，
+    完全相同（同一个解析结果或规范化文本相同）或相似度达到 threshold 时跳过。
+    """
+    kept = []
+    seen = []
+    # 同一个解析结果对象（ingest_files 合并的相同上传文件）-> 第一份的文件名
+    owners = {}
+    duplicates = []
+    for index, (content, name) in enumerate(zip(contents, names)):
+        if is_parse_error(content):
+            if index:
+                kept.append(content)
+            continue
+        if id(content) in owners:
+            duplicates.append(Duplicate(name, owners[id(content)], 1.0, exact=True))
+            continue
+        owners[id(content)] = name
+        text_digest, signature = fingerprint(content)
+        match = None
+        if text_digest is not None:
+            for other_name, other_digest, other_signature in seen:
+                if text_digest == other_digest:
+                    match = (other_name, 1.0, True)
+                    break
+                score = similarity(signature, other_signature)
+                if score >= threshold and (match is None or score > match[1]):
+                    match = (other_name, score, False)
+        if index and match:
+            duplicates.append(Duplicate(name, match[0], round(match[1], 2), exact=match[2]))
+            continue
+        if text_digest is not None:
+            # 没有文字的文件（如扫描件）无从比较，保留但不作为比较对象
+            seen.append((name, text_digest, signature))
+        if index:
+            kept.append(content)
+    return kept, duplicates
@@ -0,0 +1,171 @@
+"""解析后的文档文本：保存在磁盘临时文件中，按节（PDF 为页）惰性读取。
+
+上传文件解析后不再以整段字符串留在会话中。文本写入临时文件，节之间以换页符（\\f）分隔，
+Document 只在内存中保留各节的偏移、字符数、估算 tokens 和内容摘要。
+分块分析与提示词组装通过 iter_sections() 逐节读取，每次只在内存中保留一节或一块，
+会话的内存占用不随上传文件的大小增长。没有被引用的 Document 被回收时删除其临时文件。
+
+流水线中的支持文件内容既可以是 Document，也可以是普通字符串（批量处理、旧的调用方），
+这里的辅助函数对两者一视同仁。
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import weakref
+
+from .prompt_budget import count_tokens
+
+SECTION_BREAK = "\f"
+# 读取 Document 全文时各节之间的分隔
+SECTION_JOIN = "\n\n"
+# 为空时使用系统临时目录
+DOCUMENT_DIR = os.environ.get("CVRL_DOCUMENT_DIR") or None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def new_document_path():
+    """在文档目录中创建一个空的临时文件，返回其路径"""
+    fd, path = tempfile.mkstemp(prefix="cvrl-doc-", suffix=".txt", dir=DOCUMENT_DIR)
+    os.close(fd)
+    return path
+
+
+def write_sections(sections, path):
+    """把逐节产出的文本写入 path（节之间以 SECTION_BREAK 分隔），返回写入的节数"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for section in sections:
+            if count:
+                f.write(SECTION_BREAK)
+            f.write(section)
+            count += 1
+    return count
+
+
+class Document:
+    """以 path 处的文件为内容的文档；owned 为 True 时文档被回收后删除该文件"""
+
+    def __init__(self, path, owned=True):
+        self.path = path
+        self._offsets = []
+        self.chars = 0
+        self.tokens = 0
+        digest = hashlib.sha256()
+        size = os.path.getsize(path)
+        if size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                while start <= size:
+                    end = mm.find(b"\f", start)
+                    end = size if end < 0 else end
+                    self._offsets.append((start, end))
+                    start = end + 1
+                    # 逐节解码统计，任一时刻只有一节在内存中
+                    section = mm[self._offsets[-1][0]:end]
+                    digest.update(section)
+                    digest.update(b"\f")
+                    text = section.decode("utf-8")
+                    self.chars += len(text)
+                    self.tokens += count_tokens(text)
+        if len(self._offsets) > 1:
+            self.chars += len(SECTION_JOIN) * (len(self._offsets) - 1)
+            self.tokens += count_tokens(SECTION_JOIN) * (len(self._offsets) - 1)
+        self.digest = digest.hexdigest()
+        self._finalizer = weakref.finalize(self, _remove, path) if owned else None
+
+    @classmethod
+    def from_sections(cls, sections):
+        path = new_document_path()
+        try:
+            write_sections(sections, path)
+            return cls(path)
+        except BaseException:
+            _remove(path)
+            raise
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_sections(text.split(SECTION_BREAK))
+
+    def sections(self):
+        """逐节产出文本"""
+        if not self._offsets:
+            return
+        with open(self.path, "rb") as f:
+            for start, end in self._offsets:
+                f.seek(start)
+                yield f.read(end - start).decode("utf-8")
+
+    def text(self):
+        """读取全文（只在内容必然要整体放入提示词时使用）"""
+        return SECTION_JOIN.join(self.sections())
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __len__(self):
+        return self.chars
+
+    def __str__(self):
+        return self.text()
+
+    def __repr__(self):
+        # 输入指纹按 repr 计算，只依赖内容摘要，不读取全文
+        return f"Document(sha256={self.digest}, chars={self.chars})"
+
+
+def iter_sections(content):
+    """逐节产出文档内容；普通字符串视为只有一节"""
+    if isinstance(content, Document):
+        yield from content.sections()
+    else:
+        yield content
+
+
+def content_tokens(content):
+    """文档内容的估算 tokens（Document 在创建时已统计，不必读取全文）"""
+    return content.tokens if isinstance(content, Document) else count_tokens(content)
+
+
+def files_tokens(contents, prefix, suffix=""):
+    """join_files(contents, prefix, suffix) 结果的估算 tokens"""
+    return sum(
+        count_tokens(prefix.format(index=i + 1) + suffix) + content_tokens(content)
+        for i, content in enumerate(contents)
+    )
+
+
+def join_files(contents, prefix, suffix="", max_chars=None):
+    """把多个文件拼接为提示词中的一段文本，每个文件前后加上 prefix / suffix（其中的 {index} 为从 1 开始的序号）。
+
+    设置了 max_chars 时读到该长度即停止，不再读取后面的节和文件。
+    """
+    parts = []
+    size = 0
+
+    def add(piece):
+        nonlocal size
+        parts.append(piece)
+        size += len(piece)
+        return max_chars is not None and size >= max_chars
+
+    for i, content in enumerate(contents):
+        if add(prefix.format(index=i + 1)):
+            break
+        full = False
+        for k, section in enumerate(iter_sections(content)):
+            if (k and add(SECTION_JOIN)) or add(section):
+                full = True
+                break
+        if full or add(suffix):
+            break
+    text = "".join(parts)
+    return text[:max_chars] if max_chars is not None else text
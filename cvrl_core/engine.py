@@ -0,0 +1,156 @@
+"""按配置组装两个应用和批量处理共用的运行环境。
+
+settings 可以是 st.secrets，也可以是普通字典（批量处理从 secrets.toml 和环境变量读取）。
+导入本模块不会创建任何客户端；setup_engine() 中的各项都是进程级缓存，
+Streamlit 每次重跑脚本时重复调用只命中缓存。
+"""
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .async_agents import AsyncAgentRunner, get_concurrency_limits
+from .llm_clients import configure_pool
+from .pipeline import discard_thread, input_fingerprint
+from .metrics import get_metrics, start_http_server
+from .prompt_budget import configure_budget
+from .response_cache import get_response_cache
+from .retry import get_retry_policy
+from .routing import DEFAULT_MAX_ERROR_RATE, get_router
+from .scheduler import get_scheduler
+from .tracing import get_tracer, init_langsmith
+
+DEFAULT_MODELS = ["qwen/qwen-max", "deepseek/deepseek-chat-v3-0324:free", "qwen-turbo", "其它模型..."]
+DEFAULT_LANGSMITH_PROJECT = "cv-assistant"
+
+
+@dataclass
+class Engine:
+    api_key: str
+    langsmith_api_key: str
+    langsmith_project: str
+    langsmith_client: Any = None
+    langsmith_init_error: Optional[str] = None
+    tracer: Any = None
+    response_cache: Any = None
+    limits: Any = None
+    router: Any = None
+    retry: Any = None
+    scheduler: Any = None
+    metrics: Any = None
+
+    def agent_runner(self, **kwargs):
+        """返回使用本环境追踪器、响应缓存、并发上限、限流排队、模型路由、重试策略和指标的 AsyncAgentRunner
+        （同时支持同步调用和 gather）"""
+        return AsyncAgentRunner(self.api_key, limits=self.limits, router=self.router, scheduler=self.scheduler,
+                                tracer=self.tracer, response_cache=self.response_cache, retry=self.retry,
+                                metrics=self.metrics, **kwargs)
+
+
+def _enabled(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def setup_engine(settings, default_project=DEFAULT_LANGSMITH_PROJECT):
+    """配置连接池、上下文预算、指标、LangSmith、响应缓存、并发上限、限流排队、模型路由和重试策略，返回 Engine"""
+    # 共享HTTP连接池上限（与当前设置相同时不做任何操作）
+    configure_pool(
+        max_connections=settings.get("HTTP_MAX_CONNECTIONS"),
+        max_keepalive_connections=settings.get("HTTP_MAX_KEEPALIVE"),
+        keepalive_expiry=settings.get("HTTP_KEEPALIVE_EXPIRY")
+    )
+    # 模型上下文窗口（可在 MODEL_CONTEXT_WINDOWS 中按模型名前缀覆盖）及为输出预留的tokens
+    configure_budget(
+        context_windows=settings.get("MODEL_CONTEXT_WINDOWS"),
+        reserve_output_tokens=settings.get("PROMPT_RESERVE_TOKENS")
+    )
+
+    # 配置 METRICS_PORT 时在该端口的 /metrics 提供 Prometheus 格式的指标（进程内只启动一次）
+    if settings.get("METRICS_PORT"):
+        start_http_server(settings.get("METRICS_PORT"))
+
+    # LangSmith配置（从配置或环境变量），并设置 LangChain 追踪所需的环境变量
+    langsmith_api_key = settings.get("LANGSMITH_API_KEY", os.environ.get("LANGSMITH_API_KEY", ""))
+    langsmith_project = settings.get("LANGSMITH_PROJECT", os.environ.get("LANGSMITH_PROJECT", default_project))
+    if langsmith_api_key:
+        os.environ["LANGCHAIN_TRACING_V2"] = "true"
+        os.environ["LANGCHAIN_API_KEY"] = langsmith_api_key
+        os.environ["LANGCHAIN_PROJECT"] = langsmith_project
+    # 客户端与项目检查在进程内缓存，超过TTL后才重新检查项目
+    langsmith_client, langsmith_init_error = init_langsmith(
+        langsmith_api_key,
+        langsmith_project,
+        ttl=int(settings.get("LANGSMITH_PROJECT_TTL", 3600))
+    )
+
+    return Engine(
+        api_key=settings.get("OPENROUTER_API_KEY", ""),
+        langsmith_api_key=langsmith_api_key,
+        langsmith_project=langsmith_project,
+        langsmith_client=langsmith_client,
+        langsmith_init_error=langsmith_init_error,
+        # 后台批量上报LangSmith运行记录，不阻塞生成流程
+        tracer=get_tracer(langsmith_api_key, langsmith_project) if langsmith_client else None,
+        # LLM响应缓存（默认关闭）：相同模型、温度和提示词直接返回上一次的响应
+        response_cache=get_response_cache(
+            _enabled(settings.get("LLM_RESPONSE_CACHE", "false")),
+            ttl_seconds=int(settings.get("LLM_RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+            max_mb=int(settings.get("LLM_RESPONSE_CACHE_MAX_MB", 256))
+        ),
+        # 全进程共享的模型调用并发上限（LLM_MODEL_CONCURRENCY 可按模型名单独设置）
+        limits=get_concurrency_limits(
+            settings.get("LLM_MAX_CONCURRENCY"),
+            settings.get("LLM_PER_MODEL_CONCURRENCY"),
+            settings.get("LLM_MODEL_CONCURRENCY")
+        ),
+        # 按 API Key 和模型限制每分钟调用次数，超出时排队（LLM_RATE_COORDINATOR 为 SQLite 文件时多个进程共享额度）
+        scheduler=get_scheduler(
+            per_key=settings.get("LLM_RATE_PER_KEY"),
+            per_model=settings.get("LLM_RATE_PER_MODEL"),
+            model_rates=settings.get("LLM_MODEL_RATES"),
+            burst=settings.get("LLM_RATE_BURST"),
+            coordinator=settings.get("LLM_RATE_COORDINATOR")
+        ),
+        # 模型后备链（MODEL_FALLBACKS 中按模型名配置，"*" 为默认链）、健康阈值与对冲请求
+        router=get_router(
+            fallbacks=settings.get("MODEL_FALLBACKS"),
+            max_error_rate=settings.get("MODEL_MAX_ERROR_RATE", DEFAULT_MAX_ERROR_RATE),
+            max_p95=settings.get("MODEL_MAX_P95"),
+            hedge_after=settings.get("MODEL_HEDGE_AFTER"),
+            attempt_timeout=settings.get("MODEL_ATTEMPT_TIMEOUT")
+        ),
+        # 暂时性错误（429、5xx、超时）的重试：指数退避加随机抖动，每个阶段共享 LLM_RETRY_STAGE_BUDGET 次重试
+        retry=get_retry_policy(
+            settings.get("LLM_RETRY_MAX_ATTEMPTS"),
+            settings.get("LLM_RETRY_BASE_DELAY"),
+            settings.get("LLM_RETRY_MAX_DELAY"),
+            settings.get("LLM_RETRY_STAGE_BUDGET")
+        ),
+        # 各阶段用时、tokens 和按 MODEL_PRICES（{模型: [每百万输入tokens美元, 每百万输出tokens美元]}）估算的费用
+        metrics=get_metrics(settings.get("MODEL_PRICES"))
+    )
+
+
+def available_models(settings, pinned=()):
+    """OPENROUTER_MODEL 中逗号分隔的模型列表（未配置时使用默认列表），pinned 中的模型固定排在最前"""
+    model_str = settings.get("OPENROUTER_MODEL", "")
+    models = [m.strip() for m in model_str.split(",") if m.strip()] if model_str else list(DEFAULT_MODELS)
+    for i, model in enumerate(pinned):
+        if model not in models:
+            models.insert(i, model)
+    return models
+
+
+def pipeline_thread(inputs, thread_id=None, fingerprint=None):
+    """返回本次运行使用的 (thread_id, 输入指纹)。
+
+    输入不变时沿用原 thread（上次运行失败则可从失败的阶段继续）；
+    输入变化时丢弃原 thread 的检查点并开启新的 thread。
+    """
+    import uuid
+
+    new_fingerprint = input_fingerprint(*[inputs[key] for key in sorted(inputs)])
+    if thread_id and fingerprint == new_fingerprint:
+        return thread_id, fingerprint
+    if thread_id:
+        discard_thread(thread_id)
+    return str(uuid.uuid4()), new_fingerprint
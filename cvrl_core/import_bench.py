@@ -0,0 +1,148 @@
+"""导入耗时基准：衡量两个应用冷启动时花在 import 上的时间。
+
+用法：
+    python -m cvrl_core.import_bench
+    python -m cvrl_core.import_bench --repeat 10 --history bench/import_times.jsonl
+
+每个目标都在全新的 Python 进程中导入（与新副本冷启动相同），重复多次取中位数。
+应用目标只执行应用脚本顶层的 import 语句，不运行页面；依赖目标单独衡量各个重型依赖，
+用于确认它们的成本已推迟到首次使用时。指定 --history 时结果追加写入 JSONL，
+并与上一条记录比较。导入 cvrl_core 时若加载了任何重型依赖，退出码为 1。
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPTS = {
+    "cv_app": os.path.join(REPO_ROOT, "CV2", "modified_code_V2.py"),
+    "rl_app": os.path.join(REPO_ROOT, "RL2", "rl_assistant.py"),
+}
+CORE_MODULES = [
+    "cvrl_core.engine", "cvrl_core.batch", "cvrl_core.cv_pipeline", "cvrl_core.rl_pipeline",
+    "cvrl_core.ingest", "cvrl_core.parse_cache", "cvrl_core.streaming",
+]
+# 只应在首次使用时导入的重型依赖
+HEAVY_MODULES = [
+    "markitdown", "pymupdf", "docx", "PIL", "rapidocr_onnxruntime", "langgraph", "langchain_openai", "langchain_core", "openai", "langsmith", "httpx",
+]
+
+_TIMER = """import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print({marker!r} + repr((elapsed, sorted(m for m in {heavy!r} if m in sys.modules))))
+"""
+_MARKER = "IMPORT_BENCH "
+
+
+def app_import_source(path):
+    """返回应用脚本中所有顶层 import 语句的源码"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def bench_targets():
+    targets = {name: app_import_source(path) for name, path in APP_SCRIPTS.items() if os.path.exists(path)}
+    targets["cvrl_core"] = "\n".join(f"import {module}" for module in CORE_MODULES)
+    for module in HEAVY_MODULES:
+        targets[module] = f"import {module}"
+    return targets
+
+
+def time_import(body, repeat=5):
+    """在 repeat 个全新进程中执行 body，返回耗时（秒）列表和导入后已加载的重型依赖；失败时抛出 RuntimeError"""
+    code = _TIMER.format(root=REPO_ROOT, body=body, marker=_MARKER, heavy=HEAVY_MODULES)
+    samples = []
+    loaded = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_ROOT)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith(_MARKER)), None)
+        if proc.returncode != 0 or line is None:
+            error = (proc.stderr.strip().splitlines() or ["未知错误"])[-1]
+            raise RuntimeError(error)
+        elapsed, loaded = ast.literal_eval(line[len(_MARKER):])
+        samples.append(elapsed)
+    return samples, loaded
+
+
+def run_bench(repeat=5):
+    results = {}
+    for name, body in bench_targets().items():
+        try:
+            samples, loaded = time_import(body, repeat)
+        except RuntimeError as e:
+            results[name] = {"error": str(e)}
+            continue
+        results[name] = {
+            "median_ms": round(statistics.median(samples) * 1000, 1),
+            "min_ms": round(min(samples) * 1000, 1),
+            "heavy_loaded": loaded,
+        }
+    return results
+
+
+def _last_record(history_path):
+    if not history_path or not os.path.exists(history_path):
+        return None
+    last = None
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def format_results(results, previous=None):
+    previous_results = (previous or {}).get("results", {})
+    lines = []
+    for name, result in results.items():
+        if "error" in result:
+            lines.append(f"{name:<18} 无法导入: {result['error']}")
+            continue
+        line = f"{name:<18} 中位数 {result['median_ms']:>8.1f} ms  最小 {result['min_ms']:>8.1f} ms"
+        before = previous_results.get(name, {}).get("median_ms")
+        if before:
+            line += f"  较上次 {result['median_ms'] - before:+.1f} ms"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cvrl_core.import_bench", description="衡量两个应用冷启动的导入耗时")
+    parser.add_argument("--repeat", type=int, default=5, help="每个目标启动的进程数（默认 5）")
+    parser.add_argument("--history", help="追加写入结果的 JSONL 文件，并与其中最后一条记录比较")
+    args = parser.parse_args(argv)
+
+    results = run_bench(max(1, args.repeat))
+    previous = _last_record(args.history)
+    print(format_results(results, previous))
+
+    if args.history:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    leaked = results.get("cvrl_core", {}).get("heavy_loaded")
+    if leaked:
+        print(f"导入 cvrl_core 时加载了重型依赖: {', '.join(leaked)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""上传文档的并行解析。
+
+素材表和所有支持文件一起提交到一个有界的进程池中转换（文档解析是 CPU 密集型，
+线程无法并行）。结果按上传顺序返回，每个文件单独计时，超时或解析进程崩溃只影响该文件本身。
+每个文件从开始解析到完成的用时按状态计入 cvrl_parse_seconds 指标。
+
+转换按文件头识别的类型分派：有文本层的 PDF 用 PyMuPDF 逐页提取，DOCX 用 python-docx 直接读取，
+两者都比 MarkItDown 快得多；PNG / JPEG 图片用本地 OCR 识别（见 ocr.py）。
+扫描件 PDF、其他格式、缺少依赖或快速路径出错时退回 MarkItDown。
+
+上传文件先分块写入临时文件，解析进程按路径读取，并把文本逐页（逐节）写入另一个临时文件，
+结果以 documents.Document 返回，由下游按节惰性读取，内容不经过进程间管道，也不在内存中整体保留。
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from cvrl_core.documents import DOCUMENT_DIR, Document, new_document_path, write_sections
+from cvrl_core.metrics import get_metrics
+from cvrl_core.ocr import ocr_image
+from cvrl_core.parse_cache import get_parse_cache
+
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_TIMEOUT = 120
+# 前几页平均每页少于该字符数时视为没有文本层的扫描件
+MIN_PAGE_CHARS = 40
+TEXT_LAYER_SAMPLE_PAGES = 3
+# 解析进程异常退出时，同一文件最多重新提交的次数
+MAX_ATTEMPTS = 2
+# 上传文件写入临时文件时每次写入的字节数
+SPOOL_BLOCK = 1024 * 1024
+
+# 进程数 -> 共享进程池
+_executors = {}
+# 已丢弃（超时或崩溃）的进程池，仍在使用它们的调用方据此把任务重新提交到新的进程池
+_discarded = weakref.WeakSet()
+_executor_lock = threading.Lock()
+
+
+class NoTextLayer(ValueError):
+    """PDF 没有可用的文本层（扫描件）"""
+
+
+def _read_head(source, size=1024):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def _as_file(source):
+    """第三方库的输入：文件路径原样传入（由库按需读取），字节包装为 BytesIO"""
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def detect_type(source):
+    """按文件头识别类型：pdf、docx、doc、image 或 other。source 为文件字节或路径"""
+    head = _read_head(source)
+    if b"%PDF-" in head:
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(_as_file(source)) as z:
+                return "docx" if "word/document.xml" in z.namelist() else "other"
+        except zipfile.BadZipFile:
+            return "other"
+    if head.startswith(b"\xd0\xcf\x11\xe0"):
+        return "doc"
+    if head.startswith(b"\x89PNG") or head.startswith(b"\xff\xd8\xff"):
+        return "image"
+    return "other"
+
+
+def iter_pdf_pages(source):
+    """用 PyMuPDF 逐页提取 PDF 文本层，每次产出一页的文本；source 为路径时按需读取文件"""
+    try:
+        import pymupdf
+    except ImportError:
+        # PyMuPDF 1.24 之前只提供 fitz 模块名
+        import fitz as pymupdf
+
+    doc = pymupdf.open(source) if isinstance(source, str) else pymupdf.open(stream=source, filetype="pdf")
+    with doc:
+        if doc.needs_pass:
+            raise ValueError("PDF 已加密")
+        for page in doc:
+            yield page.get_text("text").strip()
+
+
+def pdf_sections(source):
+    """逐页产出有文本层的 PDF 的文本；判断为扫描件时抛出 NoTextLayer（在产出任何一页之前）"""
+    pages = iter_pdf_pages(source)
+    # 扫描件在前几页就能看出来，先读这几页判断，不必读完整个文件
+    sample = []
+    for text in pages:
+        sample.append(text)
+        if len(sample) == TEXT_LAYER_SAMPLE_PAGES:
+            break
+    if not sample or sum(map(len, sample)) < MIN_PAGE_CHARS * len(sample):
+        raise NoTextLayer("PDF 没有文本层")
+    yield from sample
+    yield from pages
+
+
+def _docx_paragraph(paragraph):
+    text = paragraph.text.strip()
+    if not text:
+        return ""
+    style = (paragraph.style.name if paragraph.style is not None else "") or ""
+    if style == "Title":
+        return f"# {text}"
+    if style.startswith("Heading"):
+        level = style[len("Heading"):].strip()
+        return f"{'#' * min(6, int(level) if level.isdigit() else 1)} {text}"
+    if style.startswith("List"):
+        return f"- {text}"
+    return text
+
+
+def _docx_table(table):
+    rows = []
+    for row in table.rows:
+        cells = [" ".join(cell.text.split()).replace("|", "\\|") for cell in row.cells]
+        rows.append("| " + " | ".join(cells) + " |")
+    if not rows:
+        return ""
+    width = len(table.rows[0].cells)
+    rows.insert(1, "|" + " --- |" * width)
+    return "\n".join(rows)
+
+
+def docx_sections(source):
+    """用 python-docx 按正文顺序提取段落（标题、列表转为 markdown）和表格，以标题为界逐节产出"""
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(_as_file(source))
+    blocks = []
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            block = _docx_paragraph(Paragraph(element, document))
+        elif tag == "tbl":
+            block = _docx_table(Table(element, document))
+        else:
+            continue
+        if block.startswith("#") and blocks:
+            yield "\n\n".join(blocks)
+            blocks = []
+        if block:
+            blocks.append(block)
+    if blocks:
+        yield "\n\n".join(blocks)
+
+
+def markitdown_sections(source):
+    """用 MarkItDown 转换任意格式（整份输出；PDF 的页间换页符由 Document 识别为节）"""
+    from markitdown import MarkItDown
+
+    yield MarkItDown().convert(_as_file(source)).text_content
+
+
+def image_sections(source):
+    """用本地 OCR 识别图片中的文字（整张图片为一节）；没有识别出文字时抛出 ValueError"""
+    text = ocr_image(_as_file(source))
+    if not text:
+        raise ValueError("图片中没有识别出文字")
+    yield text
+
+
+FAST_CONVERTERS = {"pdf": pdf_sections, "docx": docx_sections, "image": image_sections}
+
+
+def convert_file(source_path, output_path, started_path=None):
+    """在解析进程中转换 source_path，逐节写入 output_path（见 documents.write_sections）。
+
+    先走按类型的快速路径，再退回 MarkItDown；成功时返回 None，失败时返回错误说明。
+    提供 started_path 时开始转换前先创建该文件，供主进程得知任务何时真正开始运行。
+    """
+    if started_path:
+        open(started_path, "wb").close()
+    converter = FAST_CONVERTERS.get(detect_type(source_path))
+    if converter is not None:
+        try:
+            write_sections(converter(source_path), output_path)
+            return None
+        except Exception:
+            # 缺少依赖、扫描件或文件不规范，交给 MarkItDown 再试一次（重新写入会覆盖已写的部分）
+            pass
+    try:
+        write_sections(markitdown_sections(source_path), output_path)
+    except Exception as e:
+        return f"[MarkItDown 解析失败: {e}]"
+    return None
+
+
+def is_parse_error(content):
+    return isinstance(content, str) and (
+        content.startswith("[MarkItDown 解析失败") or content.startswith("[文档解析")
+    )
+
+
+def _mp_context():
+    # Streamlit 进程内有多个线程，fork 不安全；优先使用 forkserver
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_executor(max_workers):
+    """返回 max_workers 个进程的共享进程池。进程数不同的调用方各用一个进程池，不会关闭别人正在使用的进程池"""
+    with _executor_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context())
+        return executor
+
+
+def _is_discarded(executor):
+    with _executor_lock:
+        return executor in _discarded
+
+
+def _discard_executor(executor):
+    """丢弃卡住或已损坏的进程池，并强制结束其中仍在运行的解析进程。
+
+    进程池由所有会话共享：其中其他调用方的任务不取消，由各调用方发现进程池已丢弃后重新提交。
+    可以对同一个进程池重复调用。
+    """
+    with _executor_lock:
+        for size, current in list(_executors.items()):
+            if current is executor:
+                del _executors[size]
+        _discarded.add(executor)
+    # ProcessPoolExecutor 没有公开的终止接口，只能直接结束其工作进程；
+    # 进程池已被关闭时 _processes 为 None
+    try:
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+    except RuntimeError:
+        # 进程池的管理线程正在修改进程表
+        processes = []
+    for process in processes:
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    executor.shutdown(wait=False)
+
+
+def _spool(file):
+    """把上传文件写入临时文件（分块写入，不复制整份内容），返回 (路径, SHA-256)"""
+    fd, path = tempfile.mkstemp(prefix="cvrl-upload-", dir=DOCUMENT_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if hasattr(file, "getbuffer"):
+                # BytesIO / Streamlit UploadedFile：直接使用已在内存中的缓冲区
+                with file.getbuffer() as buffer:
+                    for offset in range(0, len(buffer), SPOOL_BLOCK):
+                        block = buffer[offset:offset + SPOOL_BLOCK]
+                        digest.update(block)
+                        out.write(block)
+            else:
+                for block in iter(lambda: file.read(SPOOL_BLOCK), b""):
+                    digest.update(block)
+                    out.write(block)
+    except BaseException:
+        _remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _started_path(output):
+    return f"{output}.started"
+
+
+def _discard_output(output):
+    _remove(output)
+    _remove(_started_path(output))
+
+
+def ingest_files(files, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT, on_progress=None):
+    """并行解析多个文件，按上传顺序返回结果列表：成功时为 Document，失败时为错误说明字符串。
+
+    files 中的元素可以是上传的文件对象（先分块写入临时文件），也可以是文件路径（直接读取）；
+    解析进程从磁盘读取源文件并逐节写出文本，主进程不持有文件内容的完整副本。
+    on_progress(完成数, 总数, 文件名, 状态) 在每个文件完成时于调用线程中回调。
+    """
+    files = list(files)
+    total = len(files)
+    names = [
+        os.path.basename(f) if isinstance(f, (str, os.PathLike)) else getattr(f, "name", f"文件{i+1}")
+        for i, f in enumerate(files)
+    ]
+    results = [None] * total
+    done_count = 0
+    metrics = get_metrics()
+    begin = {}
+    spooled = []
+    pending = {}
+
+    def finish(index, content, status):
+        nonlocal done_count
+        results[index] = content
+        done_count += 1
+        metrics.observe("cvrl_parse_seconds", time.monotonic() - begin.get(index, time.monotonic()), status=status)
+        if on_progress:
+            on_progress(done_count, total, names[index], status)
+
+    try:
+        # 先查解析缓存，命中的文件无需进入进程池
+        parse_cache = get_parse_cache()
+        # 内容完全相同的文件只解析一次，与第一份共用解析结果
+        first_of = {}
+        copies = {}
+        for i, f in enumerate(files):
+            begin[i] = time.monotonic()
+            if isinstance(f, (str, os.PathLike)):
+                source, digest = os.fspath(f), _file_digest(f)
+            else:
+                source, digest = _spool(f)
+                spooled.append(source)
+            if digest in first_of:
+                copies[i] = first_of[digest]
+                continue
+            first_of[digest] = i
+            cached = parse_cache.get_document(digest)
+            if cached is not None:
+                finish(i, cached, "命中缓存")
+            else:
+                pending[i] = (source, digest, new_document_path())
+
+        # 每个文件所在的进程池异常退出的次数（其他调用方因超时丢弃进程池的不计入）
+        attempts = {i: 0 for i in pending}
+        while pending:
+            executor = _get_executor(max_workers)
+            futures = {}
+            try:
+                for i, (source, _, output) in pending.items():
+                    # 上一次提交时被结束的解析进程可能已创建开始标记
+                    _remove(_started_path(output))
+                    futures[executor.submit(convert_file, source, output, _started_path(output))] = i
+            except RuntimeError:
+                # 进程池在提交期间被其他调用方丢弃（已关闭的进程池拒绝提交），换新的进程池重新提交
+                _discard_executor(executor)
+                continue
+
+            started = {}
+            discard = False
+            while futures:
+                done, _ = wait(futures, timeout=0.2, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future in done:
+                    i = futures.pop(future)
+                    try:
+                        error = future.result()
+                    except (BrokenProcessPool, CancelledError):
+                        # 进程池已损坏或已被丢弃，保留在 pending 中重新提交。
+                        # 崩溃时无法判断是哪个文件导致，每个文件都计一次；因超时被丢弃的进程池不计
+                        discard = True
+                        if _is_discarded(executor):
+                            continue
+                        attempts[i] += 1
+                        if attempts[i] >= MAX_ATTEMPTS:
+                            _discard_output(pending.pop(i)[2])
+                            finish(i, "[文档解析失败: 解析进程异常退出]", "失败")
+                        continue
+                    except Exception as e:
+                        error = f"[MarkItDown 解析失败: {e}]"
+                    _, digest, output = pending.pop(i)
+                    _remove(_started_path(output))
+                    if error:
+                        _remove(output)
+                        finish(i, error, "失败")
+                    else:
+                        document = Document(output)
+                        parse_cache.put_document(digest, document)
+                        finish(i, document, "完成")
+
+                # 记录每个任务开始运行的时间，按各自的运行时长判断超时。进程池由所有会话共享，
+                # 排在前面的可能是其他调用方的任务，因此以解析进程创建的开始标记为准，不按 running() 推断
+                for future, i in futures.items():
+                    if future not in started and os.path.exists(_started_path(pending[i][2])):
+                        started[future] = now
+                        # 解析用时从真正开始运行时算起，不含在进程池中排队的时间
+                        begin[i] = now
+                for future, i in list(futures.items()):
+                    if future in started and now - started[future] > timeout:
+                        futures.pop(future)
+                        _discard_output(pending.pop(i)[2])
+                        discard = True
+                        finish(i, f"[文档解析超时: 超过 {timeout} 秒，已跳过]", "超时")
+
+                if not discard and futures and _is_discarded(executor):
+                    # 其他调用方因超时丢弃了这个进程池
+                    discard = True
+                if discard and futures:
+                    # 卡住或崩溃的进程会占用进程池，剩余文件换一个新进程池重新提交
+                    break
+
+            if discard:
+                _discard_executor(executor)
+
+        for i, first in copies.items():
+            finish(i, results[first], "重复文件")
+    finally:
+        for path in spooled:
+            _remove(path)
+        # 中途抛出异常（如 Streamlit 停止脚本）时清理未完成文件的输出
+        for _, _, output in pending.values():
+            _discard_output(output)
+
+    return results
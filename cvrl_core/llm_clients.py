@@ -0,0 +1,132 @@
+"""进程级 LLM 客户端复用。
+
+Streamlit 每次重跑脚本都会重新构造 ChatOpenAI / openai.OpenAI，导致每个阶段都要重新建立
+到 openrouter.ai 的 TCP/TLS 连接。这里按 (base_url, model, temperature) 缓存客户端，
+同一 base_url 的所有客户端共用一个带 keep-alive 的 httpx 连接池，在各会话之间共享。
+异步调用（ainvoke/astream）使用同样上限的 httpx.AsyncClient 连接池，只在后台事件循环中使用。
+"""
+import hashlib
+import os
+import threading
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+_pool_limits = {
+    "max_connections": int(os.environ.get("CVRL_HTTP_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.environ.get("CVRL_HTTP_MAX_KEEPALIVE", "20")),
+    "keepalive_expiry": float(os.environ.get("CVRL_HTTP_KEEPALIVE_EXPIRY", "60")),
+}
+_http_clients = {}
+_async_http_clients = {}
+_chat_models = {}
+_openai_clients = {}
+_lock = threading.Lock()
+
+
+def configure_pool(max_connections=None, max_keepalive_connections=None, keepalive_expiry=None):
+    """设置连接池上限。与当前设置不同时会丢弃已有连接池，之后的客户端按新上限创建"""
+    new_limits = dict(_pool_limits)
+    if max_connections is not None:
+        new_limits["max_connections"] = int(max_connections)
+    if max_keepalive_connections is not None:
+        new_limits["max_keepalive_connections"] = int(max_keepalive_connections)
+    if keepalive_expiry is not None:
+        new_limits["keepalive_expiry"] = float(keepalive_expiry)
+    with _lock:
+        if new_limits == _pool_limits:
+            return
+        _pool_limits.update(new_limits)
+        # 旧连接池上可能仍有进行中的请求，不主动关闭，等待其被回收
+        _http_clients.clear()
+        _async_http_clients.clear()
+        _chat_models.clear()
+        _openai_clients.clear()
+
+
+def _key_digest(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _pool_options():
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=_pool_limits["max_connections"],
+            max_keepalive_connections=_pool_limits["max_keepalive_connections"],
+            keepalive_expiry=_pool_limits["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(600.0, connect=10.0),
+    }
+
+
+def _get_http_client(base_url):
+    # 调用方需持有 _lock
+    import httpx
+
+    client = _http_clients.get(base_url)
+    if client is None:
+        client = httpx.Client(**_pool_options())
+        _http_clients[base_url] = client
+    return client
+
+
+def _get_async_http_client(base_url):
+    # 调用方需持有 _lock
+    import httpx
+
+    client = _async_http_clients.get(base_url)
+    if client is None:
+        client = httpx.AsyncClient(**_pool_options())
+        _async_http_clients[base_url] = client
+    return client
+
+
+def get_chat_model(api_key, model, temperature=0.7, base_url=OPENROUTER_BASE_URL):
+    """获取共享的 ChatOpenAI 实例"""
+    from langchain_openai import ChatOpenAI
+
+    key = (base_url, model, temperature, _key_digest(api_key))
+    with _lock:
+        llm = _chat_models.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                temperature=temperature,
+                # 重试由 AgentRunner 按 retry.RetryPolicy 统一处理（含阶段重试额度），客户端不再自行重试
+                max_retries=0,
+                http_client=_get_http_client(base_url),
+                http_async_client=_get_async_http_client(base_url),
+            )
+            _chat_models[key] = llm
+        return llm
+
+
+def get_openai_client(api_key, base_url=OPENROUTER_BASE_URL):
+    """获取共享的 openai.OpenAI 客户端"""
+    import openai
+
+    key = (base_url, _key_digest(api_key))
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_get_http_client(base_url),
+            )
+            _openai_clients[key] = client
+        return client
+
+
+def pool_stats():
+    with _lock:
+        return {
+            "http_pools": len(_http_clients),
+            "async_http_pools": len(_async_http_clients),
+            "chat_models": len(_chat_models),
+            "openai_clients": len(_openai_clients),
+            **_pool_limits,
+        }
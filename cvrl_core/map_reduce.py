@@ -0,0 +1,204 @@
+"""支持文件的 map-reduce 分析。
+
+先把每个支持文件（过长的文件再按页和段落切块）分别交给 LLM 分析（map），
+各块并行调用，单次调用的输入长度有上限；最后把各块的分析结果合并为一份
+符合原输出格式的报告（reduce）。合并结果本身过长时分批逐层合并。
+文件块按需逐节读取和生成，同一时刻只有正在分析的若干块在内存中。
+"""
+from itertools import islice
+
+from .documents import iter_sections
+
+DEFAULT_CHUNK_CHARS = 20000
+DEFAULT_MAX_WORKERS = 4
+
+MAP_INSTRUCTION = """以下只是全部支持文件中的一部分（{label}）。请只根据这部分内容提取其中出现的经历信息，
+按输出格式整理；本部分未涉及的经历类别可以省略，不要编造未出现的信息。"""
+
+REDUCE_INSTRUCTION = """以下是对各个支持文件（或文件片段）分别分析得到的结果。请将它们合并为一份完整的报告：
+同一经历在多份结果中出现时合并为一个条目并整合全部细节，去除重复内容，按输出格式整理并按时间倒序排列。"""
+
+
+def _iter_pieces(content, max_chars):
+    """把一个文件按节（再按段落）依次装入不超过 max_chars 的片段"""
+    current = ""
+    yielded = False
+    for section in iter_sections(content):
+        for piece in _split_text(section, max_chars):
+            if current and len(current) + len(piece) + 2 > max_chars:
+                yield current
+                yielded = True
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    # 空文件也产出一块，与其他文件一样出现在分析结果中
+    if current or not yielded:
+        yield current
+
+
+def count_chunks(files_content, max_chars=DEFAULT_CHUNK_CHARS):
+    """iter_chunks() 将产出的块数（逐节读取计数，不保留内容）"""
+    return sum(sum(1 for _ in _iter_pieces(content, max_chars)) for content in files_content)
+
+
+def iter_chunks(files_content, max_chars=DEFAULT_CHUNK_CHARS):
+    """逐块产出 (标签, 文本)；每个文件至少一块，超过 max_chars 的文件按页和段落切分"""
+    for i, content in enumerate(files_content):
+        total = sum(1 for _ in _iter_pieces(content, max_chars))
+        for k, piece in enumerate(_iter_pieces(content, max_chars)):
+            label = f"文件 {i+1}" if total == 1 else f"文件 {i+1} 第 {k+1}/{total} 部分"
+            yield label, piece
+
+
+def _split_text(text, max_chars):
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        # 单个段落本身超长时按长度硬切
+        while len(paragraph) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def build_map_prompt(persona, task, output_format, label, text, context=""):
+    prompt = f"""人物设定：{persona}
+
+任务描述：{task}
+
+{MAP_INSTRUCTION.format(label=label)}
+
+输出格式：{output_format}
+"""
+    if context:
+        prompt += f"\n{context}\n"
+    prompt += f"\n支持文件内容（{label}）：\n{text}\n"
+    return prompt
+
+
+def build_reduce_prompt(persona, output_format, partial_results):
+    joined = "\n\n".join(f"--- 分析结果 {i+1} ---\n{result}" for i, result in enumerate(partial_results))
+    return f"""人物设定：{persona}
+
+任务描述：{REDUCE_INSTRUCTION}
+
+输出格式：{output_format}
+
+各部分分析结果：
+{joined}
+"""
+
+
+def map_reduce(items, map_all, reduce_fn, max_workers=DEFAULT_MAX_WORKERS, max_reduce_chars=None,
+               on_progress=None, total=None):
+    """分批执行 map_all(batch, on_progress)（按顺序返回该批每一项的 map 结果，例如交给异步执行器并发调用），
+    再用 reduce_fn(结果列表) 合并。
+
+    结果按 items 的顺序交给 reduce_fn；只有一项时直接返回其 map 结果。
+    items 可以是迭代器（此时 total 为其项数），按需取出，每批不超过 2 * max_workers 项。
+    设置了 max_reduce_chars 时，结果总长度超过该值会分批合并，直到只剩一份。
+    on_progress(已完成数, 总数) 在调用线程中回调。
+    """
+    if total is None:
+        items = list(items)
+        total = len(items)
+    if not total:
+        return ""
+    items = iter(items)
+    window = 2 * max(1, max_workers)
+    results = []
+    while True:
+        batch = list(islice(items, window))
+        if not batch:
+            break
+        offset = len(results)
+        results.extend(map_all(batch, on_progress and (lambda done, _: on_progress(offset + done, total))))
+
+    while len(results) > 1:
+        batches = _reduce_batches(results, max_reduce_chars)
+        if len(batches) == len(results):
+            # 每个结果都已超过上限，无法再分批，只能整体合并
+            batches = [results]
+        results = [reduce_fn(batch) if len(batch) > 1 else batch[0] for batch in batches]
+    return results[0]
+
+
+def _reduce_batches(results, max_chars):
+    if not max_chars:
+        return [results]
+    batches = [[]]
+    size = 0
+    for result in results:
+        if batches[-1] and size + len(result) > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(result)
+        size += len(result)
+    return batches
+
+
+def analyze_support_chunks(chunks, config, run_id, chunk_chars, agent_name, context="", progress=(0, 40),
+                           step="第一阶段", total=None):
+    """流水线节点中逐块并行分析支持文件，再合并为一份支持文件分析报告。
+
+    chunks 可以是 iter_chunks() 返回的迭代器，此时 total 为块数。
+    各块的分析通过 config["configurable"]["gather_agents"] 分批并发提交，合并通过 ["run_agent"] 调用；
+    map 调用记为 f"{agent_name}_map"，合并调用记为 agent_name。progress 为本阶段在进度条上占用的区间。
+    """
+    from .pipeline import show_progress
+
+    configurable = config["configurable"]
+    inputs = configurable["inputs"]
+    ui = configurable["ui"]
+    run_agent = configurable["run_agent"]
+    gather_agents = configurable["gather_agents"]
+
+    def chunk_prompt(chunk):
+        label, text = chunk
+        return build_map_prompt(
+            inputs["support_analyst_persona"],
+            inputs["support_analyst_task"],
+            inputs["support_analyst_output_format"],
+            label,
+            text,
+            context=context
+        )
+
+    def analyze_all(chunks, on_done):
+        return gather_agents(
+            [(f"{agent_name}_map", inputs["support_analyst_model"], chunk_prompt(chunk), run_id) for chunk in chunks],
+            on_done=on_done
+        )
+
+    def merge(partial_results):
+        merge_prompt = build_reduce_prompt(
+            inputs["support_analyst_persona"],
+            inputs["support_analyst_output_format"],
+            partial_results
+        )
+        show_progress(ui, text=f"{step}：正在合并 {len(partial_results)} 份分析结果...")
+        return run_agent(agent_name, inputs["support_analyst_model"], merge_prompt, run_id)
+
+    def on_progress(done, total):
+        start, end = progress
+        show_progress(ui, start + int((end - start) * done / total), f"{step}：已分析 {done}/{total} 个文件片段")
+
+    return map_reduce(
+        chunks,
+        analyze_all,
+        merge,
+        max_workers=inputs.get("support_map_workers", DEFAULT_MAX_WORKERS),
+        max_reduce_chars=chunk_chars,
+        on_progress=on_progress,
+        total=total
+    )
@@ -0,0 +1,228 @@
+"""进程内的运行指标：文件解析用时、各 Agent 的首个 token 用时、总用时、tokens 和估算费用。
+
+指标按标签（Agent、模型、状态）汇总为直方图和计数器，供“系统状态”页展示，
+也可以导出为 Prometheus 文本格式：界面上下载、写入 node_exporter 的 textfile 目录，
+或配置 METRICS_PORT 后由 start_http_server() 在 /metrics 提供拉取。
+"""
+import bisect
+import threading
+
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+# 指标名 -> (类型, 说明, 直方图分桶)
+METRICS = {
+    "cvrl_parse_seconds": ("histogram", "每个上传文件的解析用时（秒）", SECONDS_BUCKETS),
+    "cvrl_llm_ttft_seconds": ("histogram", "流式调用的首个 token 用时（秒）", SECONDS_BUCKETS),
+    "cvrl_llm_latency_seconds": ("histogram", "模型调用总用时（秒，含重试和排队）", SECONDS_BUCKETS),
+    "cvrl_llm_prompt_tokens": ("histogram", "每次调用的提示词 tokens", TOKEN_BUCKETS),
+    "cvrl_llm_completion_tokens": ("histogram", "每次调用的输出 tokens", TOKEN_BUCKETS),
+    "cvrl_llm_calls_total": ("counter", "模型调用次数", None),
+    "cvrl_llm_cost_usd_total": ("counter", "按 MODEL_PRICES 估算的费用（美元）", None),
+}
+
+_metrics = None
+_metrics_lock = threading.Lock()
+_server = None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按分桶上界估算分位数，落在最后一个桶时返回 None（超过最大分桶）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """按 (指标名, 标签) 汇总的直方图和计数器，可在任意线程中记录"""
+
+    def __init__(self, prices=None):
+        # prices: {模型: [每百万提示词 tokens 美元, 每百万输出 tokens 美元]}；名称以 ":free" 结尾的模型按免费计
+        self.prices = {model: tuple(float(p) for p in price) for model, price in (prices or {}).items()}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        if value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        """估算一次调用的费用（美元），模型没有配置价格时返回 None"""
+        price = self.prices.get(model)
+        if price is None:
+            return 0.0 if model.endswith(":free") else None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def record_call(self, agent, model, timing, prompt_tokens, completion_tokens, ok=True):
+        """记录一次模型调用；命中响应缓存的调用只计入次数"""
+        status = "cached" if timing.get("cached") else ("ok" if ok else "error")
+        self.inc("cvrl_llm_calls_total", agent=agent, model=model, status=status)
+        if status != "ok":
+            return
+        self.observe("cvrl_llm_ttft_seconds", timing.get("ttft"), agent=agent, model=model)
+        self.observe("cvrl_llm_latency_seconds", timing.get("total"), agent=agent, model=model)
+        self.observe("cvrl_llm_prompt_tokens", prompt_tokens, agent=agent, model=model)
+        self.observe("cvrl_llm_completion_tokens", completion_tokens, agent=agent, model=model)
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        if cost:
+            self.inc("cvrl_llm_cost_usd_total", cost, agent=agent, model=model)
+
+    def agent_summary(self):
+        """按 (Agent, 模型) 汇总的调用统计，供界面以表格展示"""
+        rows = {}
+        with self._lock:
+            for (name, labels), series in self._series.items():
+                labels = dict(labels)
+                if "agent" not in labels:
+                    continue
+                row = rows.setdefault((labels["agent"], labels["model"]), {
+                    "Agent": labels["agent"], "模型": labels["model"], "调用": 0, "失败": 0,
+                    "平均首token(秒)": None, "平均用时(秒)": None, "p95用时(秒)": None,
+                    "提示词tokens": 0, "输出tokens": 0, "费用(美元)": 0.0,
+                })
+                if name == "cvrl_llm_calls_total":
+                    row["调用"] += series
+                    if labels["status"] == "error":
+                        row["失败"] += series
+                elif name == "cvrl_llm_cost_usd_total":
+                    row["费用(美元)"] = round(series, 4)
+                elif name == "cvrl_llm_ttft_seconds":
+                    row["平均首token(秒)"] = round(series.sum / series.count, 2)
+                elif name == "cvrl_llm_latency_seconds":
+                    row["平均用时(秒)"] = round(series.sum / series.count, 2)
+                    row["p95用时(秒)"] = series.quantile(0.95)
+                elif name == "cvrl_llm_prompt_tokens":
+                    row["提示词tokens"] = int(series.sum)
+                elif name == "cvrl_llm_completion_tokens":
+                    row["输出tokens"] = int(series.sum)
+        return sorted(rows.values(), key=lambda row: (row["Agent"], row["模型"]))
+
+    def parse_summary(self):
+        """按解析状态汇总的文件数和用时"""
+        with self._lock:
+            return {
+                dict(labels).get("status", ""): {"files": series.count, "seconds": series.sum,
+                                                 "p95": series.quantile(0.95)}
+                for (name, labels), series in self._series.items() if name == "cvrl_parse_seconds"
+            }
+
+    def reset(self):
+        """清除已记录的全部数据（保留模型价格）"""
+        with self._lock:
+            self._series = {}
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+            lines = []
+            for name, (kind, help_text, _) in METRICS.items():
+                matching = [(labels, value) for (metric, labels), value in series if metric == name]
+                if not matching:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in matching:
+                    if kind == "counter":
+                        lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(float(value.sum))}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """原子地写入 Prometheus 文本文件（供 node_exporter textfile collector 读取）"""
+        import os
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+def get_metrics(prices=None):
+    """返回进程内共享的指标；prices 不为 None 时更新模型价格，保留已有数据"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry(prices)
+        elif prices is not None:
+            _metrics.prices = MetricsRegistry(prices).prices
+        return _metrics
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """在后台线程中提供 http://host:port/metrics（进程内只启动一次）；端口已被占用时返回 None"""
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _metrics_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), Handler)
+            except OSError:
+                # 同一台机器上的其他进程（如另一个应用或批量处理）已在提供该端口
+                return None
+            threading.Thread(target=_server.serve_forever, name="cvrl-metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,172 @@
+"""离线基准测试使用的本地替身：OpenAI 兼容的模型服务和 LangSmith 接收端。
+
+MockOpenRouter 在本机端口上实现 POST /v1/chat/completions（支持 stream=true 的 SSE 输出），
+按配置的首 token 延迟和每秒 tokens 速率返回内容，并可按比例注入错误（默认 503，429 时带 Retry-After）。
+返回内容由请求的哈希决定，同样的提示词得到同样的输出。
+
+LangSmithSink 实现 tracing.BackgroundTracer 使用的 create_run / update_run，只在内存中计数，
+可设置每次调用的延迟来模拟较慢的 LangSmith。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+FILLER = "该学生在项目中承担了主要工作，取得了可量化的成果，并展现出良好的沟通与领导能力。"
+
+
+class MockOpenRouter:
+    def __init__(self, latency=0.5, tokens_per_second=80, output_tokens=400, error_rate=0.0, error_status=503,
+                 seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "prompt_chars": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _tokens(self, body):
+        # 每个 token 为 FILLER 中的一个字，输出长度固定，内容随提示词变化
+        digest = hashlib.sha256(json.dumps(body.get("messages"), ensure_ascii=False).encode("utf-8")).hexdigest()
+        offset = int(digest[:8], 16) % len(FILLER)
+        return [FILLER[(offset + i) % len(FILLER)] for i in range(self.output_tokens)]
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                mock._count("requests")
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+                mock._count("prompt_chars", prompt_chars)
+                time.sleep(mock.latency)
+                if mock._should_fail():
+                    mock._count("errors")
+                    headers = {"Retry-After": "0"} if mock.error_status == 429 else None
+                    self._json(mock.error_status, {"error": {"message": "injected error", "code": mock.error_status}},
+                               headers)
+                    return
+                tokens = mock._tokens(body)
+                usage = {"prompt_tokens": max(1, prompt_chars // 2), "completion_tokens": len(tokens),
+                         "total_tokens": max(1, prompt_chars // 2) + len(tokens)}
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                model = body.get("model", "mock")
+                if body.get("stream"):
+                    mock._count("streamed")
+                    self._stream(completion_id, model, tokens, usage, body.get("stream_options") or {})
+                    return
+                time.sleep(len(tokens) / mock.tokens_per_second)
+                self._json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens)}}],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id, model, tokens, usage, stream_options):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(payload):
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+
+                def chunk(delta, finish_reason=None, extra=None):
+                    return json.dumps({
+                        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                        **(extra or {}),
+                    }, ensure_ascii=False)
+
+                send(chunk({"role": "assistant", "content": ""}))
+                # 每 8 个 token 发送一个片段，按 tokens_per_second 控制节奏
+                step = 8
+                for i in range(0, len(tokens), step):
+                    time.sleep(step / mock.tokens_per_second)
+                    send(chunk({"content": "".join(tokens[i:i + step])}))
+                send(chunk({}, "stop", {"usage": usage} if stream_options.get("include_usage") else None))
+                send("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务，返回 base_url（port 为 0 时自动选择空闲端口）"""
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="mock-openrouter", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class LangSmithSink:
+    """代替 langsmith.Client 接收追踪事件，只计数"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "updated": 0}
+
+    def _receive(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.stats[name] += 1
+
+    def create_run(self, project_name=None, **payload):
+        self._receive("created")
+
+    def update_run(self, run_id=None, **payload):
+        self._receive("updated")
@@ -0,0 +1,128 @@
+"""图片上传文件的本地 OCR：证书、奖状、海报的照片和截图。
+
+在解析进程中运行（由 ingest 的快速路径调用），不需要网络和 GPU：
+先按 EXIF 方向摆正、转为灰度并把长边缩小到 OCR_MAX_SIDE 以内，再用投影法估计倾斜角度并纠正，
+最后交给离线 OCR 引擎识别。引擎优先使用 RapidOCR（ONNX Runtime，CPU 推理，模型随 pip 包安装，
+中英文均可），没有安装时使用 Tesseract（需要系统安装 tesseract 及 OCR_LANG 中的语言包）。
+引擎模型在每个解析进程中只加载一次。识别结果随解析缓存按图片内容的 SHA-256 缓存。
+
+配置通过环境变量：CVRL_OCR_ENGINE（auto / rapidocr / tesseract）、CVRL_OCR_LANG（Tesseract 语言）、
+CVRL_OCR_MAX_SIDE（预处理后图片长边的最大像素数）。
+"""
+import os
+import threading
+
+OCR_ENGINE = os.environ.get("CVRL_OCR_ENGINE", "auto").lower()
+OCR_LANG = os.environ.get("CVRL_OCR_LANG", "chi_sim+eng")
+OCR_MAX_SIDE = int(os.environ.get("CVRL_OCR_MAX_SIDE", 2000))
+# 估计倾斜角度时使用的缩略图长边、搜索范围（度）和步长
+DESKEW_SIDE = 800
+DESKEW_MAX_ANGLE = 10
+DESKEW_STEP = 1.0
+DESKEW_FINE_STEP = 0.2
+# 小于该角度时不旋转（旋转本身会让文字变模糊）
+DESKEW_MIN_ANGLE = 0.3
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def settings_tag():
+    """OCR 配置的标识，计入解析缓存的转换器版本，配置变化后图片会重新识别"""
+    return f"{OCR_ENGINE}-{OCR_LANG}-{OCR_MAX_SIDE}"
+
+
+def _profile_score(binary, angle):
+    """把二值图旋转 angle 度后各行的平均亮度的方差：文字行与水平方向对齐时行间差异最大"""
+    from PIL import Image
+
+    rotated = binary.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=0)
+    # 缩成一列像素，即每行的平均值
+    rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+    mean = sum(rows) / len(rows)
+    return sum((value - mean) ** 2 for value in rows) / len(rows)
+
+
+def estimate_skew(gray):
+    """估计灰度图中文字行的倾斜角度（度，逆时针为正，即需要旋转该角度才能摆正）"""
+    from PIL import ImageOps
+
+    small = gray.copy()
+    small.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+    # 文字为白、背景为黑，旋转扩出的边缘按背景填充
+    binary = ImageOps.autocontrast(small).point(lambda p: 255 if p < 128 else 0)
+
+    def best(angles):
+        return max(angles, key=lambda angle: _profile_score(binary, angle))
+
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    coarse = best([i * DESKEW_STEP for i in range(-steps, steps + 1)])
+    fine_steps = int(DESKEW_STEP / DESKEW_FINE_STEP)
+    return best([coarse + i * DESKEW_FINE_STEP for i in range(-fine_steps, fine_steps + 1)])
+
+
+def preprocess(file):
+    """读取图片并预处理：按 EXIF 摆正、转灰度、缩小到 OCR_MAX_SIDE 以内、纠正倾斜。返回 PIL 灰度图"""
+    from PIL import Image, ImageOps
+
+    image = Image.open(file)
+    # JPEG 解码时直接按比例缩小，几千万像素的照片不必完整解码
+    image.draft("L", (OCR_MAX_SIDE, OCR_MAX_SIDE))
+    image = ImageOps.exif_transpose(image).convert("L")
+    if max(image.size) > OCR_MAX_SIDE:
+        image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    angle = estimate_skew(image)
+    if abs(angle) >= DESKEW_MIN_ANGLE:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return image
+
+
+def _reading_order(items):
+    """把 (文字框, 文字) 按阅读顺序排列：纵向中心相近的框归为一行，行内从左到右"""
+    boxes = []
+    for box, text in items:
+        ys = [point[1] for point in box]
+        xs = [point[0] for point in box]
+        boxes.append((min(ys), max(ys), min(xs), text))
+    boxes.sort()
+    lines = []
+    for top, bottom, left, text in boxes:
+        center = (top + bottom) / 2
+        if lines and center <= lines[-1][0]:
+            lines[-1][1].append((left, text))
+        else:
+            lines.append([bottom, [(left, text)]])
+    return "\n".join(" ".join(text for _, text in sorted(line)) for _, line in lines)
+
+
+def _rapidocr(image):
+    import numpy
+    from rapidocr_onnxruntime import RapidOCR
+
+    with _engines_lock:
+        engine = _engines.get("rapidocr")
+        if engine is None:
+            engine = _engines["rapidocr"] = RapidOCR()
+    result, _ = engine(numpy.asarray(image.convert("RGB")))
+    return _reading_order((box, text) for box, text, _ in result or [])
+
+
+def _tesseract(image):
+    import pytesseract
+
+    return pytesseract.image_to_string(image, lang=OCR_LANG)
+
+
+ENGINES = {"rapidocr": _rapidocr, "tesseract": _tesseract}
+
+
+def ocr_image(file):
+    """识别图片中的文字，返回文本。file 为路径或文件对象；没有可用的引擎时抛出 ImportError"""
+    image = preprocess(file)
+    if OCR_ENGINE in ENGINES:
+        return ENGINES[OCR_ENGINE](image).strip()
+    try:
+        return _rapidocr(image).strip()
+    except ImportError:
+        # pytesseract 未安装时抛出 ImportError；找不到 tesseract 程序时抛出 TesseractNotFoundError
+        return _tesseract(image).strip()
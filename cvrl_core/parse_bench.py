@@ -0,0 +1,162 @@
+"""文档解析基准：比较各解析路径（PyMuPDF、python-docx、本地 OCR、MarkItDown）每秒处理的页数。
+
+用法：
+    python -m cvrl_core.parse_bench
+    python -m cvrl_core.parse_bench --pages 10 100 --repeat 5
+    python -m cvrl_core.parse_bench 作品集.pdf 素材表.docx --history bench/parse.jsonl
+
+不指定文件时生成合成的文本层 PDF（--pages 指定的各页数）和 DOCX。每个文件依次用适用的快速路径、
+MarkItDown 和 convert_file（解析进程中实际执行的函数：按类型分派、失败时退回 MarkItDown、逐节写出文档文件，
+再由主进程建立 Document）在当前进程中转换 repeat 次，取中位数。不含进程池调度和解析缓存，
+两者计入 pipeline_bench 的 ingest 阶段。
+DOCX 没有固定页数，按每页 DOCX_PAGE_CHARS 个字符估算。缺少依赖的路径显示为未安装。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from .documents import SECTION_JOIN, Document, new_document_path
+from .ingest import FAST_CONVERTERS, NoTextLayer, convert_file, detect_type, iter_pdf_pages, markitdown_sections
+from .pipeline_bench import write_docx, write_pdf
+
+DOCX_PAGE_CHARS = 1800
+PATH_NAMES = {"pdf": "pymupdf", "docx": "python-docx", "image": "ocr"}
+
+
+def count_pages(path, kind, text=None):
+    """PDF 返回实际页数，图片为一页；DOCX 按提取出的字符数估算"""
+    if kind == "image":
+        return 1
+    if kind == "pdf":
+        try:
+            return sum(1 for _ in iter_pdf_pages(path))
+        except ImportError:
+            pass
+    if text:
+        return max(1, round(len(text) / DOCX_PAGE_CHARS))
+    return None
+
+
+def convert_file_text(path):
+    """与应用相同地转换 path：convert_file 写出文档文件后建立 Document，返回全文；解析失败时抛出 ValueError"""
+    output = new_document_path()
+    error = convert_file(path, output)
+    if error:
+        os.remove(output)
+        raise ValueError(error)
+    document = Document(output)
+    try:
+        return document.text()
+    finally:
+        document.close()
+
+
+def time_converter(converter, path, repeat):
+    """返回 (中位用时秒, 输出文本)；converter 返回逐节产出的迭代器时读完全部节。缺少依赖时抛出 ImportError"""
+    samples = []
+    text = None
+    # 先不计时地转换一次，排除首次导入解析库的用时
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        text = converter(path)
+        if not isinstance(text, str):
+            text = SECTION_JOIN.join(text)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples[1:]), text
+
+
+def bench_file(name, path, repeat):
+    kind = detect_type(path)
+    paths = []
+    if kind in FAST_CONVERTERS:
+        paths.append((PATH_NAMES[kind], FAST_CONVERTERS[kind]))
+    paths += [("markitdown", markitdown_sections), ("convert_file", convert_file_text)]
+    results = {}
+    pages = None
+    for route, converter in paths:
+        try:
+            seconds, text = time_converter(converter, path, repeat)
+        except ImportError as e:
+            results[route] = {"error": f"未安装 {e.name or e}"}
+            continue
+        except NoTextLayer:
+            results[route] = {"error": "未通过快速路径（判断为扫描件）"}
+            continue
+        except Exception as e:
+            results[route] = {"error": str(e)}
+            continue
+        if pages is None and text:
+            pages = count_pages(path, kind, text)
+        results[route] = {"seconds": round(seconds, 4), "chars": len(text or "")}
+    for result in results.values():
+        if "seconds" in result and pages:
+            result["pages_per_second"] = round(pages / result["seconds"], 1) if result["seconds"] else None
+    return {"file": name, "type": kind, "pages": pages, "bytes": os.path.getsize(path), "paths": results}
+
+
+def synthetic_files(root, page_counts):
+    files = []
+    for pages in page_counts:
+        path = os.path.join(root, f"synthetic-{pages}p.pdf")
+        write_pdf(path, pages, tag=f"bench{pages}")
+        files.append(path)
+        path = os.path.join(root, f"synthetic-{pages}p.docx")
+        write_docx(path, [f"第{i + 1}段：在项目中负责需求分析、实现与交付，带领小组完成阶段目标并撰写总结报告。" * 3
+                          for i in range(pages * 10)])
+        files.append(path)
+    return files
+
+
+def format_result(result):
+    pages = f"{result['pages']} 页" if result["pages"] else "页数未知"
+    lines = [f"{result['file']}（{result['type']}，{pages}，{result['bytes'] / 1024:.0f} KB）"]
+    baseline = result["paths"].get("markitdown", {}).get("seconds")
+    for path, timing in result["paths"].items():
+        if "error" in timing:
+            lines.append(f"  {path:<12} {timing['error']}")
+            continue
+        line = f"  {path:<12} {timing['seconds'] * 1000:>9.1f} ms"
+        if timing.get("pages_per_second"):
+            line += f"  {timing['pages_per_second']:>8.1f} 页/秒"
+        if baseline and path != "markitdown" and timing["seconds"]:
+            line += f"  为 MarkItDown 的 {baseline / timing['seconds']:.1f} 倍"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cvrl_core.parse_bench", description="比较各文档解析路径的速度")
+    parser.add_argument("files", nargs="*", help="要测试的文件（默认使用合成的 PDF 和 DOCX）")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50], help="合成文件的页数（默认 10 50）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个路径重复转换的次数（默认 3）")
+    parser.add_argument("--history", help="追加写入结果的 JSONL 文件")
+    args = parser.parse_args(argv)
+
+    paths = args.files or synthetic_files(tempfile.mkdtemp(prefix="cvrl-parse-bench-"), args.pages)
+    results = []
+    for path in paths:
+        result = bench_file(os.path.basename(path), path, max(1, args.repeat))
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    if args.history:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""文档解析结果缓存。
+
+以上传文件字节的 SHA-256 加上转换器版本作为键，缓存文档的解析结果。
+分两级：进程内 LRU（跨会话共享）和磁盘目录（按总大小淘汰最久未使用的条目）。
+内存层保存最近使用的 documents.Document 对象（只含各节偏移等元数据，文本仍在其临时文件中），
+命中时直接共用同一个 Document；磁盘层命中时把条目复制为新的文档文件。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+from .documents import Document, new_document_path
+from .ocr import settings_tag as ocr_settings_tag
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cvrl", "parse")
+# 参与解析的库；快速路径的输出格式变化时递增 EXTRACTOR_REVISION
+CONVERTER_PACKAGES = ("markitdown", "PyMuPDF", "python-docx", "rapidocr_onnxruntime", "pytesseract")
+EXTRACTOR_REVISION = 4
+
+
+def converter_version():
+    """返回各解析库的版本号组合，用于区分不同版本的解析结果"""
+    parts = [f"extract{EXTRACTOR_REVISION}", f"ocr-{ocr_settings_tag()}"]
+    for package in CONVERTER_PACKAGES:
+        try:
+            parts.append(f"{package.lower()}-{metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            parts.append(f"{package.lower()}-none")
+    return "+".join(parts)
+
+
+def digest_key(digest, version=None):
+    """由文件内容的 SHA-256 和转换器版本得到缓存键"""
+    version = version or converter_version()
+    return hashlib.sha256(f"{version}:{digest}".encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=512 * 1024 * 1024,
+                 max_memory_items=128, version=None):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+        self.version = version or converter_version()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.md")
+
+    def get_document(self, digest):
+        """返回 SHA-256 为 digest 的文件的解析结果（Document），未命中时返回 None"""
+        key = digest_key(digest, self.version)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+        document = self._read_disk(key)
+        with self._lock:
+            if document is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, document)
+        return document
+
+    def put_document(self, digest, document):
+        """把 document 存为 SHA-256 为 digest 的文件的解析结果"""
+        key = digest_key(digest, self.version)
+        with self._lock:
+            self._remember(key, document)
+        self._write_disk(key, document.path)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".md"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def disk_usage(self):
+        """返回 (条目数, 总字节数)"""
+        entries = self._disk_entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def _remember(self, key, document):
+        # 调用方需持有 self._lock。被淘汰的 Document 在不再被会话引用后删除其临时文件
+        self._memory[key] = document
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        output = new_document_path()
+        try:
+            shutil.copyfile(path, output)
+        except OSError:
+            try:
+                os.remove(output)
+            except OSError:
+                pass
+            return None
+        # 刷新访问时间，供淘汰时判断最近使用
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return Document(output)
+
+    def _write_disk(self, key, src_path):
+        if not self.cache_dir:
+            return
+        try:
+            # 先写临时文件再原子替换，避免多个进程同时写入时读到半截内容
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+        except OSError:
+            return
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _disk_entries(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".md"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, info.st_size, info.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_disk_bytes:
+            return
+        # 按最近使用时间从旧到新删除，直到总大小回到上限以内
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache():
+    """获取进程级共享的解析缓存（Streamlit 重跑脚本时模块不会重新导入，因此各会话共用同一份）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ParseCache(
+                cache_dir=os.environ.get("CVRL_PARSE_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_disk_bytes=int(os.environ.get("CVRL_PARSE_CACHE_MAX_MB", "512")) * 1024 * 1024,
+                max_memory_items=int(os.environ.get("CVRL_PARSE_CACHE_MEMORY_ITEMS", "128")),
+            )
+        return _cache
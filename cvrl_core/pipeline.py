@@ -0,0 +1,160 @@
+"""基于 LangGraph 的多阶段流水线，每个节点完成后写入检查点。
+
+检查点保存在进程级共享的 MemorySaver 中（跨 Streamlit 重跑和会话保留），
+某个阶段失败后再次运行同一 thread 时会从失败的节点继续，不再重新执行已完成的阶段。
+节点签名为 node(state, config)，本次运行的输入、界面元素和调用模型的函数通过
+config["configurable"]["inputs"] / ["ui"] / ["run_agent"] 传入，不写入检查点。
+界面元素均为可选，无界面（批量处理）时 ui 为空字典。["gather_agents"](calls, on_done)
+并发执行多个互不依赖的模型调用并按顺序返回结果（如分块分析支持文件）。
+
+用 reuse_unchanged() 包装的节点声明自己依赖的输入项和上游状态，依赖完全相同时
+直接复用 StageStore 中上一次的输出，只重新计算输入发生变化的阶段。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            from langgraph.checkpoint.memory import MemorySaver
+
+            _checkpointer = MemorySaver()
+        return _checkpointer
+
+
+def build_pipeline(state_schema, stages, interrupt_before=None):
+    """将 [(节点名, 函数), ...] 按顺序连接成线性图并编译"""
+    from langgraph.graph import END, StateGraph
+
+    graph = StateGraph(state_schema)
+    for name, node in stages:
+        graph.add_node(name, node)
+    graph.set_entry_point(stages[0][0])
+    for (current, _), (following, _) in zip(stages, stages[1:]):
+        graph.add_edge(current, following)
+    graph.add_edge(stages[-1][0], END)
+    return graph.compile(checkpointer=get_checkpointer(), interrupt_before=interrupt_before or [])
+
+
+def input_fingerprint(*parts):
+    """对本次运行的全部输入计算指纹，输入变化时应开启新的 thread"""
+    payload = json.dumps([str(part) for part in parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageStore:
+    """按阶段依赖指纹保存阶段输出，超过 max_entries 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        if key not in self._entries:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return self._entries[key]
+
+    def put(self, key, output):
+        self._entries[key] = output
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def reuse_unchanged(node, stage_name, input_keys=(), state_keys=()):
+    """包装节点：input_keys 对应的输入和 state_keys 对应的上游结果都未变化时复用上一次的输出。
+
+    运行时 config["configurable"]["stage_store"] 为 None 表示本次不复用，强制重新计算。
+    """
+    def wrapped(state, config):
+        configurable = config["configurable"]
+        store = configurable.get("stage_store")
+        if store is None:
+            return node(state, config)
+        inputs = configurable["inputs"]
+        key = input_fingerprint(
+            stage_name,
+            *[inputs.get(name) for name in input_keys],
+            *[state.get(name) for name in state_keys]
+        )
+        output = store.get(key)
+        if output is not None:
+            on_reused = (configurable.get("ui") or {}).get("on_stage_reused")
+            if on_reused:
+                on_reused(stage_name)
+            return output
+        output = node(state, config)
+        store.put(key, output)
+        return output
+
+    return wrapped
+
+
+def show_progress(ui, value=None, text=None):
+    """更新进度条和状态文字；未提供对应界面元素时不做任何操作"""
+    if value is not None and ui.get("progress_bar") is not None:
+        ui["progress_bar"].progress(value)
+    if text is not None and ui.get("status_text") is not None:
+        ui["status_text"].text(text)
+
+
+def discard_thread(thread_id):
+    """删除不再使用的 thread 的检查点，避免进程内存持续增长"""
+    checkpointer = get_checkpointer()
+    delete_thread = getattr(checkpointer, "delete_thread", None)
+    if delete_thread:
+        delete_thread(thread_id)
+    else:
+        getattr(checkpointer, "storage", {}).pop(thread_id, None)
+
+
+def _config(thread_id, inputs, ui, stage_store, run_agent, gather_agents):
+    return {"configurable": {"thread_id": thread_id, "inputs": inputs, "ui": ui or {}, "stage_store": stage_store,
+                             "run_agent": run_agent, "gather_agents": gather_agents}}
+
+
+def run_until(graph, thread_id, initial_state, inputs, ui=None, stop_before=None, stage_store=None, run_agent=None,
+              gather_agents=None):
+    """运行流水线直到结束或在 stop_before 节点前暂停，返回最新的状态值。
+
+    如果该 thread 上一次运行在 stop_before 之前的某个节点失败，则从该节点继续，
+    否则以 initial_state 从第一个节点重新开始。
+    """
+    config = _config(thread_id, inputs, ui, stage_store, run_agent, gather_agents)
+    pending = graph.get_state(config).next
+    if pending and (stop_before is None or stop_before not in pending):
+        graph.invoke(None, config)
+    else:
+        graph.invoke(initial_state, config)
+    return graph.get_state(config).values
+
+
+def continue_from(graph, thread_id, inputs, ui=None, fallback_values=None, as_node=None, stage_store=None,
+                  run_agent=None, gather_agents=None):
+    """从暂停点继续执行剩余节点。
+
+    若该 thread 的检查点已不存在（如进程重启）或已执行完毕，先用 fallback_values
+    以 as_node 的身份写入检查点，再从其后的节点继续。
+    """
+    config = _config(thread_id, inputs, ui, stage_store, run_agent, gather_agents)
+    if not graph.get_state(config).next:
+        graph.update_state(config, fallback_values or {}, as_node=as_node)
+    graph.invoke(None, config)
+    return graph.get_state(config).values
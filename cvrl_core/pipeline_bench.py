@@ -0,0 +1,418 @@
+"""流水线离线基准：不连接 OpenRouter 和 LangSmith，衡量两条流水线在并发会话下的性能。
+
+用法：
+    python -m cvrl_core.pipeline_bench cv --sessions 1 4 16
+    python -m cvrl_core.pipeline_bench rl --sessions 8 --latency 1.5 --tokens-per-second 40 --error-rate 0.05
+    python -m cvrl_core.pipeline_bench cv --sessions 4 16 --history bench/pipeline.jsonl --max-regression 0.2
+
+模型调用发往本机的 mock_openrouter.MockOpenRouter（可配置首 token 延迟、输出速率、流式输出和错误注入），
+追踪事件发往 LangSmithSink。每个会话使用一份合成的素材表（DOCX）和若干支持文件（多页 PDF），
+按应用中的顺序执行：并行解析文件 → 运行到最后一个阶段前暂停 → 继续生成简历/推荐信（流式）。
+每个并发档位的文件内容都不同，不会命中解析缓存（缓存目录为临时目录）；响应缓存关闭。
+
+报告每档的解析用时、各 Agent 的调用用时、会话吞吐量和峰值内存（含解析进程）。
+指定 --history 时结果追加写入 JSONL 并与上一条记录比较；吞吐量下降或会话 p95 用时增加超过
+--max-regression 时退出码为 1。其余配置（并发上限、重试等）与批量处理一样从环境变量读取。
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from .batch import APPS, Student, load_settings
+from .engine import setup_engine
+from .ingest import ingest_files, is_parse_error
+from .metrics import get_metrics
+from .mock_openrouter import LangSmithSink, MockOpenRouter
+from .pipeline import continue_from, discard_thread, run_until
+from .prompt_registry import current_prompts
+from .tracing import BackgroundTracer
+
+DEFAULT_MODEL = "mock/bench-model"
+PDF_LINE = "Led a {n}-person team on project {p}; improved throughput by {k}% and presented results at the review."
+
+
+def write_pdf(path, pages, lines_per_page=40, tag=""):
+    """写入只含文本层的多页 PDF（标准 Helvetica 字体，无需任何依赖）"""
+    objects = [None, None]
+    page_ids = []
+    font_id = 3
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in range(pages):
+        lines = [f"{tag} page {page + 1}"] + [
+            PDF_LINE.format(n=(i % 9) + 2, p=f"{tag}-{page}-{i}", k=(i * 7) % 60 + 5) for i in range(lines_per_page)
+        ]
+        text = "".join(f"({line.replace('(', '').replace(')', '')}) Tj T* " for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        # 对象编号从 1 开始，等于其在列表中的位置加 1
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (font_id, content_id)
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % pid for pid in page_ids), len(page_ids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def write_docx(path, paragraphs):
+    """写入最简的 DOCX（只含正文段落）"""
+    body = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ))
+        z.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/></Relationships>'
+        ))
+        z.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        ))
+
+
+def build_corpus(root, sessions, support_files=3, pages=5, tag=""):
+    """为 sessions 个会话各生成一份素材表和 support_files 个 pages 页的支持文件，返回 Student 列表"""
+    students = []
+    for i in range(sessions):
+        folder = os.path.join(root, f"{tag}-{i:03d}")
+        os.makedirs(folder, exist_ok=True)
+        material = os.path.join(folder, "素材表.docx")
+        write_docx(material, [f"学生编号：{tag}-{i}"] + [
+            f"经历{j + 1}：在第{j + 1}个项目中负责需求分析与实现，带领{j % 5 + 2}人小组完成交付。" for j in range(30)
+        ])
+        support = []
+        for j in range(support_files):
+            path = os.path.join(folder, f"support-{j + 1}.pdf")
+            write_pdf(path, pages, tag=f"{tag}-{i}-{j}")
+            support.append(path)
+        students.append(Student(student_id=f"{tag}-{i:03d}", material=material, support=support,
+                                writing_requirements="突出研究能力和团队合作，字数 800 字左右。"))
+    return students
+
+
+def _process_tree_rss():
+    """当前进程及其全部子孙进程（含解析进程池）的常驻内存总和（字节）；非 Linux 时返回 None"""
+    if not os.path.isdir("/proc/self"):
+        return None
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                # comm 字段可能含空格，从最后一个 ")" 之后解析
+                fields = f.read().rsplit(b")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree = {os.getpid()}
+    changed = True
+    while changed:
+        children = {pid for pid, ppid in parents.items() if ppid in tree and pid not in tree}
+        tree |= children
+        changed = bool(children)
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in tree:
+        try:
+            with open(f"/proc/{pid}/statm", "rb") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class MemorySampler:
+    """在后台线程中定期采样进程树的常驻内存，记录峰值"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="bench-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _process_tree_rss()
+            if rss is None:
+                return
+            self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+
+def _main_peak_rss():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _NullArea:
+    """代替 Streamlit 元素，使流水线按应用中的方式流式输出"""
+
+    def markdown(self, *args, **kwargs):
+        pass
+
+    def text(self, *args, **kwargs):
+        pass
+
+    def progress(self, *args, **kwargs):
+        pass
+
+
+def run_session(app_name, student, runner, prompts, models, settings, stream=True):
+    """按应用中的流程处理一个会话，返回 {"seconds", "parse_seconds", "error"}"""
+    app = APPS[app_name]
+    area = _NullArea()
+    start = time.perf_counter()
+    run_id = str(uuid.uuid4())
+    thread_id = str(uuid.uuid4())
+    parse_seconds = 0.0
+    try:
+        # 与应用一样以上传文件对象提交，经过写入临时文件的一步
+        files = []
+        for path in [student.material] + student.support:
+            with open(path, "rb") as f:
+                file = io.BytesIO(f.read())
+            file.name = os.path.basename(path)
+            files.append(file)
+        contents = ingest_files(
+            files,
+            max_workers=int(settings.get("INGEST_MAX_WORKERS", 4)),
+            timeout=float(settings.get("INGEST_TIMEOUT", 120))
+        )
+        parse_seconds = time.perf_counter() - start
+        if is_parse_error(contents[0]):
+            raise ValueError(f"素材表解析失败: {contents[0]}")
+        inputs = {
+            app["material_key"]: str(contents[0]),
+            "support_files_content": contents[1:],
+            "writing_requirements": student.writing_requirements,
+            "support_map_reduce": False,
+            "support_chunk_chars": int(settings.get("SUPPORT_CHUNK_CHARS", 12000)),
+            "support_map_workers": int(settings.get("SUPPORT_MAP_WORKERS", 4)),
+            "master_run_id": run_id,
+            **{key: prompts[key] for key in app["prompt_keys"]},
+            **models
+        }
+        ui = {"progress_bar": area, "status_text": area}
+        if stream:
+            ui.update({"result_area": area, "resume_area": area, "letter_area": area})
+        graph = app["build_graph"]()
+        run_until(graph, thread_id, {"run_id": run_id}, inputs, ui=ui, stop_before=app["final_stage"],
+                  run_agent=runner, gather_agents=runner.gather)
+        continue_from(graph, thread_id, inputs, ui=ui, run_agent=runner, gather_agents=runner.gather)
+        error = ""
+    except Exception as e:
+        error = str(e)
+    finally:
+        discard_thread(thread_id)
+    return {"seconds": time.perf_counter() - start, "parse_seconds": parse_seconds, "error": error}
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] if ordered else None
+
+
+def run_level(app_name, sessions, runner, prompts, models, settings, corpus_root, args):
+    """以 sessions 个并发会话运行一档，返回该档的结果"""
+    students = build_corpus(corpus_root, sessions, args.support_files, args.pages, tag=f"{app_name}{sessions}")
+    metrics = get_metrics()
+    metrics.reset()
+    wall_start = time.perf_counter()
+    with MemorySampler() as memory, ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(
+            lambda student: run_session(app_name, student, runner, prompts, models, settings, not args.no_stream),
+            students
+        ))
+    wall = time.perf_counter() - wall_start
+    ok = [r for r in results if not r["error"]]
+    return {
+        "sessions": sessions,
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({r["error"] for r in results if r["error"]})[:3],
+        "wall_seconds": round(wall, 2),
+        "sessions_per_minute": round(len(ok) / wall * 60, 2) if wall else 0.0,
+        "session_p50": round(statistics.median([r["seconds"] for r in ok]), 2) if ok else None,
+        "session_p95": round(_p95([r["seconds"] for r in ok]), 2) if ok else None,
+        "parse_p50": round(statistics.median([r["parse_seconds"] for r in results]), 2),
+        "parse": metrics.parse_summary(),
+        "agents": metrics.agent_summary(),
+        "peak_rss_mb": round(memory.peak / 1024 / 1024, 1) if memory.peak else None,
+    }
+
+
+def format_level(result, previous=None):
+    lines = [
+        f"并发 {result['sessions']:>3} 个会话：成功 {result['ok']}，失败 {result['failed']}，"
+        f"总用时 {result['wall_seconds']:.1f} 秒，吞吐 {result['sessions_per_minute']:.2f} 会话/分钟"
+    ]
+    if result["session_p50"] is not None:
+        lines.append(f"  会话用时 p50 {result['session_p50']:.1f} 秒，p95 {result['session_p95']:.1f} 秒；"
+                     f"解析 p50 {result['parse_p50']:.2f} 秒")
+    if result["peak_rss_mb"] is not None:
+        lines.append(f"  峰值内存（含解析进程）{result['peak_rss_mb']:.1f} MB")
+    for status, parsed in result["parse"].items():
+        lines.append(f"  文件解析（{status}）: {parsed['files']} 个，共 {parsed['seconds']:.1f} 秒")
+    for row in result["agents"]:
+        lines.append(f"  {row['Agent']:<24} 调用 {row['调用']:>3}（失败 {row['失败']}），平均 {row['平均用时(秒)'] or 0:.2f} 秒，"
+                     f"p95 ≤ {row['p95用时(秒)']} 秒，输出 {row['输出tokens']} tokens")
+    for error in result["errors"]:
+        lines.append(f"  错误: {error}")
+    if previous:
+        lines.append(f"  较上次：吞吐 {result['sessions_per_minute'] - previous['sessions_per_minute']:+.2f} 会话/分钟"
+                     + (f"，p95 {result['session_p95'] - previous['session_p95']:+.1f} 秒"
+                        if result["session_p95"] is not None and previous.get("session_p95") is not None else ""))
+    return "\n".join(lines)
+
+
+def regressions(results, previous, max_regression):
+    """与上一条记录相比吞吐量下降或会话 p95 增加超过 max_regression 的档位"""
+    before = {level["sessions"]: level for level in (previous or {}).get("levels", [])}
+    found = []
+    for result in results:
+        old = before.get(result["sessions"])
+        if not old:
+            continue
+        if old["sessions_per_minute"] and result["sessions_per_minute"] < old["sessions_per_minute"] * (1 - max_regression):
+            found.append(f"并发 {result['sessions']}：吞吐 {old['sessions_per_minute']} → {result['sessions_per_minute']}")
+        if old.get("session_p95") and result["session_p95"] and result["session_p95"] > old["session_p95"] * (1 + max_regression):
+            found.append(f"并发 {result['sessions']}：p95 {old['session_p95']} → {result['session_p95']} 秒")
+    return found
+
+
+def _last_record(history_path, app_name):
+    if not history_path or not os.path.exists(history_path):
+        return None
+    last = None
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("app") == app_name:
+                    last = record
+    return last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cvrl_core.pipeline_bench", description="离线衡量流水线的性能")
+    parser.add_argument("app", choices=sorted(APPS), help="cv：简历助手流水线；rl：推荐信助手流水线")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4], help="依次测试的并发会话数（默认 1 4）")
+    parser.add_argument("--support-files", type=int, default=3, help="每个会话的支持文件数（默认 3）")
+    parser.add_argument("--pages", type=int, default=5, help="每个支持文件的页数（默认 5）")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟的首 token 延迟（秒，默认 0.5）")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="模拟的输出速率（默认 80）")
+    parser.add_argument("--output-tokens", type=int, default=400, help="每次调用输出的 tokens（默认 400）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例（默认 0）")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误的 HTTP 状态码（默认 503）")
+    parser.add_argument("--langsmith-latency", type=float, default=0.0, help="模拟的 LangSmith 每次上报延迟（秒）")
+    parser.add_argument("--no-stream", action="store_true", help="最后阶段也不使用流式输出")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"请求中使用的模型名（默认 {DEFAULT_MODEL}）")
+    parser.add_argument("--history", help="追加写入结果的 JSONL 文件，并与其中同一应用的最后一条记录比较")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="与上次相比允许的最大退化比例（如 0.2），超出时退出码为 1")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="cvrl-bench-")
+    # 解析缓存使用临时目录，不读写用户的缓存
+    os.environ["CVRL_PARSE_CACHE_DIR"] = os.path.join(work_dir, "parse-cache")
+    mock = MockOpenRouter(args.latency, args.tokens_per_second, args.output_tokens, args.error_rate, args.error_status)
+    base_url = mock.start()
+    sink = LangSmithSink(args.langsmith_latency)
+
+    settings = load_settings(None)
+    settings.update({"OPENROUTER_API_KEY": "bench", "LANGSMITH_API_KEY": "", "LLM_RESPONSE_CACHE": "false"})
+    engine = setup_engine(settings)
+    engine.tracer = BackgroundTracer(sink, "pipeline-bench")
+    runner = engine.agent_runner(base_url=base_url)
+    app = APPS[args.app]
+    prompts = dict(current_prompts(args.app).prompts)
+    models = {key: args.model for key in app["model_keys"]}
+
+    previous = _last_record(args.history, args.app)
+    previous_levels = {level["sessions"]: level for level in (previous or {}).get("levels", [])}
+    results = []
+    try:
+        for sessions in args.sessions:
+            result = run_level(args.app, max(1, sessions), runner, prompts, models, settings, work_dir, args)
+            results.append(result)
+            print(format_level(result, previous_levels.get(result["sessions"])), flush=True)
+    finally:
+        engine.tracer.flush()
+        mock.stop()
+    print(f"模拟服务：请求 {mock.stats['requests']} 次（流式 {mock.stats['streamed']}，注入错误 {mock.stats['errors']}）；"
+          f"LangSmith 接收 {sink.stats['created']} 个运行；主进程峰值内存 {_main_peak_rss() / 1024 / 1024:.1f} MB")
+
+    if args.history:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "app": args.app,
+            "python": platform.python_version(),
+            "options": {key: value for key, value in vars(args).items() if key not in ("history", "app")},
+            "levels": [{key: value for key, value in result.items() if key not in ("agents", "parse")}
+                       for result in results],
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    if args.max_regression is not None:
+        found = regressions(results, previous, args.max_regression)
+        if found:
+            print("性能退化：\n" + "\n".join(found), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""按模型上下文窗口组装提示词。
+
+发送前在本地估算提示词的 token 数，与模型的上下文窗口（本地表，可在配置中覆盖）比较：
+超出时按优先级从低到高截断可截断的部分（原始支持文件 < 分析结果 < 素材表），
+必需部分仍放不下时直接抛出 PromptTooLong，不再等待一次注定失败的网络请求。
+"""
+import math
+import re
+import threading
+from dataclasses import dataclass
+
+# 模型名前缀 → 上下文窗口（tokens），按最长前缀匹配
+CONTEXT_WINDOWS = {
+    "google/gemini": 1048576,
+    "anthropic/claude": 200000,
+    "openai/gpt-4.1": 1047576,
+    "openai/gpt-4o": 128000,
+    "openai/": 128000,
+    "deepseek/deepseek-chat-v3": 163840,
+    "deepseek/": 64000,
+    "qwen/qwen-max": 32768,
+    "qwen/qwen-plus": 131072,
+    "qwen/qwen-turbo": 1000000,
+    "qwen-turbo": 1000000,
+    "qwen/": 32768,
+    "meta-llama/": 128000,
+    "mistralai/": 32000,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+DEFAULT_RESERVE_OUTPUT_TOKENS = 8192
+# 自动分块时每块至少保留的内容 tokens，低于该值说明固定部分已占满上下文
+MIN_CHUNK_TOKENS = 1000
+
+PRIORITY_SUPPORT = 1
+PRIORITY_ANALYSIS = 2
+PRIORITY_MATERIAL = 3
+
+TRUNCATION_NOTE = "\n[……内容过长，已截断]"
+
+_settings = {"reserve_output_tokens": DEFAULT_RESERVE_OUTPUT_TOKENS}
+_windows = dict(CONTEXT_WINDOWS)
+_lock = threading.Lock()
+
+_CJK = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+class PromptTooLong(ValueError):
+    pass
+
+
+@dataclass
+class Section:
+    """提示词中的一段内容，渲染为 prefix + text + suffix"""
+    name: str
+    text: str
+    prefix: str = ""
+    suffix: str = ""
+    priority: int = PRIORITY_MATERIAL
+    required: bool = False
+
+
+def configure_budget(context_windows=None, reserve_output_tokens=None):
+    """覆盖或补充上下文窗口表，设置为模型输出预留的 tokens"""
+    with _lock:
+        if context_windows:
+            _windows.update({str(prefix): int(tokens) for prefix, tokens in dict(context_windows).items()})
+        if reserve_output_tokens is not None:
+            _settings["reserve_output_tokens"] = int(reserve_output_tokens)
+
+
+def context_window(model):
+    name = model.split(":", 1)[0]
+    with _lock:
+        matches = [prefix for prefix in _windows if name.startswith(prefix)]
+        return _windows[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+def prompt_budget(model):
+    """可用于提示词的 tokens：上下文窗口减去为输出预留的部分"""
+    return context_window(model) - _settings["reserve_output_tokens"]
+
+
+def count_tokens(text):
+    """保守估算：中日韩字符和全角符号各按 1 个 token，其余字符按每 3 个 1 个 token。
+
+    该估算不小于常见分词器的实际结果，因此按字符数切分时 1 个字符最多对应 1 个 token。
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3)
+
+
+def fits(model, prompt, extra_tokens=0):
+    """prompt 加上另外估算的 extra_tokens（如尚未读入的文档内容）是否在模型的上下文预算内"""
+    return count_tokens(prompt) + extra_tokens <= prompt_budget(model)
+
+
+def chunk_chars_for(model, overhead, max_chars=None):
+    """在 overhead（每块都要带上的固定提示词）之外，单块内容最多可用的字符数，不超过 max_chars"""
+    available = prompt_budget(model) - count_tokens(overhead)
+    if available < MIN_CHUNK_TOKENS:
+        raise PromptTooLong(
+            f"固定提示词约 {count_tokens(overhead)} tokens，已接近模型 {model} 的上下文预算 {prompt_budget(model)} tokens，无法分块处理"
+        )
+    return min(max_chars, available) if max_chars else available
+
+
+def assemble_prompt(model, header, sections, footer=""):
+    """返回 (提示词, 被截断的部分名称列表)。
+
+    总长度在预算内时结果与直接拼接完全相同；超出时先截断优先级最低的部分，
+    同优先级时先截断靠后的部分。
+    """
+    budget = prompt_budget(model)
+    texts = [section.text for section in sections]
+
+    def render():
+        body = "".join(s.prefix + text + s.suffix for s, text in zip(sections, texts))
+        return header + body + footer
+
+    prompt = render()
+    total = count_tokens(prompt)
+    truncated = []
+    order = sorted(
+        (i for i, section in enumerate(sections) if not section.required and section.text),
+        key=lambda i: (sections[i].priority, -i)
+    )
+    for i in order:
+        if total <= budget:
+            break
+        excess = total - budget + count_tokens(TRUNCATION_NOTE)
+        texts[i] = _truncate(texts[i], count_tokens(texts[i]) - excess)
+        truncated.append(sections[i].name)
+        prompt = render()
+        total = count_tokens(prompt)
+
+    if total > budget:
+        raise PromptTooLong(
+            f"提示词约 {total} tokens，超过模型 {model} 的上下文预算 {budget} tokens，且必需内容无法截断"
+        )
+    return prompt, truncated
+
+
+def _truncate(text, max_tokens):
+    if max_tokens <= 0:
+        return TRUNCATION_NOTE.strip()
+    # 二分查找能放入 max_tokens 的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + TRUNCATION_NOTE
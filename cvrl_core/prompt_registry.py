@@ -0,0 +1,98 @@
+"""默认提示词注册表。
+
+每个应用的默认提示词在进程内只加载一次，保存为不可变的 PromptSet，版本号取内容的哈希。
+会话中的 SessionPrompts 只持有 PromptSet 的引用，顾问修改某条提示词时才为该条保存一份副本，
+因此大量空闲会话不会各自复制一遍全部提示词。
+"""
+import hashlib
+import importlib
+import json
+import threading
+from types import MappingProxyType
+
+# 应用名 -> 默认提示词所在模块
+PROMPT_MODULES = {
+    "cv": "cvrl_core.cv_prompts",
+    "rl": "cvrl_core.rl_prompts",
+}
+
+_current = {}
+_lock = threading.Lock()
+
+
+def prompts_version(prompts):
+    """按提示词内容计算版本号，内容不变则版本号不变"""
+    data = json.dumps(prompts, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class PromptSet:
+    """某个应用某一版本的默认提示词（只读）"""
+
+    def __init__(self, app, prompts):
+        self.app = app
+        self.prompts = MappingProxyType(dict(prompts))
+        self.version = prompts_version(dict(prompts))
+
+    def __getitem__(self, key):
+        return self.prompts[key]
+
+    def keys(self):
+        return self.prompts.keys()
+
+
+def register_prompts(app, prompts):
+    """把 prompts 登记为应用的当前默认提示词；内容与当前版本相同时返回已有的 PromptSet"""
+    prompt_set = PromptSet(app, prompts)
+    with _lock:
+        current = _current.get(app)
+        if current is not None and current.version == prompt_set.version:
+            return current
+        _current[app] = prompt_set
+        return prompt_set
+
+
+def current_prompts(app):
+    """返回应用当前的默认提示词，首次调用时从 PROMPT_MODULES 加载"""
+    prompt_set = _current.get(app)
+    if prompt_set is None:
+        module = importlib.import_module(PROMPT_MODULES[app])
+        prompt_set = register_prompts(app, module.DEFAULT_PROMPTS)
+    return prompt_set
+
+
+class SessionPrompts:
+    """一个会话使用的提示词：引用共享的默认版本，只保存被修改过的条目"""
+
+    def __init__(self, app):
+        self.app = app
+        self.base = current_prompts(app)
+        self.overrides = {}
+
+    @property
+    def version(self):
+        return self.base.version
+
+    @property
+    def edited(self):
+        return sorted(self.overrides)
+
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.base[key]
+
+    def __setitem__(self, key, text):
+        # 改回默认内容时丢弃副本，重新引用共享版本
+        if text == self.base[key]:
+            self.overrides.pop(key, None)
+        else:
+            self.overrides[key] = text
+
+    def reset(self):
+        """丢弃所有修改，并切换到当前最新的默认版本"""
+        self.base = current_prompts(self.app)
+        self.overrides = {}
+
+    def as_dict(self):
+        return {key: self[key] for key in self.base.keys()}
@@ -0,0 +1,138 @@
+"""LLM 响应缓存（可选启用）。
+
+以 (模型, temperature, 规范化后的提示词哈希) 为键，把完整响应保存在 SQLite 中，
+按 TTL 过期、按总大小淘汰最久未使用的条目。多个进程可以共用同一个数据库文件。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cvrl", "responses.sqlite3")
+
+
+def normalize_prompt(prompt):
+    """统一换行符和 Unicode 形式，去掉每行行尾空白，避免无意义的差异导致缓存未命中"""
+    prompt = unicodedata.normalize("NFC", prompt).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in prompt.split("\n")).strip()
+
+
+def response_key(model, temperature, prompt):
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+    return hashlib.sha256(json.dumps([model, temperature, prompt_hash]).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    temperature REAL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+
+    def get(self, model, temperature, prompt):
+        key = response_key(model, temperature, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, model, temperature, prompt, response):
+        key = response_key(model, temperature, prompt)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, temperature, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, temperature, response, size, now, now),
+            )
+            self.stats["writes"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def set_limits(self, ttl_seconds, max_bytes):
+        """更新 TTL 和大小上限，并立即按新的上限淘汰"""
+        with self._lock:
+            self.ttl_seconds = ttl_seconds
+            self.max_bytes = max_bytes
+            self._evict(time.time())
+            self._conn.commit()
+
+    def usage(self):
+        """返回 (条目数, 总字节数)"""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return count, total
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _evict(self, now):
+        # 调用方需持有 self._lock
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到总大小回到上限以内
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(enabled, ttl_seconds=7 * 24 * 3600, max_mb=256):
+    """获取进程级共享的响应缓存；未启用时返回 None。
+
+    TTL 和大小上限变化时更新已有实例（保留连接和命中统计），数据库路径变化时换用新的实例。
+    """
+    global _cache
+    if not enabled:
+        return None
+    path = os.environ.get("CVRL_RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH)
+    max_bytes = int(max_mb) * 1024 * 1024
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = ResponseCache(path=path, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        elif (_cache.ttl_seconds, _cache.max_bytes) != (ttl_seconds, max_bytes):
+            _cache.set_limits(ttl_seconds, max_bytes)
+        return _cache
@@ -0,0 +1,177 @@
+"""模型调用失败后的重试：区分可重试与不可重试的错误，按指数退避加随机抖动等待。
+
+可重试：429 限流、408/409/425、5xx、超时和连接错误；其余错误（如 400 参数错误、401/403 鉴权失败）
+直接抛出。服务端返回 Retry-After 时按其等待，但超过 max_delay 时不再重试。
+每个阶段（同一次运行中同名 Agent 的所有调用，分块分析的 map 调用计入其所属阶段）共享一份
+重试额度，避免服务持续故障时长时间反复重试。
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_STAGE_BUDGET = 6
+RETRYABLE_STATUS = {408, 409, 425, 429}
+# openai / httpx 中表示超时或连接中断的异常类名（按类名判断，不必导入这些库）
+RETRYABLE_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "TimeoutException", "ConnectError", "ConnectTimeout", "ReadError", "ReadTimeout",
+    "WriteError", "WriteTimeout", "PoolTimeout", "RemoteProtocolError",
+}
+_MAX_TRACKED_STAGES = 512
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def status_code(error):
+    """返回错误对应的 HTTP 状态码，没有时返回 None"""
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error):
+    """判断错误是否为暂时性的（限流、服务端错误、超时、连接中断），包括被包装过的错误"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        code = status_code(error)
+        if code is not None:
+            return code in RETRYABLE_STATUS or code >= 500
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def retry_after(error):
+    """从响应头 Retry-After（秒数或 HTTP 日期）或 retry-after-ms 中读取建议的等待秒数"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def stage_of(agent_name):
+    """分块分析的 map 调用（f"{agent_name}_map"）计入所属阶段的重试额度"""
+    return agent_name[:-len("_map")] if agent_name.endswith("_map") else agent_name
+
+
+def retry_details(timing):
+    """供追踪上报的重试信息，没有重试时返回 None"""
+    return {"retries": timing["retries"]} if timing.get("retries") else None
+
+
+class RetryPolicy:
+    """单次调用最多尝试 max_attempts 次；同一阶段的所有调用合计最多重试 stage_budget 次"""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, stage_budget=DEFAULT_STAGE_BUDGET):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.stage_budget = int(stage_budget)
+        self._spent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def options(self):
+        return (self.max_attempts, self.base_delay, self.max_delay, self.stage_budget)
+
+    def delay(self, attempt, error):
+        """第 attempt 次（从 1 开始）尝试失败后应等待的秒数；不应重试时返回 None"""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        suggested = retry_after(error)
+        if suggested is not None:
+            return suggested if suggested <= self.max_delay else None
+        # 完全抖动：在 [0, min(max_delay, base_delay * 2^(attempt-1))] 内随机等待，避免并发调用同时重试
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def take(self, stage_key):
+        """占用阶段的一次重试额度，额度用完时返回 False"""
+        with self._lock:
+            spent = self._spent.get(stage_key, 0)
+            if spent >= self.stage_budget:
+                return False
+            self._spent[stage_key] = spent + 1
+            self._spent.move_to_end(stage_key)
+            while len(self._spent) > _MAX_TRACKED_STAGES:
+                self._spent.popitem(last=False)
+            return True
+
+    def reset(self, stage_key):
+        """阶段失败后清除其已用额度，用户重新运行时从完整额度开始"""
+        with self._lock:
+            self._spent.pop(stage_key, None)
+
+    def _next_delay(self, attempt, error, stage_key):
+        wait = self.delay(attempt, error)
+        if wait is None or not self.take(stage_key):
+            return None
+        return wait
+
+    def call(self, fn, stage_key, timing):
+        """同步执行 fn()，失败时按策略重试；重试次数记入 timing["retries"]"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn()
+            except Exception as e:
+                wait = self._next_delay(attempt, e, stage_key)
+                if wait is None:
+                    raise
+            timing["retries"] = timing.get("retries", 0) + 1
+            time.sleep(wait)
+
+    async def acall(self, fn, stage_key, timing):
+        """call() 的异步版本，fn() 返回协程"""
+        import asyncio
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn()
+            except Exception as e:
+                wait = self._next_delay(attempt, e, stage_key)
+                if wait is None:
+                    raise
+            timing["retries"] = timing.get("retries", 0) + 1
+            await asyncio.sleep(wait)
+
+
+def get_retry_policy(max_attempts=None, base_delay=None, max_delay=None, stage_budget=None):
+    """返回进程内共享的 RetryPolicy（阶段额度需跨脚本重跑保留）；参数变化时换用新参数，保留已用额度"""
+    global _policy
+    policy = RetryPolicy(
+        DEFAULT_MAX_ATTEMPTS if max_attempts is None else max_attempts,
+        DEFAULT_BASE_DELAY if base_delay is None else base_delay,
+        DEFAULT_MAX_DELAY if max_delay is None else max_delay,
+        DEFAULT_STAGE_BUDGET if stage_budget is None else stage_budget,
+    )
+    with _policy_lock:
+        if _policy is None or _policy.options() != policy.options():
+            if _policy is not None:
+                policy._spent, policy._lock = _policy._spent, _policy._lock
+            _policy = policy
+        return _policy
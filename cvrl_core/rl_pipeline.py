@@ -0,0 +1,172 @@
+"""推荐信助手流水线：support_analyst → rl_assistant → letter_generator。
+
+节点不依赖 Streamlit：模型通过 config["configurable"]["run_agent"] 调用，
+进度条、流式输出区域等界面元素都从 ui 中按需读取，未提供时跳过。
+"""
+from typing import Any, List, TypedDict
+
+from .documents import files_tokens, join_files
+from .map_reduce import analyze_support_chunks, build_map_prompt, count_chunks, iter_chunks
+from .pipeline import build_pipeline, reuse_unchanged, show_progress
+from .prompt_budget import PRIORITY_ANALYSIS, PRIORITY_MATERIAL, Section, assemble_prompt, chunk_chars_for, fits
+
+PROMPT_KEYS = [
+    "persona", "task", "output_format",
+    "support_analyst_persona", "support_analyst_task", "support_analyst_output_format",
+    "letter_generator_persona", "letter_generator_task", "letter_generator_output_format",
+]
+
+STAGE_LABELS = {
+    "support_analyst": "支持文件分析",
+    "rl_assistant": "推荐信报告",
+    "letter_generator": "推荐信生成"
+}
+
+
+FILE_PREFIX = "\n\n支持文件{index}:\n"
+
+
+class ChatState(TypedDict, total=False):
+    messages: List[Any]
+    run_id: str
+    support_analysis: str
+    report: str
+    letter: str
+
+
+# 步骤1: 处理支持文件
+def support_analyst_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+    show_progress(ui, 10, "第一步：分析支持文件...")
+
+    # 支持文件分析提示词的固定部分，支持文件内容确定不分块后才读入
+    support_files_content = inputs["support_files_content"]
+    support_prompt_header = f"""人物设定：{inputs["support_analyst_persona"]}
+\n任务描述：{inputs["support_analyst_task"]}
+\n输出格式：{inputs["support_analyst_output_format"]}
+\n推荐信素材表内容：
+{inputs["rl_content"]}
+\n支持文件内容：
+"""
+
+    # 开启了分块分析，或整份提示词超出模型的上下文预算时，改为逐块分析后合并
+    if inputs["support_map_reduce"] or not fits(
+        inputs["support_analyst_model"], support_prompt_header + "\n", files_tokens(support_files_content, FILE_PREFIX)
+    ):
+        context = f"推荐信素材表内容：\n{inputs['rl_content']}"
+        chunk_chars = chunk_chars_for(
+            inputs["support_analyst_model"],
+            build_map_prompt(
+                inputs["support_analyst_persona"],
+                inputs["support_analyst_task"],
+                inputs["support_analyst_output_format"],
+                "文件 99 第 99/99 部分",
+                "",
+                context=context
+            ),
+            inputs["support_chunk_chars"] if inputs["support_map_reduce"] else None
+        )
+        chunk_count = count_chunks(support_files_content, chunk_chars)
+        if chunk_count > 1:
+            return {"support_analysis": analyze_support_chunks(
+                iter_chunks(support_files_content, chunk_chars), config, state["run_id"], chunk_chars,
+                "support_analyst", context=context, progress=(10, 35), step="第一步", total=chunk_count
+            )}
+
+    support_prompt = f"{support_prompt_header}{join_files(support_files_content, FILE_PREFIX)}\n"
+
+    # 调用支持文件分析agent
+    support_analysis = run_agent(
+        "support_analyst",
+        inputs["support_analyst_model"],
+        support_prompt,
+        state["run_id"]
+    )
+    return {"support_analysis": support_analysis}
+
+
+# 步骤2: 生成推荐信报告
+def rl_assistant_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+    show_progress(ui, 40, "第二步：生成推荐信报告...")
+
+    # 素材表和写作需求为必需内容；超出模型上下文预算时先截断支持文件分析，仍放不下则直接报错
+    rl_prompt, truncated = assemble_prompt(
+        inputs["rl_assistant_model"],
+        f"""人物设定：{inputs["persona"]}
+\n任务描述：{inputs["task"]}
+\n输出格式：{inputs["output_format"]}
+""",
+        [
+            Section("推荐信素材表", inputs["rl_content"], prefix="\n推荐信素材表内容：\n", suffix="\n",
+                    priority=PRIORITY_MATERIAL, required=True),
+            Section("支持文件分析", state["support_analysis"], prefix="\n支持文件分析：\n", suffix="\n",
+                    priority=PRIORITY_ANALYSIS),
+            Section("写作需求", inputs["writing_requirements"], prefix="\n写作需求：\n", suffix="\n",
+                    priority=PRIORITY_MATERIAL, required=True)
+        ]
+    )
+    if truncated and ui.get("on_prompt_truncated"):
+        ui["on_prompt_truncated"]("rl_assistant", truncated)
+
+    report = run_agent(
+        "rl_assistant",
+        inputs["rl_assistant_model"],
+        rl_prompt,
+        state["run_id"]
+    )
+    return {"report": report}
+
+
+# 步骤3: 根据报告生成正式推荐信（流水线在此节点前暂停，确认报告后继续执行）
+def letter_generator_node(state, config):
+    inputs = config["configurable"]["inputs"]
+    ui = config["configurable"]["ui"]
+    run_agent = config["configurable"]["run_agent"]
+
+    # 构建系统提示和用户提示
+    system_prompt = f"{inputs['letter_generator_persona']}\n\n{inputs['letter_generator_task']}\n\n{inputs['letter_generator_output_format']}"
+    user_prompt = f"根据以下报告生成正式的推荐信：\n\n{state['report']}"
+    full_prompt = f"{system_prompt}\n\n{user_prompt}"
+
+    letter = run_agent(
+        "letter_generator",
+        inputs["letter_generator_model"],
+        full_prompt,
+        inputs["master_run_id"],
+        stream_to=ui.get("letter_area")
+    )
+    return {"letter": letter}
+
+
+# 构建 support_analyst → rl_assistant → letter_generator 流水线，在生成正式推荐信前暂停
+# 每个阶段声明自己依赖的输入和上游结果，依赖未变化时复用上一次的输出
+def build_rl_graph():
+    return build_pipeline(
+        ChatState,
+        [
+            ("support_analyst", reuse_unchanged(
+                support_analyst_node, "support_analyst",
+                input_keys=["support_analyst_model", "support_analyst_persona", "support_analyst_task",
+                            "support_analyst_output_format", "rl_content", "support_files_content",
+                            "support_map_reduce", "support_chunk_chars"]
+            )),
+            ("rl_assistant", reuse_unchanged(
+                rl_assistant_node, "rl_assistant",
+                input_keys=["rl_assistant_model", "persona", "task", "output_format",
+                            "rl_content", "writing_requirements"],
+                state_keys=["support_analysis"]
+            )),
+            ("letter_generator", reuse_unchanged(
+                letter_generator_node, "letter_generator",
+                input_keys=["letter_generator_model", "letter_generator_persona",
+                            "letter_generator_task", "letter_generator_output_format"],
+                state_keys=["report"]
+            ))
+        ],
+        interrupt_before=["letter_generator"]
+    )
@@ -0,0 +1,128 @@
+"""按各模型最近的延迟和错误率选择模型，并在失败时依次改用后备模型。
+
+ModelRouter 在进程内记录每个模型最近若干次调用的用时和成败（滚动窗口），
+由此得到 p50/p95 延迟和错误率。候选顺序为所选模型加上配置的后备链；错误率过高或
+p95 超过上限的模型被移到链尾，仍然作为最后的选择。hedge_after 设置后，非流式调用超过
+该时间（秒，或 "p95" 表示该模型当前的 p95）仍未返回时，向下一个候选模型再发一份相同请求，
+采用先返回的结果。
+"""
+import threading
+import time
+from collections import deque
+
+STATS_WINDOW_CALLS = 200
+STATS_WINDOW_SECONDS = 15 * 60
+MIN_SAMPLES = 5
+DEFAULT_MAX_ERROR_RATE = 0.5
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class ModelStats:
+    """单个模型的滚动统计：最近 STATS_WINDOW_CALLS 次且不早于 STATS_WINDOW_SECONDS 秒前的调用"""
+
+    def __init__(self):
+        self._calls = deque(maxlen=STATS_WINDOW_CALLS)
+
+    def record(self, latency, ok):
+        self._calls.append((time.monotonic(), latency, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - STATS_WINDOW_SECONDS
+        return [call for call in self._calls if call[0] >= cutoff]
+
+    def snapshot(self):
+        calls = self._recent()
+        latencies = [latency for _, latency, ok in calls if ok]
+        errors = sum(1 for _, _, ok in calls if not ok)
+        return {
+            "calls": len(calls),
+            "errors": errors,
+            "error_rate": errors / len(calls) if calls else 0.0,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+        }
+
+
+class ModelRouter:
+    def __init__(self, fallbacks=None, max_error_rate=DEFAULT_MAX_ERROR_RATE, max_p95=None, hedge_after=None,
+                 attempt_timeout=None):
+        # fallbacks: {模型: [后备模型, ...]}，键 "*" 为未单独配置的模型的后备链
+        self.fallbacks = {model: list(chain) for model, chain in (fallbacks or {}).items()}
+        self.max_error_rate = float(max_error_rate)
+        self.max_p95 = float(max_p95) if max_p95 else None
+        self.hedge_after = hedge_after
+        self.attempt_timeout = float(attempt_timeout) if attempt_timeout else None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def settings(self):
+        return (self.fallbacks, self.max_error_rate, self.max_p95, self.hedge_after, self.attempt_timeout)
+
+    def record(self, model, latency, ok):
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelStats()
+            stats.record(latency, ok)
+
+    def snapshot(self, model=None):
+        """返回 {模型: 统计}；指定 model 时只返回该模型的统计"""
+        with self._lock:
+            if model is not None:
+                stats = self._stats.get(model)
+                return stats.snapshot() if stats else ModelStats().snapshot()
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def healthy(self, model):
+        stats = self.snapshot(model)
+        if stats["calls"] < MIN_SAMPLES:
+            return True
+        if stats["error_rate"] > self.max_error_rate:
+            return False
+        return not (self.max_p95 and stats["p95"] is not None and stats["p95"] > self.max_p95)
+
+    def candidates(self, model):
+        """本次调用依次尝试的模型：所选模型加后备链（去重），不健康的模型排到最后"""
+        chain = [model] + self.fallbacks.get(model, self.fallbacks.get("*", []))
+        ordered = list(dict.fromkeys(m for m in chain if m))
+        return [m for m in ordered if self.healthy(m)] + [m for m in ordered if not self.healthy(m)]
+
+    def hedge_delay(self, model):
+        """返回发送对冲请求前等待的秒数；未开启或统计不足时返回 None"""
+        if not self.hedge_after:
+            return None
+        if str(self.hedge_after).lower() == "p95":
+            stats = self.snapshot(model)
+            return stats["p95"] if stats["calls"] >= MIN_SAMPLES else None
+        return float(self.hedge_after)
+
+
+def format_model_stats(model, stats):
+    """将单个模型的统计格式化为界面展示文本"""
+    def seconds(value):
+        return "-" if value is None else f"{value:.1f} 秒"
+
+    return (f"{model}: 最近 {stats['calls']} 次调用，错误率 {stats['error_rate']:.0%}，"
+            f"p50 {seconds(stats['p50'])}，p95 {seconds(stats['p95'])}")
+
+
+def get_router(fallbacks=None, max_error_rate=DEFAULT_MAX_ERROR_RATE, max_p95=None, hedge_after=None,
+               attempt_timeout=None):
+    """返回进程内共享的 ModelRouter；配置变化时换用新的配置，保留已有的统计"""
+    global _router
+    router = ModelRouter(fallbacks, max_error_rate, max_p95, hedge_after, attempt_timeout)
+    with _router_lock:
+        if _router is None or _router.settings() != router.settings():
+            if _router is not None:
+                router._stats, router._lock = _router._stats, _router._lock
+            _router = router
+        return _router
@@ -0,0 +1,250 @@
+"""进程内共享的模型调用限流与排队。
+
+每个模型和每个 API Key 各有一个令牌桶（每分钟速率 + 突发上限），一次调用要同时从两个桶各取一个令牌。
+额度不足时调用进入等待队列而不是直接失败：队列按会话分组轮转，每个会话每轮放行一个请求，
+某个会话一次提交的大量分块调用不会挤占其他顾问的请求。排队位置通过回调通知调用方显示在进度区域。
+
+令牌桶默认保存在进程内；配置 coordinator 为 SQLite 文件路径时保存在该文件中，
+同一台机器上的多个工作进程共用一份额度（排队的公平性仍只在各进程内部保证）。
+调度在后台事件循环中进行，acquire() 只能在该事件循环中调用。
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _key_digest(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class LocalBuckets:
+    """进程内的令牌桶"""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def try_take(self, specs):
+        """specs 为 [(桶名, 每秒令牌数, 容量), ...]。全部桶都有令牌时各取一个并返回 0，
+        否则不取任何令牌，返回最早可以取到的等待秒数"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in specs:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            wait = max([(1 - level) / rate for level, (_, rate, _) in zip(levels, specs) if level < 1], default=0)
+            if wait > 0:
+                return wait
+            for level, (key, _, _) in zip(levels, specs):
+                self._buckets[key] = (level - 1, now)
+            return 0
+
+
+class SqliteBuckets:
+    """保存在 SQLite 文件中的令牌桶，供同一台机器上的多个进程共享额度"""
+
+    blocking = True
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        self._lock = threading.Lock()
+
+    def try_take(self, specs):
+        # 多个进程共享，使用墙上时间；BEGIN IMMEDIATE 保证读取和扣减在同一个写事务中完成
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                for key, rate, burst in specs:
+                    row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens, updated = row if row else (burst, now)
+                    levels.append(min(burst, tokens + max(0.0, now - updated) * rate))
+                wait = max([(1 - level) / rate for level, (_, rate, _) in zip(levels, specs) if level < 1], default=0)
+                if wait == 0:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(key, level - 1, now) for level, (key, _, _) in zip(levels, specs)]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class _Waiter:
+    def __init__(self, specs, future, on_position):
+        self.specs = specs
+        self.future = future
+        self.on_position = on_position
+        self.position = None
+
+
+class RequestScheduler:
+    """按模型和 API Key 限流，额度不足时按会话轮转排队。
+
+    per_key / per_model 为每分钟调用次数（None 表示不限），model_rates 可按模型名单独设置，
+    burst 为令牌桶容量（允许的瞬时突发调用数）。
+    """
+
+    def __init__(self, per_key=None, per_model=None, model_rates=None, burst=None, coordinator=None):
+        self.per_key = float(per_key) if per_key else None
+        self.per_model = float(per_model) if per_model else None
+        self.model_rates = {model: float(rate) for model, rate in (model_rates or {}).items()}
+        self.burst = float(burst) if burst else None
+        self.coordinator = coordinator or None
+        self._buckets = None
+        # 会话 -> 等待中的请求；刚被放行的会话移到末尾，实现轮转
+        self._queues = OrderedDict()
+        self._wakeup = None
+        self._dispatcher = None
+        self.stats_counters = {"granted": 0, "queued": 0, "max_wait": 0.0}
+
+    def settings(self):
+        return (self.per_key, self.per_model, self.model_rates, self.burst, self.coordinator)
+
+    @property
+    def buckets(self):
+        # 首次使用时才打开 SQLite 文件，Streamlit 重跑时重复构造调度器不会产生额外连接
+        if self._buckets is None:
+            self._buckets = SqliteBuckets(self.coordinator) if self.coordinator else LocalBuckets()
+        return self._buckets
+
+    def _spec(self, key, per_minute):
+        rate = per_minute / 60.0
+        return (key, rate, self.burst or max(1.0, per_minute / 10))
+
+    def specs(self, model, api_key):
+        specs = []
+        if self.per_key:
+            specs.append(self._spec(f"key:{_key_digest(api_key)}", self.per_key))
+        model_rate = self.model_rates.get(model, self.per_model)
+        if model_rate:
+            specs.append(self._spec(f"model:{model}", model_rate))
+        return specs
+
+    async def _try_take(self, specs):
+        if self.buckets.blocking:
+            return await asyncio.to_thread(self.buckets.try_take, specs)
+        return self.buckets.try_take(specs)
+
+    async def acquire(self, model, api_key, session, on_position=None):
+        """等待本次调用的额度，返回排队用时（秒）。排队时 on_position(位置) 在位置变化时回调，
+        放行时回调 on_position(0)"""
+        specs = self.specs(model, api_key)
+        if not specs:
+            return 0.0
+        # 没有人排队且额度充足时直接放行
+        if not self._queues and await self._try_take(specs) == 0:
+            self.stats_counters["granted"] += 1
+            return 0.0
+
+        start = time.monotonic()
+        waiter = _Waiter(specs, asyncio.get_running_loop().create_future(), on_position)
+        self._queues.setdefault(session, deque()).append(waiter)
+        self.stats_counters["queued"] += 1
+        self._notify_positions()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        self._wakeup.set()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._remove(session, waiter)
+            raise
+        waited = time.monotonic() - start
+        self.stats_counters["max_wait"] = max(self.stats_counters["max_wait"], waited)
+        if on_position:
+            on_position(0)
+        return waited
+
+    def _remove(self, session, waiter):
+        queue = self._queues.get(session)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[session]
+            self._notify_positions()
+
+    def _grant(self, session, waiter):
+        # 取令牌期间请求可能已被取消，此时令牌作废
+        queue = self._queues.get(session)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+            self.stats_counters["granted"] += 1
+        self._notify_positions()
+
+    def _notify_positions(self):
+        """按轮转顺序计算每个等待请求前面的请求数，位置变化时回调"""
+        sessions = list(self._queues.values())
+        for i, queue in enumerate(sessions):
+            for depth, waiter in enumerate(queue):
+                ahead = depth + sum(min(len(other), depth + (1 if j < i else 0))
+                                    for j, other in enumerate(sessions) if j != i)
+                if waiter.position != ahead + 1:
+                    waiter.position = ahead + 1
+                    if waiter.on_position:
+                        waiter.on_position(waiter.position)
+
+    async def _dispatch(self):
+        while self._queues:
+            self._wakeup.clear()
+            wait = None
+            for session, queue in list(self._queues.items()):
+                waiter = queue[0]
+                if waiter.future.done():
+                    self._remove(session, waiter)
+                    wait = 0
+                    break
+                needed = await self._try_take(waiter.specs)
+                if needed == 0:
+                    self._grant(session, waiter)
+                    wait = 0
+                    break
+                wait = needed if wait is None else min(wait, needed)
+            if wait:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats(self):
+        return {
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "sessions": len(self._queues),
+            "per_key": self.per_key,
+            "per_model": self.per_model,
+            "shared": bool(self.coordinator),
+            **self.stats_counters,
+        }
+
+
+def get_scheduler(per_key=None, per_model=None, model_rates=None, burst=None, coordinator=None):
+    """返回进程内共享的 RequestScheduler；设置变化时重建（已在排队的请求仍由旧调度器放行）"""
+    global _scheduler
+    scheduler = RequestScheduler(per_key, per_model, model_rates, burst, coordinator)
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.settings() != scheduler.settings():
+            _scheduler = scheduler
+        return _scheduler
@@ -0,0 +1,82 @@
+"""LLM 流式输出，并分别统计首个 token 用时和总用时。"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class StreamResult:
+    content: str
+    time_to_first_token: Optional[float]
+    total_time: float
+    # 服务端返回的 usage（{"input_tokens", "output_tokens", ...}），未返回时为 None
+    usage: Optional[dict] = None
+
+
+def stream_chat(llm, messages, on_text=None, min_interval=0.05):
+    """调用 llm.stream() 逐块接收输出。
+
+    各片段先收集在列表中，结束时一次拼接；on_text(已生成的全部文本) 最多每 min_interval 秒回调一次，避免频繁刷新界面；
+    推理模型的思考过程不计入首个 token，只统计第一个正文片段到达的时间。
+    """
+    start = time.perf_counter()
+    first_token_time = None
+    last_push = 0.0
+    parts = []
+    usage = None
+    for chunk in llm.stream(messages):
+        if getattr(chunk, "usage_metadata", None):
+            usage = dict(chunk.usage_metadata)
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        if not text:
+            continue
+        now = time.perf_counter()
+        if first_token_time is None:
+            first_token_time = now - start
+        parts.append(text)
+        if on_text and now - last_push >= min_interval:
+            on_text("".join(parts))
+            last_push = now
+    return StreamResult("".join(parts), first_token_time, time.perf_counter() - start, usage)
+
+
+async def astream_chat(llm, messages, on_text=None, min_interval=0.05):
+    """stream_chat 的异步版本，使用 llm.astream()"""
+    start = time.perf_counter()
+    first_token_time = None
+    last_push = 0.0
+    parts = []
+    usage = None
+    async for chunk in llm.astream(messages):
+        if getattr(chunk, "usage_metadata", None):
+            usage = dict(chunk.usage_metadata)
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        if not text:
+            continue
+        now = time.perf_counter()
+        if first_token_time is None:
+            first_token_time = now - start
+        parts.append(text)
+        if on_text and now - last_push >= min_interval:
+            on_text("".join(parts))
+            last_push = now
+    return StreamResult("".join(parts), first_token_time, time.perf_counter() - start, usage)
+
+
+def format_timing(timing):
+    """将 {"ttft": 秒, "total": 秒} 格式化为界面展示文本"""
+    if not timing:
+        return ""
+    if timing.get("cached"):
+        return f"命中响应缓存，用时 {timing['total']:.2f} 秒"
+    if timing.get("ttft") is None:
+        text = f"总用时 {timing['total']:.1f} 秒"
+    else:
+        text = f"首个token用时 {timing['ttft']:.1f} 秒，总用时 {timing['total']:.1f} 秒"
+    if timing.get("queued", 0) >= 1:
+        text += f"（排队等待 {timing['queued']:.0f} 秒）"
+    if timing.get("retries"):
+        text += f"（重试 {timing['retries']} 次）"
+    if timing.get("fallback"):
+        text += f"（已改用后备模型 {timing['model']}）"
+    return text
@@ -0,0 +1,226 @@
+"""LangSmith 客户端初始化与后台批量上报运行记录。
+
+客户端和项目检查在进程内缓存，Streamlit 每次重跑脚本时不再重复请求 LangSmith。
+运行开始/结束事件放入有界内存队列，由后台线程批量发送，不再阻塞 LLM 调用链路。
+队列已满时直接丢弃事件并计数；LangSmith 变慢或不可用只影响监控数据，不影响生成速度。
+"""
+import atexit
+import hashlib
+import queue
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_MAX_QUEUE = 1000
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+
+class BackgroundTracer:
+    def __init__(self, client, project_name, max_queue=DEFAULT_MAX_QUEUE,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.client = client
+        self.project_name = project_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "sent": 0, "dropped": 0, "failed": 0}
+        self.last_error = None
+        self._thread = threading.Thread(target=self._worker, name="langsmith-tracer", daemon=True)
+        self._thread.start()
+
+    def start_run(self, run_id, name, run_type, inputs, parent_run_id=None, extra=None):
+        payload = {
+            "name": name,
+            "run_type": run_type,
+            "inputs": inputs,
+            "run_id": run_id,
+            "start_time": datetime.now(),
+        }
+        if parent_run_id:
+            payload["parent_run_id"] = parent_run_id
+        if extra:
+            payload["extra"] = extra
+        self._put(("create", payload))
+
+    def end_run(self, run_id, outputs=None, error=None):
+        payload = {"run_id": run_id, "end_time": datetime.now()}
+        if outputs is not None:
+            payload["outputs"] = outputs
+        if error is not None:
+            payload["error"] = error
+        self._put(("update", payload))
+
+    def flush(self, timeout=5.0):
+        """等待队列中的事件发送完毕，返回是否在超时前完成"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            self._count("enqueued")
+        except queue.Full:
+            self._count("dropped")
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, batch):
+        # 同一批次内的开始/结束事件合并为一次 create_run，减少一次网络往返
+        operations = []
+        pending_creates = {}
+        for kind, payload in batch:
+            if kind == "update" and payload["run_id"] in pending_creates:
+                merged = dict(payload)
+                merged.pop("run_id")
+                pending_creates[payload["run_id"]].update(merged)
+                continue
+            operations.append((kind, payload))
+            if kind == "create":
+                pending_creates[payload["run_id"]] = payload
+
+        for kind, payload in operations:
+            try:
+                if kind == "create":
+                    self.client.create_run(project_name=self.project_name, **payload)
+                else:
+                    self.client.update_run(**payload)
+                self._count("sent")
+            except Exception as e:
+                self.last_error = str(e)
+                self._count("failed")
+
+
+_tracers = {}
+_clients = {}
+_projects = {}
+_recent_runs = {}
+_tracers_lock = threading.Lock()
+_projects_lock = threading.Lock()
+
+# 项目检查失败后的重试间隔（秒），避免 LangSmith 不可用时每次重跑都发起请求
+PROJECT_RETRY_INTERVAL = 60
+
+
+def _key_digest(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_langsmith_client(api_key):
+    """获取进程级共享的 LangSmith 客户端"""
+    key = _key_digest(api_key)
+    with _tracers_lock:
+        client = _clients.get(key)
+        if client is None:
+            from langsmith import Client
+
+            client = Client(api_key=api_key)
+            _clients[key] = client
+        return client
+
+
+def ensure_project(api_key, project_name, ttl=3600):
+    """确认项目存在（不存在则创建），结果在进程内缓存 ttl 秒。
+
+    只读取目标项目本身，不再分页列出组织下的全部项目。返回错误信息，成功时为 None。
+    """
+    key = (_key_digest(api_key), project_name)
+    with _projects_lock:
+        cached = _projects.get(key)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+
+        client = get_langsmith_client(api_key)
+        error = None
+        try:
+            try:
+                client.read_project(project_name=project_name)
+            except Exception as read_error:
+                not_found = type(read_error).__name__ == "LangSmithNotFoundError" or "not found" in str(read_error).lower()
+                if not not_found:
+                    raise
+                try:
+                    client.create_project(project_name)
+                except Exception as create_error:
+                    # 如果是409冲突（项目已存在，可能由其他进程刚刚创建），忽略这个错误
+                    message = str(create_error)
+                    if not ("409" in message or "Conflict" in message or "already exists" in message):
+                        raise
+        except Exception as e:
+            error = str(e)
+
+        expires = time.monotonic() + (ttl if error is None else PROJECT_RETRY_INTERVAL)
+        _projects[key] = (expires, error)
+        return error
+
+
+def init_langsmith(api_key, project_name, ttl=3600):
+    """一次性初始化 LangSmith：返回 (客户端, 错误信息)，重复调用只命中进程内缓存"""
+    if not api_key:
+        return None, None
+    try:
+        client = get_langsmith_client(api_key)
+    except Exception as e:
+        return None, str(e)
+    return client, ensure_project(api_key, project_name, ttl=ttl)
+
+
+def recent_runs(api_key, project_name, limit=5, ttl=30):
+    """获取最近的运行记录，结果缓存 ttl 秒，避免系统状态页每次重跑都请求 LangSmith"""
+    key = (_key_digest(api_key), project_name, limit)
+    with _projects_lock:
+        cached = _recent_runs.get(key)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+    runs = list(get_langsmith_client(api_key).list_runs(project_name=project_name, limit=limit))
+    with _projects_lock:
+        _recent_runs[key] = (time.monotonic() + ttl, runs)
+    return runs
+
+
+def get_tracer(api_key, project_name):
+    """获取进程级共享的后台追踪器；未配置 api_key 时返回 None"""
+    if not api_key:
+        return None
+    client = get_langsmith_client(api_key)
+    key = (_key_digest(api_key), project_name)
+    with _tracers_lock:
+        tracer = _tracers.get(key)
+        if tracer is None:
+            tracer = BackgroundTracer(client, project_name)
+            _tracers[key] = tracer
+        return tracer
+
+
+@atexit.register
+def _flush_all():
+    for tracer in list(_tracers.values()):
+        tracer.flush(timeout=2.0)